@@ -0,0 +1,47 @@
+from src import route, route_anytime, route_intersection_based
+from src.route_io import labels_as_arrays
+
+ENGINES = {
+    "grid": route.Solution,
+    "intersection": route_intersection_based.Solution,
+    "anytime": route_anytime.Solution,
+}
+
+
+def label_routes(routes, engine="grid", zoom_level=1, **parameters):
+    """Label routes in memory, without reading or writing files
+
+    Every call builds its own solution and shares no state with other
+    calls, so it can run concurrently in a thread pool. The routes are
+    only read, a RouteSet just caches its segments.
+
+    Args:
+        routes: RouteSet, or a list of routes each as [[x1, y1], ...]
+        engine (str): "grid", "intersection" or "anytime"
+        zoom_level (int): Labels are scaled by this, as with --zoom-levels
+        parameters: Label size at zoom level 1, label_width and label_height
+            for the grid and anytime engines, width, height and tolerance
+            for the intersection engine, simplify_tolerance to simplify
+            routes first, and settings of the engine, such as
+            max_candidates, time_budget or occupancy_backend
+
+    Returns:
+        x, y, codes: Label point of every route and uint8 codes of the
+            positions, see route_io.POSITIONS
+    """
+    solution_class = ENGINES[engine]
+    arguments = {
+        name: parameters.pop(name)
+        for name in solution_class.size_parameters + ("simplify_tolerance",)
+        if name in parameters
+    }
+
+    solution = solution_class(routes, **arguments)
+    if zoom_level != 1:
+        solution = solution.for_zoom_level(zoom_level)
+    for name, value in parameters.items():
+        if not hasattr(solution, name):
+            raise TypeError(f"Unknown parameter {name} for the {engine} engine")
+        setattr(solution, name, value)
+
+    return labels_as_arrays(solution.get_label_locations())
@@ -0,0 +1,210 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.api import ENGINES
+from src.route_io import BINARY_EXTENSION, read_routes
+from src.route_set import RouteSet
+
+# Labels of routes.txt are written next to it as routes_labels.txt
+OUTPUT_SUFFIX = "_labels"
+
+
+def output_path_for(routes_path):
+    root, extension = os.path.splitext(routes_path)
+    return f"{root}{OUTPUT_SUFFIX}{extension}"
+
+
+def _is_output(path):
+    root, _ = os.path.splitext(os.path.basename(path))
+    return root.endswith(OUTPUT_SUFFIX) or f"{OUTPUT_SUFFIX}_zoom" in root
+
+
+def _read_manifest(path):
+    """Jobs of a manifest, one routes path and optionally an output path per line
+
+    Relative paths are relative to the manifest, empty lines and lines
+    starting with # are skipped.
+    """
+    directory = os.path.dirname(path)
+    jobs = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            paths = [os.path.join(directory, p) for p in line.split()]
+            jobs.append((paths[0], paths[1] if len(paths) > 1 else None))
+
+    return jobs
+
+
+def collect_jobs(sources):
+    """Expand inputs into (routes path, output path) jobs
+
+    A source is a routes file, a directory whose .txt and .bin files are
+    all routes, a glob pattern, or @manifest for a manifest file. Outputs
+    default to output_path_for the routes path, and files that look like
+    outputs are skipped when expanding directories and globs.
+    """
+    jobs = []
+    for source in sources:
+        if source.startswith("@"):
+            jobs.extend(_read_manifest(source[1:]))
+            continue
+
+        if os.path.isdir(source):
+            paths = sorted(
+                glob.glob(os.path.join(source, "*.txt"))
+                + glob.glob(os.path.join(source, f"*{BINARY_EXTENSION}"))
+            )
+        elif glob.has_magic(source):
+            paths = sorted(glob.glob(source, recursive=True))
+        else:
+            paths = [source]
+        jobs.extend((path, None) for path in paths if not _is_output(path))
+
+    return [
+        (routes_path, output_path or output_path_for(routes_path))
+        for routes_path, output_path in jobs
+    ]
+
+
+def label_file(engine, routes_path, output_path, zoom_levels=None, parameters=None):
+    """Label one routes file, runs in a worker process
+
+    Returns:
+        num_routes: Number of routes labeled
+    """
+    routes = RouteSet(*read_routes(routes_path))
+    solution = ENGINES[engine](routes)
+    for name, value in (parameters or {}).items():
+        setattr(solution, name, value)
+
+    if zoom_levels:
+        solution.write_zoom_label_locations(output_path, zoom_levels)
+    else:
+        solution.write_label_locations(output_path)
+
+    return len(routes)
+
+
+def run_batch(
+    engine, jobs, zoom_levels=None, parameters=None, processes=None, max_pending=None
+):
+    """Label many routes files in a process pool
+
+    Each worker holds one file at a time, and at most max_pending files
+    are submitted at once, so memory is bounded by the largest files and
+    not by the number of files. Failures are reported and do not stop
+    the batch.
+
+    Returns:
+        summary: Dict with counts of files, failures and routes and the
+            elapsed time
+    """
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or 2 * processes
+    summary = {"files": 0, "failed": 0, "routes": 0}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = {}
+        jobs = iter(jobs)
+        while True:
+            for routes_path, output_path in jobs:
+                future = executor.submit(
+                    label_file,
+                    engine,
+                    routes_path,
+                    output_path,
+                    zoom_levels,
+                    parameters,
+                )
+                pending[future] = routes_path
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                routes_path = pending.pop(future)
+                summary["files"] += 1
+                try:
+                    summary["routes"] += future.result()
+                except Exception as error:
+                    summary["failed"] += 1
+                    print(
+                        f"Failed {routes_path}: {type(error).__name__}: {error}",
+                        file=sys.stderr,
+                    )
+
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "sources",
+        type=str,
+        nargs="+",
+        help="Routes files, directories, glob patterns or @manifest files",
+    )
+    parser.add_argument("--engine", choices=list(ENGINES), default="grid")
+    parser.add_argument(
+        "--zoom-levels",
+        type=int,
+        nargs="+",
+        help="Write one labels file per zoom level instead of a single one",
+    )
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        help="Route points tried per label, for the intersection engine",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds per file and zoom level, for the anytime engine",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes, all cores by default",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        help="Files submitted to the workers at a time, twice the processes by default",
+    )
+    args = parser.parse_args()
+
+    parameters = {}
+    if args.max_candidates is not None:
+        parameters["max_candidates"] = args.max_candidates
+    if args.time_budget is not None:
+        parameters["time_budget"] = args.time_budget
+
+    summary = run_batch(
+        args.engine,
+        collect_jobs(args.sources),
+        args.zoom_levels,
+        parameters,
+        args.processes,
+        args.max_pending,
+    )
+
+    seconds = max(summary["seconds"], 1e-9)
+    print(
+        f"{summary['files']} files, {summary['failed']} failed, "
+        f"{summary['routes']} routes in {summary['seconds']:.2f}s, "
+        f"{summary['files'] / seconds:.1f} files/s, "
+        f"{summary['routes'] / seconds:.0f} routes/s"
+    )
+    if summary["failed"]:
+        raise SystemExit(1)
@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src import route, route_intersection_based
+from src.route_io import parse_routes_array, write_labels, write_routes_text
+from src.route_set import RouteSet
+
+
+def random_walk_routes(num_routes, route_length, seed=0, step=60):
+    """Routes that wander with random steps, spread with constant density"""
+    rng = np.random.default_rng(seed)
+    extent = 2000 * np.sqrt(num_routes)
+
+    starts = rng.uniform(0, extent, size=(num_routes, 1, 2))
+    steps = rng.integers(-step, step + 1, size=(num_routes, route_length - 1, 2))
+    routes = np.concatenate([starts, starts + np.cumsum(steps, axis=1)], axis=1)
+
+    return _to_route_set(routes)
+
+
+def urban_grid_routes(num_routes, route_length, seed=0, block=200):
+    """Dense routes along the streets of a regular city grid
+
+    Routes only turn at street crossings, so segments are long and
+    axis parallel, and many routes share the same streets.
+    """
+    rng = np.random.default_rng(seed)
+    num_blocks = int(4 * np.sqrt(num_routes)) + 1
+
+    directions = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
+    starts = rng.integers(0, num_blocks, size=(num_routes, 1, 2))
+    moves = directions[rng.integers(0, 4, size=(num_routes, route_length - 1))]
+    moves *= rng.integers(1, 4, size=(num_routes, route_length - 1, 1))
+    routes = np.concatenate([starts, starts + np.cumsum(moves, axis=1)], axis=1)
+
+    return _to_route_set(routes * block)
+
+
+def intercity_routes(num_routes, route_length, seed=0, num_cities=12):
+    """Long routes between a few cities, with some jitter along the way"""
+    rng = np.random.default_rng(seed)
+    extent = 20000 * np.sqrt(num_routes)
+    cities = rng.uniform(0, extent, size=(num_cities, 2))
+
+    ends = rng.integers(0, num_cities, size=(num_routes, 2))
+    t = np.linspace(0, 1, route_length)[None, :, None]
+    routes = cities[ends[:, :1]] * (1 - t) + cities[ends[:, 1:]] * t
+    routes += rng.normal(0, 100, size=routes.shape)
+
+    return _to_route_set(routes)
+
+
+def _to_route_set(routes):
+    routes = np.rint(routes).astype(np.int64)
+    # Shifted so that coordinates start at 0
+    routes -= routes.reshape(-1, 2).min(axis=0)
+    num_routes, route_length, _ = routes.shape
+
+    return RouteSet(routes.reshape(-1, 2), np.arange(num_routes + 1) * route_length)
+
+
+GENERATORS = {
+    "random_walk": random_walk_routes,
+    "urban_grid": urban_grid_routes,
+    "intercity": intercity_routes,
+}
+
+
+class PhaseTimer:
+    """Wall time of consecutive named phases"""
+
+    def __init__(self):
+        self.phases = {}
+
+    def time(self, phase, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.phases[phase] = time.perf_counter() - start
+
+        return result
+
+
+def time_grid_engine(routes_path, output_path):
+    timer = PhaseTimer()
+    routes = timer.time("parse", lambda: RouteSet(*parse_routes_array(routes_path)))
+    sol = timer.time("init", route.Solution, routes)
+    occupancy = timer.time("occupancy", sol._get_route_occupancy)
+    label_dict = timer.time(
+        "placement",
+        sol._get_label_locations,
+        sol.routes,
+        sol.closest_indices,
+        occupancy,
+    )
+    timer.time("write", write_labels, output_path, label_dict)
+
+    return timer.phases
+
+
+def time_intersection_engine(routes_path, output_path):
+    timer = PhaseTimer()
+    routes = timer.time("parse", lambda: RouteSet(*parse_routes_array(routes_path)))
+    sol = timer.time("init", route_intersection_based.Solution, routes)
+    label_dict = timer.time("placement", sol.get_label_locations)
+    timer.time("write", write_labels, output_path, label_dict)
+
+    return timer.phases
+
+
+ENGINES = {
+    "grid": time_grid_engine,
+    "intersection": time_intersection_engine,
+}
+
+
+def run_benchmarks(engines, generators, route_counts, route_lengths, seed=0):
+    """Time every engine on every generated route set
+
+    Returns:
+        results: List of dicts with the case and the wall time per phase,
+            or the error if the engine failed
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        routes_path = os.path.join(directory, "routes.txt")
+        output_path = os.path.join(directory, "labels.txt")
+        for generator in generators:
+            for num_routes in route_counts:
+                for route_length in route_lengths:
+                    routes = GENERATORS[generator](num_routes, route_length, seed)
+                    write_routes_text(routes_path, routes.coords, routes.offsets)
+                    for engine in engines:
+                        case = {
+                            "engine": engine,
+                            "generator": generator,
+                            "num_routes": num_routes,
+                            "route_length": route_length,
+                        }
+                        try:
+                            case["phases"] = ENGINES[engine](routes_path, output_path)
+                            case["total"] = sum(case["phases"].values())
+                        except Exception as error:
+                            case["error"] = f"{type(error).__name__}: {error}"
+                        results.append(case)
+                        print_case(case)
+
+    return results
+
+
+def print_case(case):
+    name = (
+        f"{case['engine']:<13}{case['generator']:<13}"
+        f"{case['num_routes']:>8}{case['route_length']:>8}"
+    )
+    if "error" in case:
+        print(f"{name}  failed: {case['error']}")
+    else:
+        phases = "  ".join(f"{k} {v:.3f}" for k, v in case["phases"].items())
+        print(f"{name}  total {case['total']:.3f}s  {phases}")
+
+
+def scaling_exponents(results):
+    """Empirical exponent of total time against number of routes
+
+    Between consecutive route counts with the same engine, generator and
+    route length, time ~ num_routes ** exponent. An exponent near 1 means
+    linear scaling.
+    """
+    curves = {}
+    for case in results:
+        if "error" in case:
+            continue
+        key = (case["engine"], case["generator"], case["route_length"])
+        curves.setdefault(key, []).append((case["num_routes"], case["total"]))
+
+    exponents = {}
+    for key, points in curves.items():
+        points.sort()
+        exponents[key] = [
+            np.log(t2 / t1) / np.log(n2 / n1)
+            for (n1, t1), (n2, t2) in zip(points[:-1], points[1:])
+            if t1 > 0 and t2 > 0
+        ]
+
+    return exponents
+
+
+def compare_to_baseline(results, baseline, max_slowdown):
+    """Cases that got slower than max_slowdown times the baseline"""
+
+    def key(case):
+        return (
+            case["engine"],
+            case["generator"],
+            case["num_routes"],
+            case["route_length"],
+        )
+
+    baseline_totals = {key(case): case["total"] for case in baseline if "total" in case}
+    regressions = []
+    for case in results:
+        reference = baseline_totals.get(key(case))
+        if reference is None:
+            continue
+        if "error" in case or case["total"] > max_slowdown * reference:
+            regressions.append(case)
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument("--generators", nargs="+", default=list(GENERATORS))
+    parser.add_argument("--route-counts", type=int, nargs="+", default=[100, 400, 1600])
+    parser.add_argument("--route-lengths", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, help="Write results as JSON")
+    parser.add_argument("--baseline", type=str, help="JSON results to compare with")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.5,
+        help="Fail if a case is this many times slower than the baseline",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.engines, args.generators, args.route_counts, args.route_lengths, args.seed
+    )
+
+    print("\nScaling exponent of total time with the number of routes")
+    for (engine, generator, route_length), exponents in scaling_exponents(
+        results
+    ).items():
+        if not exponents:
+            continue
+        formatted = " ".join(f"{exponent:.2f}" for exponent in exponents)
+        print(f"{engine:<13}{generator:<13}{route_length:>8}  {formatted}")
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+    failed = [case for case in results if "error" in case]
+    if args.baseline:
+        with open(args.baseline) as fp:
+            regressions = compare_to_baseline(results, json.load(fp), args.max_slowdown)
+        for case in regressions:
+            print(f"Regression: {case}")
+        failed += [case for case in regressions if "error" not in case]
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,91 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Modules run for labeling, they should start fast
+ENTRY_POINTS = [
+    "src.route",
+    "src.route_intersection_based",
+    "src.route_anytime",
+    "src.server",
+    "src.batch",
+    "src.validate",
+]
+# Modules that labeling does not need and that are slow to import
+HEAVY_MODULES = ["matplotlib"]
+# Entry points are imported as src.* from the repository root
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def startup_time(module, repeat=5):
+    """Best wall time of a fresh interpreter importing a module
+
+    Returns:
+        seconds, heavy_modules: Best time of repeat runs and the heavy
+            modules that the import pulled in
+    """
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=REPOSITORY,
+        )
+        best = min(best, time.perf_counter() - start)
+
+    return best, result.stdout.split()
+
+
+def slowest_imports(module, count=5):
+    """Imports with the largest cumulative time, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=REPOSITORY,
+    )
+    imports = []
+    for line in result.stderr.splitlines()[1:]:
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, name = line.split("|")
+        imports.append((int(cumulative), name.strip()))
+
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.5,
+        help="Seconds an entry point may take to start, including the interpreter",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module in ENTRY_POINTS:
+        seconds, heavy_modules = startup_time(module, args.repeat)
+        print(f"{module:<32}{seconds:.3f}s")
+        if heavy_modules:
+            print(f"  imports {', '.join(heavy_modules)}")
+            failed = True
+        if seconds > args.budget:
+            print(f"  over the budget of {args.budget:.3f}s, slowest imports:")
+            for microseconds, name in slowest_imports(module):
+                print(f"  {microseconds / 1e6:.3f}s {name}")
+            failed = True
+
+    if failed:
+        raise SystemExit(1)
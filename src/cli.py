@@ -0,0 +1,79 @@
+import argparse
+
+from src.profiling import phase
+from src.route_io import read_routes
+from src.route_set import RouteSet
+
+
+def argument_parser():
+    """Parser of the arguments shared by the command lines of all engines"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("routes_path", type=str)
+    parser.add_argument("output_path", type=str)
+    parser.add_argument(
+        "--zoom-levels",
+        type=int,
+        nargs="+",
+        help="Write one labels file per zoom level instead of a single one",
+    )
+    parser.add_argument(
+        "--tiles",
+        type=int,
+        help="Label N x N tiles of the map in parallel worker processes",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes for --tiles, all cores by default",
+    )
+    parser.add_argument(
+        "--simplify",
+        type=float,
+        help="Simplify routes within this fraction of the label size first, eg. 0.1",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="-",
+        help="Write phase times, counts and peak memory as JSON, to stdout by default",
+    )
+
+    return parser
+
+
+def read_solution(solution_class, args, profiler):
+    """Solution of the routes file given on the command line"""
+    with phase(profiler, "parse"):
+        coords, offsets = read_routes(args.routes_path)
+
+    with phase(profiler, "init"):
+        return solution_class(
+            RouteSet(coords, offsets),
+            profiler=profiler,
+            simplify_tolerance=args.simplify,
+        )
+
+
+def write_labels(solution, args):
+    """Write the labels of the zoom levels given on the command line
+
+    Returns:
+        outputs: (zoom level, solution, written labels) of every zoom
+            level, only level 1 without --zoom-levels
+    """
+    if args.zoom_levels:
+        outputs = solution.zoom_solutions(args.output_path, args.zoom_levels)
+    else:
+        outputs = [(1, solution, args.output_path)]
+
+    return [
+        (
+            zoom_level,
+            zoom_solution,
+            zoom_solution.write_label_locations(
+                output_path, args.tiles, args.processes
+            ),
+        )
+        for zoom_level, zoom_solution, output_path in outputs
+    ]
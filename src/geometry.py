@@ -0,0 +1,117 @@
+import numpy as np
+
+
+def segments_cross_rectangles(starts, ends, left, top, right, bottom):
+    """Check if segments pass through the inside of rectangles
+
+    Segments are clipped against the open rectangle, as in Liang-Barsky,
+    so a coarse segment crossing a rectangle counts even if none of its
+    end points lies inside. Touching the border does not count.
+    All arguments broadcast, so one call can test every segment against
+    every rectangle, or a list of (segment, rectangle) pairs.
+
+    Args:
+        starts, ends: Arrays with x and y in the last axis
+        left, top, right, bottom: Rectangle sides
+
+    Returns:
+        crosses: Boolean array of the broadcast shape
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    delta = np.asarray(ends, dtype=np.float64) - starts
+    lower = np.zeros(np.broadcast(starts[..., 0], left).shape)
+    upper = np.ones(lower.shape)
+    inside = np.ones(lower.shape, dtype=bool)
+
+    for axis, low, high in ((0, left, right), (1, top, bottom)):
+        start, d = starts[..., axis], delta[..., axis]
+        moving = d != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_low = (low - start) / d
+            t_high = (high - start) / d
+        # Parameter interval in which the segment is between low and high
+        lower = np.where(moving, np.maximum(lower, np.minimum(t_low, t_high)), lower)
+        upper = np.where(moving, np.minimum(upper, np.maximum(t_low, t_high)), upper)
+        # A segment parallel to the sides has to be strictly between them
+        inside &= moving | ((start > low) & (start < high))
+
+    return inside & (lower < upper)
+
+
+def _grid_line_crossings(start_cell, end_cell, start, delta, cell_size):
+    """Parameters at which segments cross grid lines along one axis
+
+    Args:
+        start_cell (1D numpy.array): Cell index of each segment start
+        end_cell (1D numpy.array): Cell index of each segment end
+        start (1D numpy.array): Coordinate of each segment start
+        delta (1D numpy.array): Coordinate of each segment end minus start
+        cell_size (float): Size of a cell along this axis
+
+    Returns:
+        segment_ids, t: For every crossing the segment it belongs to
+            and the segment parameter in [0, 1] where it happens
+    """
+    num_crossings = np.abs(end_cell - start_cell)
+    segment_ids = np.repeat(np.arange(len(start_cell)), num_crossings)
+    # Running count 1..num_crossings inside each segment
+    first = np.cumsum(num_crossings) - num_crossings
+    k = np.arange(len(segment_ids)) - np.repeat(first, num_crossings) + 1
+
+    forward = delta[segment_ids] > 0
+    grid_line = start_cell[segment_ids] + np.where(forward, k, 1 - k)
+    t = (grid_line * cell_size - start[segment_ids]) / delta[segment_ids]
+
+    return segment_ids, t
+
+
+def cell_crossing_points(starts, ends, cell_width, cell_height):
+    """A point of every segment inside every grid cell it crosses, in one pass
+
+    This is a batched grid traversal over the grid of cells with corners
+    at multiples of the cell size. For each segment we find the parameters
+    at which it crosses vertical and horizontal grid lines. Between two
+    consecutive crossings the segment stays inside one cell, so the
+    midpoint of each such interval identifies a crossed cell. Work scales
+    with the number of crossed cells. A segment of zero length gives its
+    point.
+
+    Args:
+        starts (2D numpy.array): Start point of each segment
+        ends (2D numpy.array): End point of each segment
+        cell_width (float): Width of a grid cell
+        cell_height (float): Height of a grid cell
+
+    Returns:
+        segment_ids, points: For every crossed cell the segment and a point
+            of it inside the cell, which can lie on the border of the cell
+            only for segments running along a grid line
+    """
+    starts = np.asarray(starts, dtype=float)
+    delta = ends - starts
+
+    start_x, start_y = np.floor(starts / (cell_width, cell_height)).astype(int).T
+    end_x, end_y = np.floor(ends / (cell_width, cell_height)).astype(int).T
+    x_ids, x_t = _grid_line_crossings(
+        start_x, end_x, starts[:, 0], delta[:, 0], cell_width
+    )
+    y_ids, y_t = _grid_line_crossings(
+        start_y, end_y, starts[:, 1], delta[:, 1], cell_height
+    )
+
+    num_segments = len(starts)
+    segment_ids = np.concatenate(
+        [np.arange(num_segments), np.arange(num_segments), x_ids, y_ids]
+    )
+    t = np.concatenate([np.zeros(num_segments), np.ones(num_segments), x_t, y_t])
+
+    order = np.lexsort((t, segment_ids))
+    segment_ids, t = segment_ids[order], t[order]
+
+    # Zero length intervals come from passing exactly through a grid corner
+    # or from starting on a grid line. They do not enter any cell.
+    valid = (segment_ids[:-1] == segment_ids[1:]) & (t[1:] > t[:-1])
+    segment_ids = segment_ids[:-1][valid]
+    t_mid = 0.5 * (t[:-1][valid] + t[1:][valid])
+
+    return segment_ids, starts[segment_ids] + t_mid[:, None] * delta[segment_ids]
@@ -0,0 +1,42 @@
+import numpy as np
+
+from src.route_set import RouteSet
+
+
+class IncrementalRoutes:
+    """Route bookkeeping of the incremental solutions of both engines
+
+    Mixed into a solution, which has routes, closest_indices, bbox_center
+    and label_extent, keeps the ids of removed routes in removed_routes
+    and the current layout in label_dict.
+    """
+
+    def active_routes(self):
+        return [it for it in range(len(self.routes)) if it not in self.removed_routes]
+
+    def _store_route(self, route_id, route):
+        """Replace a route, or append it if route_id is the number of routes"""
+        self.routes = self.routes.with_route(route_id, route)
+        closest_index = RouteSet.from_routes([route]).closest_point_indices(
+            self.bbox_center
+        )
+        # Copy, the array may be shared with solutions at other zoom levels
+        self.closest_indices = np.append(self.closest_indices, closest_index)
+        if route_id < len(self.routes) - 1:
+            self.closest_indices[route_id] = self.closest_indices[-1]
+            self.closest_indices = self.closest_indices[:-1]
+
+    def _routes_starting_near(self, route):
+        """Labeled routes whose label search starts around a route"""
+        left, top, right, bottom = RouteSet.from_routes([route]).bbox()
+        routes = self.routes
+        anchors = routes.coords[routes.offsets[:-1] + self.closest_indices]
+        margin_x, margin_y = 2 * np.asarray(self.label_extent())
+        near = np.flatnonzero(
+            (anchors[:, 0] >= left - margin_x)
+            & (anchors[:, 0] <= right + margin_x)
+            & (anchors[:, 1] >= top - margin_y)
+            & (anchors[:, 1] <= bottom + margin_y)
+        )
+
+        return [it for it in near.tolist() if it in self.label_dict]
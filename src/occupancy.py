@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class BlockOccupancy:
+    """Sparse boolean occupancy grid stored as a dict of bit-packed blocks
+
+    Only blocks holding an occupied cell are stored, a missing block is
+    entirely free and answers queries without any per cell storage. A
+    block of 32 x 32 cells is 32 rows of 32 bits. Routes occupy one block
+    per crossed cell at most, so memory scales with the length of the
+    routes and not with the area of the grid.
+
+    Cells are indexed like a numpy array of the given shape, as
+    occupancy[y, x], with ints or with equally shaped arrays of y and x.
+    """
+
+    block_size = 32
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.num_blocks_x = -(-shape[1] // self.block_size)
+
+        # Row into bits of each stored block, by block key
+        self.rows = {}
+        self.bits = np.zeros((0, self.block_size), dtype=np.uint32)
+
+    def _key(self, y, x):
+        return (y // self.block_size) * self.num_blocks_x + x // self.block_size
+
+    def _add_block(self, key):
+        row = len(self.rows)
+        if row == len(self.bits):
+            # Grow the storage by doubling, so adding blocks is amortized O(1)
+            bits = np.zeros((max(2 * row, 1), self.block_size), dtype=np.uint32)
+            bits[:row] = self.bits
+            self.bits = bits
+
+        self.rows[key] = row
+        return row
+
+    def _rows_of(self, y, x, create):
+        """Storage row of the block of every cell, -1 for missing blocks"""
+        keys, inverse = np.unique(self._key(y, x), return_inverse=True)
+        rows = [self.rows.get(key, -1) for key in keys.tolist()]
+        if create:
+            rows = [
+                self._add_block(key) if row < 0 else row
+                for key, row in zip(keys.tolist(), rows)
+            ]
+
+        return np.array(rows, dtype=np.int64)[inverse.ravel()]
+
+    def __getitem__(self, index):
+        y, x = index
+        if np.ndim(y) == 0 and np.ndim(x) == 0:
+            row = self.rows.get(self._key(int(y), int(x)))
+            if row is None:
+                return False
+            bits = int(self.bits[row, y % self.block_size])
+            return bool(bits >> (x % self.block_size) & 1)
+
+        y, x = np.asarray(y), np.asarray(x)
+        rows = self._rows_of(y, x, create=False)
+        stored = rows >= 0
+
+        occupied = np.zeros(len(rows), dtype=bool)
+        bits = self.bits[rows[stored], y.ravel()[stored] % self.block_size]
+        occupied[stored] = (bits >> (x.ravel()[stored] % self.block_size)) & 1
+        return occupied.reshape(y.shape)
+
+    def __setitem__(self, index, value):
+        if not value:
+            raise ValueError("Cells of a BlockOccupancy can only be occupied")
+
+        y, x = (np.asarray(it).ravel() for it in index)
+        if len(y) == 0:
+            return
+        rows = self._rows_of(y, x, create=True)
+        masks = np.left_shift(1, x % self.block_size).astype(np.uint32)
+        np.bitwise_or.at(self.bits, (rows, y % self.block_size), masks)
+
+    def nbytes(self):
+        """Bytes used for the stored blocks"""
+        return self.bits[: len(self.rows)].nbytes
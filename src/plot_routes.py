@@ -1,32 +1,31 @@
 # Run: python plot_routes.py routes.txt labels.txt
 import argparse
-import matplotlib.pyplot
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 
-def parse_routes(path):
-    parsed_routes = []
-    with open(path) as file:
-        lines = [line.strip() for line in file.readlines()]
+# parse_routes is imported from here by older callers
+from src.route_io import (  # noqa: F401
+    POSITIONS,
+    parse_routes,
+    read_labels,
+    read_routes,
+    zoom_output_path,
+)
+from src.route_set import RouteSet
 
-        for line in lines:
-            line_coords = [int(i) for i in line.split()]
-            line_coords = [([line_coords[i], line_coords[i + 1]]) for i in range(0, len(line_coords), 2)]
-            parsed_routes.append(line_coords)
-
-    return parsed_routes
+# Corners of a unit label, as fractions of width and height from its lower corner
+OUTLINE = np.array([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])
 
 
 def parse_labels(path, zoom):
+    # Text or binary labels file
+    points, positions = read_labels(path)
     parsed_labels = []
-    with open(path) as file:
-        lines = [line.strip() for line in file.readlines()]
-
-        for line in lines:
-            label_info = line.split()
-            x = float(label_info[0])
-            y = float(label_info[1])
-            orient = label_info[2]
-            parsed_labels.append(get_label(x, y, orient, 100 * zoom, 50 * zoom))
+    for (x, y), orient in zip(points.tolist(), positions):
+        parsed_labels.append(get_label(x, y, orient, 100 * zoom, 50 * zoom))
 
     return parsed_labels
 
@@ -44,31 +43,128 @@ def get_label(x, y, orient, width=100, height=50):
         raise Exception(f'Invalid label orientation of: {orient}')
 
 
-def display_results(routes_path, labels_path, zoom_levels):
+def label_boxes(points, positions, width=100, height=50):
+    # Lower and upper corners of the rectangles of get_label, as (N, 2) arrays
+    invalid = set(positions) - set(POSITIONS)
+    if invalid:
+        raise Exception(f'Invalid label orientation of: {invalid.pop()}')
+
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    left = np.array([orient.endswith('left') for orient in positions], dtype=bool)
+    top = np.array([orient.startswith('top') for orient in positions], dtype=bool)
+    lower = points - np.column_stack([width * left, height * top])
+
+    return lower, lower + [width, height]
+
+
+def label_outlines(points, positions, width=100, height=50):
+    # Outlines of all labels at once as an (N, 5, 2) array
+    lower, _ = label_boxes(points, positions, width, height)
+    return lower[:, None, :] + OUTLINE * [width, height]
+
+
+def draw_results(ax, routes, outlines, zoom_level):
+    # All routes and all labels are each drawn as one collection
+    from matplotlib import rcParams
+    from matplotlib.collections import LineCollection
+
+    # Margins should be at least 0.05 to avoid tight fit at level 1.
+    ax.margins(max(0.05, (zoom_level - 1) / 2), max(0.05, (zoom_level - 1) / 2))
+
+    colors = rcParams['axes.prop_cycle'].by_key()['color']
+    ax.add_collection(LineCollection(np.split(routes.coords, routes.offsets[1:-1]), colors=colors))
+    ax.add_collection(LineCollection(outlines, colors='k'))
+    ax.autoscale_view()
+
+    ax.set_title(f'Results at zoom level {zoom_level}')
+    ax.invert_yaxis()
+
+
+def _zoom_labels(labels_path, zoom_levels, labels_per_zoom):
+    # Labels of each zoom level, a file shared by all levels is read once
+    if not labels_per_zoom:
+        labels = read_labels(labels_path)
     for zoom_level in zoom_levels:
-        routes = parse_routes(routes_path)
-        labels = parse_labels(labels_path, zoom=zoom_level)
+        if labels_per_zoom:
+            labels = read_labels(zoom_output_path(labels_path, zoom_level))
+        points, positions = labels
+        yield zoom_level, label_outlines(points, positions, 100 * zoom_level, 50 * zoom_level)
+
+
+def display_results(routes_path, labels_path, zoom_levels, labels_per_zoom=False):
+    # Only plotting needs matplotlib, which is slow to import
+    import matplotlib.pyplot
 
+    routes = RouteSet(*read_routes(routes_path))
+    for zoom_level, outlines in _zoom_labels(labels_path, zoom_levels, labels_per_zoom):
         f, ax = matplotlib.pyplot.subplots()
+        draw_results(ax, routes, outlines, zoom_level)
+        matplotlib.pyplot.show()
 
-        # Margins should be at least 0.05 to avoid tight fit at level 1.
-        ax.margins(max(0.05, (zoom_level - 1) / 2), max(0.05, (zoom_level - 1) / 2))
 
-        for route in routes:
-            matplotlib.pyplot.plot(*zip(*route), '-')
+def render_results(routes_path, labels_path, output_path, zoom_levels, labels_per_zoom=False, dpi=150):
+    # Headless, write one PNG per zoom level, eg. out_zoom2.png, and return their paths
+    # Figures without pyplot need no GUI backend and are freed when done
+    from matplotlib.figure import Figure
 
-        for label in labels:
-            matplotlib.pyplot.plot(*zip(*label), 'k-')
+    routes = RouteSet(*read_routes(routes_path))
+    output_paths = []
+    for zoom_level, outlines in _zoom_labels(labels_path, zoom_levels, labels_per_zoom):
+        figure = Figure()
+        draw_results(figure.subplots(), routes, outlines, zoom_level)
+        output_paths.append(zoom_output_path(output_path, zoom_level))
+        figure.savefig(output_paths[-1], dpi=dpi)
+
+    return output_paths
 
-        matplotlib.pyplot.title(f'Results at zoom level {zoom_level}')
-        matplotlib.pyplot.gca().invert_yaxis()
-        matplotlib.pyplot.show()
+
+def render_many(jobs, output_dir, zoom_levels, labels_per_zoom=False, processes=None, dpi=150):
+    # Render (routes path, labels path) pairs in a process pool, into output_dir/<labels name>_zoomN.png
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {}
+        for routes_path, labels_path in jobs:
+            name = os.path.splitext(os.path.basename(labels_path))[0]
+            output_path = os.path.join(output_dir, f'{name}.png')
+            futures[executor.submit(render_results, routes_path, labels_path, output_path,
+                                    zoom_levels, labels_per_zoom, dpi)] = labels_path
+
+        output_paths, failed = [], 0
+        for future, labels_path in futures.items():
+            try:
+                output_paths.extend(future.result())
+            except Exception as error:
+                failed += 1
+                print(f'Failed {labels_path}: {type(error).__name__}: {error}', file=sys.stderr)
+
+    return output_paths, failed
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("routes_path", type=str)
-    parser.add_argument("labels_path", type=str)
+    parser.add_argument("paths", type=str, nargs="+",
+                        help="Routes path and labels path, or several such pairs with --render")
+    parser.add_argument("--labels-per-zoom", action="store_true",
+                        help="Read the labels of each zoom level from its own file, as written with --zoom-levels")
+    parser.add_argument("--zoom-levels", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--render", type=str,
+                        help="Write PNGs to this directory instead of showing plots, without a display")
+    parser.add_argument("--processes", type=int,
+                        help="Number of worker processes for --render, all cores by default")
+    parser.add_argument("--dpi", type=int, default=150)
     args = parser.parse_args()
 
-    display_results(args.routes_path, args.labels_path, [1, 2, 4])
+    if len(args.paths) % 2:
+        parser.error('paths have to be pairs of a routes path and a labels path')
+    jobs = list(zip(args.paths[::2], args.paths[1::2]))
+
+    if args.render:
+        output_paths, failed = render_many(jobs, args.render, args.zoom_levels, args.labels_per_zoom,
+                                           args.processes, args.dpi)
+        print(f'{len(output_paths)} images written to {args.render}, {failed} failed')
+        if failed:
+            raise SystemExit(1)
+    else:
+        if len(jobs) > 1:
+            parser.error('only one routes and labels pair can be shown, use --render for more')
+        display_results(*jobs[0], args.zoom_levels, args.labels_per_zoom)
@@ -0,0 +1,106 @@
+import functools
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """Wall time per phase and event counts of a run
+
+    Methods of a solution are timed and counted by wrapping them on the
+    instance, see instrument. Copies of a solution have to be instrumented
+    again. Solutions without a profiler are not touched, so profiling
+    costs nothing when it is disabled.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Add the wall time of a block to a phase, phases may nest"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + int(amount)
+
+    def instrument(self, obj, phases, counts):
+        """Time and count calls of methods of one object
+
+        Args:
+            obj: Object whose methods are wrapped
+            phases (dict): Method name to the phase its calls are timed in
+            counts (list): (method name, counter, weight) tuples, a call adds
+                weight(result) to the counter, or 1 if weight is None
+        """
+        wrappers = {}
+        for method_name, phase_name in phases.items():
+            wrappers.setdefault(method_name, []).append((self._timed, phase_name))
+        for method_name, counter, weight in counts:
+            wrappers.setdefault(method_name, []).append(
+                (self._counted, counter, weight)
+            )
+
+        for method_name, method_wrappers in wrappers.items():
+            # Start from the method of the class, obj can be a copy of an
+            # instrumented object, whose wrappers call the original object
+            method = getattr(type(obj), method_name).__get__(obj)
+            for wrapper, *args in method_wrappers:
+                method = functools.wraps(method)(wrapper(method, *args))
+            setattr(obj, method_name, method)
+
+    def _timed(self, method, phase_name):
+        def timed(*args, **kwargs):
+            with self.phase(phase_name):
+                return method(*args, **kwargs)
+
+        return timed
+
+    def _counted(self, method, counter, weight):
+        def counted(*args, **kwargs):
+            result = method(*args, **kwargs)
+            self.count(counter, 1 if weight is None else weight(result))
+            return result
+
+        return counted
+
+    def report(self):
+        return {
+            "phases": self.phases,
+            "counts": self.counts,
+            "peak_memory_mb": peak_memory_mb(resource.RUSAGE_SELF),
+            "peak_worker_memory_mb": peak_memory_mb(resource.RUSAGE_CHILDREN),
+        }
+
+    def write(self, path):
+        """Write the report as JSON, to stdout if path is -"""
+        if path == "-":
+            json.dump(self.report(), sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            with open(path, "w") as fp:
+                json.dump(self.report(), fp, indent=2)
+
+
+def phase(profiler, name):
+    """Time a block in a phase of profiler, does nothing if profiler is None"""
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
+
+
+def peak_memory_mb(who):
+    """Peak resident memory, of this process or of its largest finished child"""
+    max_rss = resource.getrusage(who).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return max_rss / 2**20
+    return max_rss / 2**10
@@ -1,194 +1,341 @@
-import argparse
-
 import numpy as np
 
-from src.plot_routes import parse_routes
-
-
-class Solution:
-    def __init__(self, routes):
-        self.routes = []
-        # ToDo: We should read each line directly as numpy arrays
-        # And then reshape
-        for route in routes:
-            self.routes.append(np.array(route))
-
-        self.bbox_center = self.bbox_center()
+from src.cli import argument_parser, read_solution, write_labels
+from src.geometry import cell_crossing_points
+from src.incremental import IncrementalRoutes
+from src.occupancy import BlockOccupancy
+from src.profiling import Profiler, phase
+from src.route_io import PARSE_CHUNK_SIZE, LabelFileWriter, iter_routes
+from src.route_set import RouteSet
+from src.zoom import ZoomLevels
+
+# Occupancy backends, auto uses a dense array unless the grid has more cells
+OCCUPANCY_BACKENDS = ("auto", "dense", "sparse")
+DENSE_MAX_CELLS = 2**27
+# Segments are rasterized in batches crossing about this many cells
+RASTER_BATCH_CELLS = 2**20
+
+
+class Solution(ZoomLevels):
+    # Methods timed and counted by a profiler, see Profiler.instrument
+    profiled_phases = {
+        "_simplify_routes": "simplify",
+        "_create_grid": "grid",
+        "_get_route_occupancy": "occupancy",
+        "_get_label_locations": "placement",
+        "repair_labels": "repair",
+    }
+    profiled_counts = [
+        ("_place_label", "labels", None),
+        ("_rasterize_segments", "segment_cells", lambda cells: len(cells[0])),
+        ("_find_closest_empty_occupancy", "fallback_searches", None),
+        ("_ring_cells", "fallback_cells", lambda cells: len(cells[0])),
+    ]
+
+    # Settings that tile workers copy from this solution, see label_in_tiles
+    tile_parameters = ("occupancy_backend",)
+    # Constructor arguments giving the label size at the current zoom level
+    size_parameters = ("label_width", "label_height")
+
+    def __init__(
+        self,
+        routes,
+        bbox_center=None,
+        profiler=None,
+        label_width=100,
+        label_height=50,
+        simplify_tolerance=None,
+    ):
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.instrument(self, self.profiled_phases, self.profiled_counts)
+
+        if not isinstance(routes, RouteSet):
+            routes = RouteSet.from_routes(routes)
+        self.routes = routes
+
+        # The center can be given when labeling part of a larger set of routes
+        if bbox_center is None:
+            bbox_center = self.bbox_center()
+        self.bbox_center = bbox_center
         self.closest_indices = self.route_points_closest_to_center(
             self.bbox_center, self.routes
         )
 
-        self.cell_width, self.cell_height = None, None
-        self.grid_x, self.grid_y = self._create_grid(self.routes)
+        # Given routes, and the index into their coords of every point of
+        # self.routes, None unless the routes are simplified
+        self.original_routes, self.point_ids = self.routes, None
+        if simplify_tolerance:
+            self._simplify_routes(simplify_tolerance * min(label_width, label_height))
 
-    def bbox_center(self):
-        bbox = self._bbox(self.routes)
+        # Label width and height at zoom level 1, also used as cell size
+        self.zoom_level = 1
+        self.label_width = label_width
+        self.label_height = label_height
+        # One of OCCUPANCY_BACKENDS
+        self.occupancy_backend = "auto"
 
-        return 0.5 * (bbox[0] + bbox[2]), 0.5 * (bbox[1] + bbox[3])
+        self.cell_width, self.cell_height = None, None
+        self.grid_origin, self.grid_shape = self._create_grid(
+            self.original_routes, self.label_width, self.label_height
+        )
 
-    def route_points_closest_to_center(self, bbox_center, routes):
-        closest_indices = []
-        for route in routes:
-            distances = np.linalg.norm(route - bbox_center, axis=1)
-            closest_index = np.argmin(distances)
-            closest_indices.append(closest_index)
+    def label_extent(self):
+        """Width and height of the area a label claims"""
+        return self.label_width, self.label_height
 
-        return closest_indices
+    def _simplify_routes(self, tolerance):
+        """Replace the routes by fewer of their points, see RouteSet.simplify
 
-    def _route_bbox(self, route):
-        """For a single polyline return bounding box
+        The point of every route closest to the center is kept, so labels
+        start from the same point, and labels always sit on points of the
+        given routes. Only searches over route points use the simplified
+        routes. Route cells are found from the given routes, so labels
+        never claim a cell that a route passes through.
+        """
+        self.routes, self.point_ids, self.closest_indices = (
+            self.routes.simplify_keeping(tolerance, self.closest_indices)
+        )
 
-        Args:
-            route (2D numpy.array): Polyline as numpy array
+    def for_zoom_level(self, zoom_level):
+        """Solution for labels scaled by the zoom level
 
-        Returns:
-            bbox: Tuple of size 4, with first 2 coords as left bottom
-                and last 2 as right top
+        Routes, their segments and the points closest to the center
+        are shared with this solution, only the grid is rebuilt.
         """
-        return (
-            np.min(route[:, 0]),
-            np.min(route[:, 1]),
-            np.max(route[:, 0]),
-            np.max(route[:, 1]),
+        solution = super().for_zoom_level(zoom_level)
+        solution.grid_origin, solution.grid_shape = solution._create_grid(
+            self.original_routes, solution.label_width, solution.label_height
         )
 
+        return solution
+
+    def bbox_center(self):
+        bbox = self._bbox(self.routes)
+
+        return 0.5 * (bbox[0] + bbox[2]), 0.5 * (bbox[1] + bbox[3])
+
+    def route_points_closest_to_center(self, bbox_center, routes):
+        return routes.closest_point_indices(bbox_center)
+
     def _bbox(self, routes):
         """Get bbox of all routes
 
         Args:
-            routes (List of 2D numpy.array): List of all Polylines (each is numpy array)
+            routes (RouteSet): All Polylines
 
         Returns:
             bbox: Tuple of size 4, with first 2 coords as left bottom
                 and last 2 as right top
-
-        ToDo: These are all ints, we should use Int specialization
         """
-        bbox_routes = self._route_bbox(routes[0])
-        if len(routes) > 1:
-            for route in routes:
-                bbox_route = self._route_bbox(route)
-                bbox_routes = (
-                    np.min([bbox_routes[0], bbox_route[0]]),
-                    np.min([bbox_routes[1], bbox_route[1]]),
-                    np.max([bbox_routes[2], bbox_route[2]]),
-                    np.max([bbox_routes[3], bbox_route[3]]),
-                )
+        return routes.bbox()
 
-        return bbox_routes
+    def _num_labels(self, routes):
+        """Most labels placed on a grid for the routes"""
+        return len(routes)
 
-    def _create_grid(self, routes, label_width=100, label_height=50):
-        """
-        Create a rectangular grid within a bbox with given width and height
+    def _grid_margin(self, num_labels):
+        """Cells on every side of the routes, enough for a free cell for every label
+
+        Routes only cross cells inside the lattice bbox of their points, so
+        the cells of a margin of m cells around it, at least 4 * m**2 of
+        them, can only be claimed by labels. At least one cell, as labels
+        can claim the cells left of and above a route point.
         """
-        # ToDo: label width and height could be associated to zoom level
+        return max(1, int(np.ceil(np.sqrt(num_labels) / 2)))
+
+    def _lattice_bbox(self, routes, label_width, label_height):
+        """Lattice cells (first_x, first_y, last_x, last_y) of the bbox corners"""
         routes_bbox = self._bbox(routes)
-        # Extend the bbox by width and height on both sides
-        routes_bbox = (
-            routes_bbox[0] - label_width,
-            routes_bbox[1] - label_height,
-            routes_bbox[2] + label_width,
-            routes_bbox[3] + label_height,
+        first_x, first_y = self._determine_cell_containing_point(
+            routes_bbox[:2], label_width, label_height
+        )
+        last_x, last_y = self._determine_cell_containing_point(
+            routes_bbox[2:], label_width, label_height
         )
 
-        # Grid always starts from 0 and we assume for now
-        # That 0 - label_widt and 0-label_height will be available
-        bbox_width = routes_bbox[2] - 0
-        bbox_height = routes_bbox[3] - 0
+        return int(first_x), int(first_y), int(last_x), int(last_y)
+
+    def _create_grid(self, routes, label_width=100, label_height=50):
+        """Grid of label sized cells covering the bbox of the routes
 
-        num_x_cells = np.ceil(bbox_width / label_width)
-        num_y_cells = np.ceil(bbox_height / label_height)
+        Cells lie on one lattice for all grids, cell (i, j) spans
+        [i * label_width, (i + 1) * label_width) along x and likewise along y,
+        so cell indices agree between grids of different sets of routes.
+        The grid has _grid_margin cells more on every side of the routes,
+        so every label finds a free cell, also in dense clusters of routes.
+        Memory scales with the extent of the routes, not with their
+        distance from 0.
 
-        x = np.arange(
-            0,
-            # FIXME: The 0.1 is because arange does not stop at stop
-            routes_bbox[0] + num_x_cells * label_width + 0.1 * label_width,
-            label_width,
-        )
-        y = np.arange(
-            0,
-            # FIXME: The 0.1 is because arange does not stop at stop
-            routes_bbox[1] + num_y_cells * label_height + 0.1 * label_height,
-            label_height,
+        Returns:
+            origin, shape: Lattice index (x, y) of the first grid cell and
+                the number of cells as (rows, columns)
+        """
+        self.cell_width = label_width
+        self.cell_height = label_height
+
+        first_x, first_y, last_x, last_y = self._lattice_bbox(
+            routes, label_width, label_height
         )
-        self.cell_width = x[1] - x[0]
-        self.cell_height = y[1] - y[0]
+        margin = self._grid_margin(self._num_labels(routes))
 
-        return np.meshgrid(x, y)
+        origin = (first_x - margin, first_y - margin)
+        shape = (last_y - first_y + 1 + 2 * margin, last_x - first_x + 1 + 2 * margin)
+        return origin, shape
 
-    def _refine_line(self, points, n):
-        """
-        Refine a route by n number of points which is tunable
-        """
-        refined_points = []
-        # ToDo: This is a python for loop and can be made faster using numpy
-        for i in range(len(points) - 1):
-            x1, y1 = points[i]
-            x2, y2 = points[i + 1]
-            x = np.linspace(x1, x2, n)
-            y = np.linspace(y1, y2, n)
-            refined_points.extend(zip(x, y))
-        refined_points = np.array(refined_points)
-        return refined_points
+    def _to_grid(self, cell_x, cell_y):
+        """Lattice cell indices to indices into the occupancy grid"""
+        return cell_x - self.grid_origin[0], cell_y - self.grid_origin[1]
 
     def _determine_cell_containing_point(self, point, cell_size_x, cell_size_y):
         """
-        This only works if the grid starts at 0,0
+        Lattice cell of a point, the lattice starts at 0,0
         and has uniform rectangle cells
         This ensures that for each point, we only need to look
         at 1 cell rather than iterate over the whole grid
+        Works for a single point as well as for arrays of x and y
         """
-        # Is going to be slow. Need to speed up with NumPy
         cell_x = np.floor(point[0] / cell_size_x).astype(int)
         cell_y = np.floor(point[1] / cell_size_y).astype(int)
         return cell_x, cell_y
 
-    def _is_inside_cell(self, point, cell_x, cell_y, grid_x, grid_y):
-        if (
-            point[0] > grid_x[cell_y][cell_x]
-            and point[0] < grid_x[cell_y][cell_x + 1]
-            and point[1] > grid_y[cell_y][cell_x]
-            and point[1] < grid_y[cell_y + 1][cell_x]
-        ):
-            return 1
-        else:
-            return 0
+    def _rasterize_segments(self, starts, ends, cell_width, cell_height):
+        """Find every cell crossed by every segment in one pass
 
-    def _get_occupancy(self, route, grid_x, grid_y, occupancy):
-        cell_width = grid_x[0][1] - grid_x[0][0]
-        cell_height = grid_y[1][0] - grid_y[0][0]
+        See geometry.cell_crossing_points. Segments running along a grid
+        line only touch the cells on both sides and do not cross either.
 
-        refined_points = self._refine_line(route, 4)
-        for point in refined_points:
-            cell_x, cell_y = self._determine_cell_containing_point(
-                point, cell_width, cell_height
-            )
+        Args:
+            starts (2D numpy.array): Start point of each segment
+            ends (2D numpy.array): End point of each segment
+            cell_width (float): Width of a grid cell
+            cell_height (float): Height of a grid cell
 
-            # IF it is already 1, we want to retain it, so doing an or
-            occupancy[cell_y][cell_x] = (
-                self._is_inside_cell(point, cell_x, cell_y, grid_x, grid_y)
-                or occupancy[cell_y][cell_x]
+        Returns:
+            cell_x, cell_y: Indices of crossed cells, may contain duplicates
+        """
+        segment_ids, points = cell_crossing_points(
+            starts, ends, cell_width, cell_height
+        )
+        delta = ends[segment_ids] - starts[segment_ids]
+
+        # Axis parallel segments lying on a grid line only touch cell borders
+        on_border = ((delta[:, 0] == 0) & (points[:, 0] % cell_width == 0)) | (
+            (delta[:, 1] == 0) & (points[:, 1] % cell_height == 0)
+        )
+        points = points[~on_border]
+
+        return self._determine_cell_containing_point(points.T, cell_width, cell_height)
+
+    def _get_occupancy(self, routes, occupancy):
+        """Set occupancy for every cell that any of the routes passes through
+
+        Segments are rasterized in batches, so memory for the crossed cells
+        is bounded also for long routes on a fine grid. Cells outside of the
+        grid hold no labels and are skipped, a tile worker builds its grid
+        from simplified routes that can lie within the given ones.
+        """
+        starts, ends = routes.segments()
+        cell_size = np.array([self.cell_width, self.cell_height])
+        num_cells = np.cumsum(
+            np.abs(np.floor(ends / cell_size) - np.floor(starts / cell_size)).sum(
+                axis=1
             )
+            + 1
+        )
+        bounds = np.searchsorted(
+            num_cells, np.arange(RASTER_BATCH_CELLS, num_cells[-1], RASTER_BATCH_CELLS)
+        )
+        del num_cells
+
+        bounds = [0] + bounds.tolist() + [len(starts)]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            cell_x, cell_y = self._to_grid(
+                *self._rasterize_segments(
+                    starts[first:last],
+                    ends[first:last],
+                    self.cell_width,
+                    self.cell_height,
+                )
+            )
+            size_y, size_x = self.grid_shape
+            inside = (
+                (cell_x >= 0) & (cell_x < size_x) & (cell_y >= 0) & (cell_y < size_y)
+            )
+            occupancy[cell_y[inside], cell_x[inside]] = True
 
         return occupancy
 
+    def _ring_cells(self, cell_x, cell_y, radius, size_x, size_y):
+        """Cells at exactly `radius` steps (Chebyshev distance) from a cell
+
+        Cells outside of the grid are dropped
+        """
+        if radius == 0:
+            ring_x, ring_y = np.array([cell_x]), np.array([cell_y])
+        else:
+            side = np.arange(-radius, radius + 1)
+            inner = side[1:-1]
+            ring_x = cell_x + np.concatenate(
+                [side, side, np.full(len(inner), -radius), np.full(len(inner), radius)]
+            )
+            ring_y = cell_y + np.concatenate(
+                [np.full(len(side), -radius), np.full(len(side), radius), inner, inner]
+            )
+
+        inside = (ring_x >= 0) & (ring_x < size_x) & (ring_y >= 0) & (ring_y < size_y)
+        return ring_x[inside], ring_y[inside]
+
     def _find_closest_empty_occupancy(self, cell_x, cell_y, occupancy):
+        """Find the empty cell closest to the given cell
+
+        We search outwards in square rings around the cell, each ring
+        checked with a single array lookup. Every cell on ring r is at least
+        r away, so we can stop as soon as r is beyond the best distance found.
+        Occupancy only fills up while labels are placed, so the distance found
+        for a cell is a lower bound for later lookups from the same cell,
+        which lets repeated lookups skip the rings that were already full.
+        Ties are resolved towards the smaller x and then the smaller y.
+
+        Returns:
+            closest_x, closest_y: (None, None) if all cells are occupied
+        """
         size_y, size_x = occupancy.shape
+        max_radius = max(cell_x, size_x - 1 - cell_x, cell_y, size_y - 1 - cell_y)
+
+        # A cell on ring r is at most sqrt(2) * r away
+        known_distance = self._closest_empty_distance.get((cell_x, cell_y), 0)
+        start_radius = int(np.ceil(np.sqrt(known_distance / 2)))
+
+        closest = None
+        for radius in range(start_radius, max_radius + 1):
+            if closest is not None and radius**2 > closest[0]:
+                break
+
+            ring_x, ring_y = self._ring_cells(cell_x, cell_y, radius, size_x, size_y)
+            empty = occupancy[ring_y, ring_x] == 0
+            if not np.any(empty):
+                continue
 
-        min_distance = size_x**2 + size_y**2
+            ring_x, ring_y = ring_x[empty], ring_y[empty]
+            distances = (ring_x - cell_x) ** 2 + (ring_y - cell_y) ** 2
+            best = np.lexsort((ring_y, ring_x, distances))[0]
+            candidate = (int(distances[best]), int(ring_x[best]), int(ring_y[best]))
+            if closest is None or candidate < closest:
+                closest = candidate
 
-        closest_x, closest_y = (None, None)
-        for i in range(size_x):
-            for j in range(size_y):
-                if occupancy[j][i] == 0:
-                    if ((j - cell_y) ** 2 + (i - cell_x) ** 2) < min_distance:
-                        min_distance = (j - cell_y) ** 2 + (i - cell_x) ** 2
-                        closest_x, closest_y = (i, j)
+        if closest is None:
+            return None, None
 
-        return closest_x, closest_y
+        self._closest_empty_distance[(cell_x, cell_y)] = closest[0]
+        return closest[1], closest[2]
 
     def _find_closest_point_to_cell(self, cell_x, cell_y, route):
-        cell_point = self.grid_x[cell_y][cell_x], self.grid_y[cell_y][cell_x]
+        # Top left corner of the cell
+        cell_point = (
+            (cell_x + self.grid_origin[0]) * self.cell_width,
+            (cell_y + self.grid_origin[1]) * self.cell_height,
+        )
         distances = np.linalg.norm(route - cell_point, axis=1)
         closest_index = np.argmin(distances)
 
@@ -197,122 +344,620 @@ class Solution:
     def _get_dict_for_cell(
         self, key, route, route_point, cell_x, cell_y, occupancy, label_dict
     ):
-        if not occupancy[cell_y][cell_x]:
-            label_dict[key] = {
-                "point_x": route_point[0],
-                "point_y": route_point[1],
-                "position": "bottom-right",
-            }
-            occupancy[cell_y][cell_x] = 1
-
-        elif not occupancy[cell_y][cell_x - 1]:
-            label_dict[key] = {
-                "point_x": route_point[0],
-                "point_y": route_point[1],
-                "position": "bottom-left",
-            }
-            occupancy[cell_y][cell_x - 1] = 1
-
-        elif not occupancy[cell_y - 1][cell_x]:
-            label_dict[key] = {
-                "point_x": route_point[0],
-                "point_y": route_point[1],
-                "position": "top-right",
-            }
-            occupancy[cell_y - 1][cell_x] = 1
-
-        elif not occupancy[cell_y - 1][cell_x - 1]:
-            label_dict[key] = {
-                "point_x": route_point[0],
-                "point_y": route_point[1],
-                "position": "top-left",
-            }
-            occupancy[cell_y - 1][cell_x - 1] = 1
+        """Claim a free cell next to the cell of a route point for a label
+
+        Cell indices are into the occupancy grid, the label dict stores
+        lattice indices.
+        """
+        for position, label_x, label_y in (
+            ("bottom-right", cell_x, cell_y),
+            ("bottom-left", cell_x - 1, cell_y),
+            ("top-right", cell_x, cell_y - 1),
+            ("top-left", cell_x - 1, cell_y - 1),
+        ):
+            if not occupancy[label_y, label_x]:
+                break
         else:
             # We have to determine closest point inside occupancy that is not occupied
             # FIXME: Then we find closest point to this on route
-            closest_x, closest_y = self._find_closest_empty_occupancy(
+            label_x, label_y = self._find_closest_empty_occupancy(
                 cell_x, cell_y, occupancy
             )
-            if closest_x > cell_x:
+            if label_x is None:
+                # Not expected, the grid margin leaves a free cell for every label
+                raise ValueError("No free cell left on the grid for a label")
+            if label_x > cell_x:
                 suffix = "right"
             else:
                 suffix = "left"
-            if closest_y > cell_y:
+            if label_y > cell_y:
                 prefix = "bottom"
             else:
                 prefix = "top"
+            position = f"{prefix}-{suffix}"
 
-            closest_index = self._find_closest_point_to_cell(
-                closest_x, closest_y, route
-            )
-            label_dict[key] = {
-                "point_x": route[closest_index][0],
-                "point_y": route[closest_index][1],
-                "position": f"{prefix}-{suffix}",
-            }
-            occupancy[closest_y][closest_x] = 1
+            closest_index = self._find_closest_point_to_cell(label_x, label_y, route)
+            route_point = route[closest_index]
+
+        label_dict[key] = {
+            "point_x": route_point[0],
+            "point_y": route_point[1],
+            "position": position,
+            "cell_x": label_x + self.grid_origin[0],
+            "cell_y": label_y + self.grid_origin[1],
+        }
+        occupancy[label_y, label_x] = True
 
         return label_dict
 
-    def _get_label_locations(self, np_routes, closest_indices, occupancy):
-        label_dict = {}
-        for it, route in enumerate(np_routes):
-            closest_to_center_index = closest_indices[it]
-            # For now, all we will do is fill up the closes non-occupied cell
-            route_point = route[closest_to_center_index]
-            cell_x, cell_y = self._determine_cell_containing_point(
+    def _place_label(self, it, route, closest_to_center_index, occupancy, label_dict):
+        # For now, all we will do is fill up the closes non-occupied cell
+        route_point = route[closest_to_center_index]
+        cell_x, cell_y = self._to_grid(
+            *self._determine_cell_containing_point(
                 route_point, self.cell_width, self.cell_height
             )
+        )
+
+        return self._get_dict_for_cell(
+            it, route, route_point, cell_x, cell_y, occupancy, label_dict
+        )
+
+    def _get_label_locations(
+        self, np_routes, closest_indices, occupancy, route_indices=None
+    ):
+        if route_indices is None:
+            route_indices = range(len(np_routes))
 
-            self._get_dict_for_cell(
-                it, route, route_point, cell_x, cell_y, occupancy, label_dict
+        label_dict = {}
+        # Lower bounds for closest empty cell lookups, valid while occupancy fills up
+        self._closest_empty_distance = {}
+        for it in route_indices:
+            self._place_label(
+                it, np_routes[it], closest_indices[it], occupancy, label_dict
             )
 
         return label_dict
 
-    def write_label_locations(self, output_path):
-        # ToDo: We should read each line directly as numpy arrays
+    def _new_occupancy(self):
+        """Empty occupancy of the grid, a dense array or a BlockOccupancy
+
+        Sparse occupancy stores only blocks of cells near routes and labels,
+        for maps whose routes cover a small part of their bbox.
+        """
+        backend = self.occupancy_backend
+        if backend == "auto":
+            num_cells = self.grid_shape[0] * self.grid_shape[1]
+            backend = "dense" if num_cells <= DENSE_MAX_CELLS else "sparse"
+        if backend == "sparse":
+            return BlockOccupancy(self.grid_shape)
+        if backend != "dense":
+            raise ValueError(f"Unknown occupancy backend {backend}")
+
+        return np.zeros(self.grid_shape, dtype=bool)
+
+    def _get_route_occupancy(self):
+        # For each cell we determine if a route passes through it
+        # We only want to set occupancy if a line passes through the inside of a cell
+        occupancy = self._new_occupancy()
+
+        # Rasterize the segments of all polylines in a single pass,
+        # the given ones, a simplified route can miss cells they pass through
+        return self._get_occupancy(self.original_routes, occupancy)
 
-        grid_x, grid_y = self.grid_x, self.grid_y
+    def get_label_locations(self, route_indices=None):
+        """Place labels for the given routes, all routes by default
 
-        # A box is defined by x[i], x[i+1], y[i], y[i+1]
-        # For this box we determine if there are points or other boxes
-        # within this box
-        # We only want to put occupancy as 1 if a line is strictly inside a box
-        # We cannot iterate over the line, so we refine the line and iterate over the points
-        occupancy = np.zeros_like(grid_x)
+        Labels are placed in the given order. All routes still count
+        for the occupancy, also the ones that are not labeled.
 
-        # For points in each polyline, iterate over them and set occupancy to 1
-        # if the refined version of the lines lies inside a box
-        for route in self.routes:
-            occupancy = self._get_occupancy(route, grid_x, grid_y, occupancy)
+        Returns:
+            label_dict: Label for each route index, with the anchor point,
+                the position and the claimed cell
+        """
+        occupancy = self._get_route_occupancy()
 
         # Now using occupancy we determine what cells are available close to the mid point
         # We could try reusing the refined points to shift slightly in either direction
         # and determine an empty cell close by
         # For now, we just create a dict for this
+        return self._get_label_locations(
+            self.routes, self.closest_indices, occupancy, route_indices
+        )
+
+    def label_rectangles(self, labels):
+        """Left, top, right and bottom of the cell of each label, one row each"""
+        cells = np.array(
+            [(label["cell_x"], label["cell_y"]) for label in labels], dtype=float
+        ).reshape(-1, 2)
+        size = np.array([self.cell_width, self.cell_height])
+
+        return np.hstack([cells * size, (cells + 1) * size])
+
+    def repair_labels(self, label_dict, revisit=None):
+        """Replay labels placed independently and re-place conflicting ones
 
-        label_dict = self._get_label_locations(
-            self.routes, self.closest_indices, occupancy
+        Labels not in revisit are known to be valid and keep their cells,
+        by default all labels are revisited. Revisited labels are replayed
+        in route order on the occupancy of all routes and kept labels.
+        A label keeps its cell if the cell is still empty, otherwise it is
+        placed again as in get_label_locations.
+
+        Returns:
+            label_dict, num_replaced: Valid labels and how many were re-placed
+        """
+        occupancy = self._get_route_occupancy()
+        size_y, size_x = occupancy.shape
+        self._closest_empty_distance = {}
+
+        revisit = set(label_dict if revisit is None else revisit)
+        kept = np.array([it for it in label_dict if it not in revisit], dtype=np.int64)
+        cells = np.array(
+            [(label_dict[it]["cell_x"], label_dict[it]["cell_y"]) for it in kept],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        cell_x, cell_y = self._to_grid(cells[:, 0], cells[:, 1])
+        inside = (cell_x >= 0) & (cell_x < size_x) & (cell_y >= 0) & (cell_y < size_y)
+        occupancy[cell_y[inside], cell_x[inside]] = True
+        repaired_dict = {it: label_dict[it] for it in kept[inside].tolist()}
+        # Labels off the grid are placed again
+        revisit.update(kept[~inside].tolist())
+
+        num_replaced = 0
+        for it in sorted(revisit):
+            cell_x, cell_y = self._to_grid(
+                label_dict[it]["cell_x"], label_dict[it]["cell_y"]
+            )
+            if (
+                0 <= cell_x < size_x
+                and 0 <= cell_y < size_y
+                and not occupancy[cell_y, cell_x]
+            ):
+                occupancy[cell_y, cell_x] = True
+                repaired_dict[it] = label_dict[it]
+            else:
+                self._place_label(
+                    it,
+                    self.routes[it],
+                    self.closest_indices[it],
+                    occupancy,
+                    repaired_dict,
+                )
+                num_replaced += 1
+
+        return dict(sorted(repaired_dict.items())), num_replaced
+
+
+class IncrementalSolution(IncrementalRoutes, Solution):
+    """Solution that keeps its layout up to date while routes change
+
+    The occupancy and the placed labels are kept between updates, and an
+    update only places labels again for routes whose neighbourhood changed:
+    the changed route itself, routes whose label cell is now crossed by a
+    route, and routes whose label search starts close to a removed route.
+
+    Route ids are positions in self.routes and stay valid. Removed routes
+    keep their id and are skipped. The bbox center is fixed at construction.
+    """
+
+    def __init__(
+        self,
+        routes,
+        bbox_center=None,
+        profiler=None,
+        label_width=100,
+        label_height=50,
+    ):
+        super().__init__(routes, bbox_center, profiler, label_width, label_height)
+        self.removed_routes = set()
+        # Current layout, created on first use
+        self.label_dict = None
+
+    def for_zoom_level(self, zoom_level):
+        solution = super().for_zoom_level(zoom_level)
+        solution.removed_routes = set(self.removed_routes)
+        solution.label_dict = None
+
+        return solution
+
+    def _get_route_cells(self, route):
+        """Lattice cells crossed by a single route
+
+        Returns:
+            cell_x, cell_y: One entry per segment crossing a cell
+        """
+        return self._rasterize_segments(
+            *RouteSet.from_routes([route]).segments(),
+            self.cell_width,
+            self.cell_height,
+        )
+
+    def _get_cell_counts(self):
+        """Number of route segments of active routes crossing each cell"""
+        cell_counts = np.zeros(self.grid_shape, dtype=np.int64)
+        cell_x, cell_y = self._to_grid(
+            *self._rasterize_segments(
+                *self.routes.segments(), self.cell_width, self.cell_height
+            )
+        )
+        np.add.at(cell_counts, (cell_y, cell_x), 1)
+        for it in self.removed_routes:
+            cell_x, cell_y = self._to_grid(*self._get_route_cells(self.routes[it]))
+            np.add.at(cell_counts, (cell_y, cell_x), -1)
+
+        return cell_counts
+
+    def _get_route_occupancy(self):
+        return self._get_cell_counts() > 0
+
+    def get_label_locations(self, route_indices=None):
+        if route_indices is None:
+            route_indices = self.active_routes()
+
+        return super().get_label_locations(route_indices)
+
+    def _ensure_layout(self):
+        if self.label_dict is not None:
+            return
+
+        self._cell_counts = self._get_cell_counts()
+        self._occupancy = self._cell_counts > 0
+        # Lattice bbox of the points of all routes, removed ones included
+        self._routes_lattice_bbox = self._lattice_bbox(
+            self.routes, self.cell_width, self.cell_height
         )
+        # Route id of the label claiming each lattice cell
+        self._label_cells = {}
+        self.label_dict = {}
+        self._relabel(self.active_routes())
+
+    def _relabel(self, route_ids):
+        """Place labels of the given routes again, in route order"""
+        route_ids = sorted(route_ids)
+        for it in route_ids:
+            if it in self.label_dict:
+                label = self.label_dict.pop(it)
+                self._free_label_cell(label)
+
+        # Cells may have been freed, so earlier closest empty cell distances do not hold
+        self._closest_empty_distance = {}
+        for it in route_ids:
+            self._place_label(
+                it,
+                self.routes[it],
+                self.closest_indices[it],
+                self._occupancy,
+                self.label_dict,
+            )
+            label = self.label_dict[it]
+            self._label_cells[(label["cell_x"], label["cell_y"])] = it
+
+        return route_ids
+
+    def _free_label_cell(self, label):
+        cell = label["cell_x"], label["cell_y"]
+        del self._label_cells[cell]
+        cell_x, cell_y = self._to_grid(*cell)
+        self._occupancy[cell_y][cell_x] = self._cell_counts[cell_y][cell_x] > 0
+
+    def _grow_grid(self, first_x, first_y, last_x, last_y):
+        """Grow the grid to cover lattice cells first..last, keeping the layout
+
+        A side that has to move grows by at least the size of the grid along
+        its axis, so the grid doubles and adding many routes outside of it
+        only grows it a logarithmic number of times. Labels keep their
+        lattice cells.
+        """
+        origin_x, origin_y = self.grid_origin
+        size_y, size_x = self.grid_shape
+        end_x, end_y = origin_x + size_x, origin_y + size_y
+        if first_x < origin_x:
+            first_x = min(first_x, origin_x - size_x)
+        if last_x >= end_x:
+            end_x = max(last_x + 1, end_x + size_x)
+        if first_y < origin_y:
+            first_y = min(first_y, origin_y - size_y)
+        if last_y >= end_y:
+            end_y = max(last_y + 1, end_y + size_y)
+        first_x, first_y = min(first_x, origin_x), min(first_y, origin_y)
+
+        self.grid_origin = (first_x, first_y)
+        self.grid_shape = (end_y - first_y, end_x - first_x)
+        old_cells = (
+            slice(origin_y - first_y, origin_y - first_y + size_y),
+            slice(origin_x - first_x, origin_x - first_x + size_x),
+        )
+        cell_counts = np.zeros(self.grid_shape, dtype=self._cell_counts.dtype)
+        cell_counts[old_cells] = self._cell_counts
+        occupancy = np.zeros(self.grid_shape, dtype=bool)
+        occupancy[old_cells] = self._occupancy
+        self._cell_counts, self._occupancy = cell_counts, occupancy
+
+    def _add_route_cells(self, route_id):
+        """Add a route to the occupancy, growing the grid if needed
+
+        Returns:
+            route_ids: Routes whose label cell is now crossed by the route
+        """
+        route = self.routes[route_id]
+        first_x, first_y, last_x, last_y = self._lattice_bbox(
+            RouteSet.from_routes([route]), self.cell_width, self.cell_height
+        )
+        bbox = self._routes_lattice_bbox
+        bbox = (
+            min(bbox[0], first_x),
+            min(bbox[1], first_y),
+            max(bbox[2], last_x),
+            max(bbox[3], last_y),
+        )
+        self._routes_lattice_bbox = bbox
+
+        # Keep the margin of _create_grid around all routes
+        margin = self._grid_margin(len(self.routes))
+        origin_x, origin_y = self.grid_origin
+        size_y, size_x = self.grid_shape
+        if (
+            bbox[0] - margin < origin_x
+            or bbox[1] - margin < origin_y
+            or bbox[2] + margin >= origin_x + size_x
+            or bbox[3] + margin >= origin_y + size_y
+        ):
+            self._grow_grid(
+                bbox[0] - margin,
+                bbox[1] - margin,
+                bbox[2] + margin,
+                bbox[3] + margin,
+            )
+
+        cells = self._get_route_cells(route)
+        cell_x, cell_y = self._to_grid(*cells)
+        np.add.at(self._cell_counts, (cell_y, cell_x), 1)
+        self._occupancy[cell_y, cell_x] = True
+
+        cells = set(zip(cells[0].tolist(), cells[1].tolist()))
+        return [self._label_cells[cell] for cell in cells if cell in self._label_cells]
+
+    def _remove_route_cells(self, route_id):
+        """Remove a route and its label from the occupancy"""
+        cell_x, cell_y = self._to_grid(*self._get_route_cells(self.routes[route_id]))
+        np.add.at(self._cell_counts, (cell_y, cell_x), -1)
+        self._occupancy[cell_y, cell_x] = self._cell_counts[cell_y, cell_x] > 0
 
-        with open(output_path, "w") as fp:
-            for it in range(len(self.routes)):
-                fp.write(
-                    f"""{label_dict[it]["point_x"]} {label_dict[it]["point_y"]} {label_dict[it]["position"]}\n"""
+        label = self.label_dict.pop(route_id, None)
+        if label is not None:
+            self._free_label_cell(label)
+
+    def add_route(self, route):
+        """Add a route and label it
+
+        Returns:
+            route_id, relabeled: Id of the new route and the ids of all
+                routes whose label was placed
+        """
+        self._ensure_layout()
+        route_id = len(self.routes)
+        self._store_route(route_id, route)
+
+        crossed = self._add_route_cells(route_id)
+
+        return route_id, self._relabel(crossed + [route_id])
+
+    def remove_route(self, route_id):
+        """Remove a route and its label
+
+        Returns:
+            relabeled: Ids of the routes whose label was placed again
+        """
+        self._ensure_layout()
+        self._remove_route_cells(route_id)
+        self.removed_routes.add(route_id)
+
+        return self._relabel(self._routes_starting_near(self.routes[route_id]))
+
+    def update_route(self, route_id, route):
+        """Replace the points of a route and label it again
+
+        Returns:
+            relabeled: Ids of the routes whose label was placed again
+        """
+        self._ensure_layout()
+        self._remove_route_cells(route_id)
+        near_old_route = self._routes_starting_near(self.routes[route_id])
+        self._store_route(route_id, route)
+
+        crossed = self._add_route_cells(route_id)
+
+        return self._relabel(set(near_old_route + crossed + [route_id]))
+
+
+class StreamingSolution(Solution):
+    """Solution for routes files larger than memory
+
+    Routes are read from the file a chunk at a time and never held all
+    at once. A first pass finds the bbox and the number of routes, a
+    second one marks the cells crossed by routes in the occupancy, and a
+    third one places the labels of each chunk in route order and writes
+    them out. Labels have to wait for the occupancy of all routes, as a
+    later route can cross any cell. Memory is one chunk of routes plus
+    the occupancy, which can be sparse, see occupancy_backend.
+    Labels are the same as labeling all routes at once.
+    """
+
+    profiled_phases = {
+        "_scan_routes": "bbox",
+        "_create_grid": "grid",
+        "_get_route_occupancy": "occupancy",
+        "_place_chunk": "placement",
+    }
+
+    def __init__(
+        self,
+        routes_path,
+        chunk_size=PARSE_CHUNK_SIZE,
+        profiler=None,
+        label_width=100,
+        label_height=50,
+        simplify_tolerance=None,
+    ):
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.instrument(self, self.profiled_phases, self.profiled_counts)
+
+        self.routes_path = routes_path
+        self.chunk_size = chunk_size
+        # Routes are only read chunk by chunk, see route_chunks
+        self.routes, self.original_routes = None, None
+        self.routes_bbox, self.num_routes = self._scan_routes()
+        self.bbox_center = self.bbox_center()
+        # Chunks are simplified as they are read, within this distance
+        self.simplify_distance = None
+        if simplify_tolerance:
+            self.simplify_distance = simplify_tolerance * min(label_width, label_height)
+
+        self.zoom_level = 1
+        self.label_width = label_width
+        self.label_height = label_height
+        self.occupancy_backend = "auto"
+
+        self.cell_width, self.cell_height = None, None
+        self.grid_origin, self.grid_shape = self._create_grid(
+            self.original_routes, self.label_width, self.label_height
+        )
+
+    def route_chunks(self, simplify=True):
+        """Routes of the file a chunk at a time, simplified as in Solution"""
+        for coords, offsets in iter_routes(self.routes_path, self.chunk_size):
+            routes = RouteSet(coords, offsets)
+            if simplify and self.simplify_distance:
+                routes, _, _ = routes.simplify_keeping(
+                    self.simplify_distance,
+                    routes.closest_point_indices(self.bbox_center),
                 )
+            yield routes
 
-        return
+    def _scan_routes(self):
+        """Bbox and number of routes of the file, in one pass"""
+        lower, upper, num_routes = None, None, 0
+        for routes in self.route_chunks(simplify=False):
+            bbox = np.array(routes.bbox())
+            lower = bbox[:2] if lower is None else np.minimum(lower, bbox[:2])
+            upper = bbox[2:] if upper is None else np.maximum(upper, bbox[2:])
+            num_routes += len(routes)
+        if lower is None:
+            raise ValueError(f"{self.routes_path} holds no routes")
+
+        return (lower[0], lower[1], upper[0], upper[1]), num_routes
+
+    def _bbox(self, routes):
+        return self.routes_bbox
+
+    def _num_labels(self, routes):
+        return self.num_routes
+
+    def _get_route_occupancy(self):
+        occupancy = self._new_occupancy()
+        # Given routes, as in Solution._get_route_occupancy
+        for routes in self.route_chunks(simplify=False):
+            self._get_occupancy(routes, occupancy)
+
+        return occupancy
+
+    def _place_chunk(self, routes, first_id, occupancy, route_indices=None):
+        """Place labels for a chunk of routes, keyed by their id in the file
+
+        Only routes in route_indices are labeled, all routes by default.
+        """
+        closest_indices = self.route_points_closest_to_center(self.bbox_center, routes)
+        label_dict = {}
+        for it in range(len(routes)):
+            if route_indices is not None and first_id + it not in route_indices:
+                continue
+            self._place_label(
+                first_id + it, routes[it], closest_indices[it], occupancy, label_dict
+            )
+
+        return label_dict
+
+    def _label_chunks(self, route_indices=None):
+        """Labels of every chunk of routes, in file order, see _place_chunk"""
+        occupancy = self._get_route_occupancy()
+        self._closest_empty_distance = {}
+        first_id = 0
+        for routes in self.route_chunks():
+            yield self._place_chunk(routes, first_id, occupancy, route_indices)
+            first_id += len(routes)
+
+    def get_label_locations(self, route_indices=None):
+        """Place labels for the given routes, all routes by default
+
+        Labels are placed in file order, also for given route indices, and
+        are the same as for Solution.get_label_locations with sorted route
+        indices. Only the labels are held in memory, not the routes.
+        """
+        if route_indices is not None:
+            route_indices = set(route_indices)
+
+        label_dict = {}
+        for chunk_dict in self._label_chunks(route_indices):
+            label_dict.update(chunk_dict)
+
+        return label_dict
+
+    def write_label_locations(self, output_path, tiles_per_axis=None, processes=None):
+        """Place and write labels chunk by chunk, tiles are not supported
+
+        Labels are not kept, so None is returned instead of them.
+        """
+        if tiles_per_axis:
+            raise ValueError("Tiles need all routes in memory, they cannot be streamed")
+
+        with LabelFileWriter(output_path, self.num_routes) as writer:
+            for label_dict in self._label_chunks():
+                with phase(self.profiler, "write"):
+                    writer.write(label_dict)
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("routes_path", type=str)
-    parser.add_argument("output_path", type=str)
+    parser = argument_parser()
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the routes file in chunks, for files larger than memory",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=PARSE_CHUNK_SIZE // 2**20,
+        help="Megabytes of the routes file read at a time with --stream",
+    )
+    parser.add_argument(
+        "--occupancy",
+        choices=OCCUPANCY_BACKENDS,
+        default="auto",
+        help="Dense array or sparse blocks of cells, dense for grids up to "
+        f"{DENSE_MAX_CELLS} cells by default",
+    )
     args = parser.parse_args()
 
-    parsed_routes = parse_routes(args.routes_path)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size has to be at least 1 megabyte")
+    if args.stream and args.tiles:
+        parser.error(
+            "--tiles needs all routes in memory and cannot be used with --stream"
+        )
+
+    profiler = Profiler() if args.profile else None
+    if args.stream:
+        sol = StreamingSolution(
+            args.routes_path,
+            args.chunk_size * 2**20,
+            profiler=profiler,
+            simplify_tolerance=args.simplify,
+        )
+    else:
+        sol = read_solution(Solution, args, profiler)
+    sol.occupancy_backend = args.occupancy
+    write_labels(sol, args)
 
-    sol = Solution(parsed_routes)
-    sol.write_label_locations(args.output_path)
+    if profiler is not None:
+        profiler.write(args.profile)
@@ -0,0 +1,365 @@
+import copy
+import json
+import sys
+import time
+
+import numpy as np
+
+from src import route
+from src.cli import argument_parser, read_solution, write_labels
+from src.profiling import Profiler
+from src.route_io import POSITIONS
+
+# Cell of a label relative to the cell of its route point, by position in POSITIONS
+QUADRANT_OFFSETS = ((0, 0), (-1, 0), (0, -1), (-1, -1))
+# Cost of a label that is not next to a point of its route, in cells
+DETACHED_COST = 10.0
+
+
+class Solution(route.Solution):
+    """Grid engine that improves its layout until a time budget runs out
+
+    A greedy layout as in route.Solution is placed first, so there is
+    always a valid layout. Then labels are moved by local search, to other
+    points of their route and other quadrants, while time is left. Every
+    move keeps the layout valid and lowers its cost, so the current layout
+    is always the best one found so far.
+
+    The cost of a label is its distance in cells from the point closest to
+    the center, plus DETACHED_COST if the label had to be placed away from
+    all points of its route.
+    """
+
+    profiled_phases = {**route.Solution.profiled_phases, "improve_labels": "improve"}
+    profiled_counts = route.Solution.profiled_counts + [
+        ("_improve_label", "improved_labels", bool),
+    ]
+
+    tile_parameters = route.Solution.tile_parameters + (
+        "time_budget",
+        "max_candidates",
+    )
+
+    def __init__(
+        self,
+        routes,
+        bbox_center=None,
+        profiler=None,
+        label_width=100,
+        label_height=50,
+        simplify_tolerance=None,
+    ):
+        super().__init__(
+            routes,
+            bbox_center,
+            profiler,
+            label_width,
+            label_height,
+            simplify_tolerance,
+        )
+
+        # Seconds for placing and improving the labels of one call
+        self.time_budget = 1.0
+        # Route points tried per label, walking away from the closest point
+        self.max_candidates = 64
+        # Quality of the last layout of this solution, see layout_metrics
+        self.metrics = None
+
+    def candidate_indices(self, it):
+        """Up to max_candidates route point indices around the closest point
+
+        Sorted by their distance along the route, see RouteSet.points_around.
+        """
+        return self.routes.points_around(
+            it, self.closest_indices[it], self.max_candidates
+        )
+
+    def _preferred_cell(self, it):
+        """Grid cell of the point of a route closest to the center"""
+        return self._to_grid(
+            *self._determine_cell_containing_point(
+                self.routes[it][self.closest_indices[it]],
+                self.cell_width,
+                self.cell_height,
+            )
+        )
+
+    def _candidates(self, it, route_occupancy):
+        """Label cells next to points of a route that no route passes through
+
+        Returns:
+            candidates: List of (cost, cell_x, cell_y, point index, quadrant),
+                cheapest first
+        """
+        indices = self.candidate_indices(it)
+        point_x, point_y = self._to_grid(
+            *self._determine_cell_containing_point(
+                self.routes[it][indices].T, self.cell_width, self.cell_height
+            )
+        )
+        preferred_x, preferred_y = self._preferred_cell(it)
+        costs = np.hypot(point_x - preferred_x, point_y - preferred_y)
+
+        offsets = np.array(QUADRANT_OFFSETS)
+        cell_x = (point_x[:, None] + offsets[:, 0]).ravel()
+        cell_y = (point_y[:, None] + offsets[:, 1]).ravel()
+        size_y, size_x = self.grid_shape
+        inside = (cell_x >= 0) & (cell_x < size_x) & (cell_y >= 0) & (cell_y < size_y)
+        free = np.zeros(len(cell_x), dtype=bool)
+        free[inside] = ~route_occupancy[cell_y[inside], cell_x[inside]]
+
+        costs = np.repeat(costs, len(QUADRANT_OFFSETS))
+        points = np.repeat(indices, len(QUADRANT_OFFSETS))
+        quadrants = np.tile(np.arange(len(QUADRANT_OFFSETS)), len(indices))
+        order = np.argsort(costs[free], kind="stable")
+
+        return list(
+            zip(
+                costs[free][order].tolist(),
+                cell_x[free][order].tolist(),
+                cell_y[free][order].tolist(),
+                points[free][order].tolist(),
+                quadrants[free][order].tolist(),
+            )
+        )
+
+    def _label_costs(self, label_dict):
+        """Cost of every placed label, see the class docstring
+
+        Computed for all labels at once from their cells and points.
+
+        Returns:
+            costs: Dict of the cost by route index
+        """
+        route_ids = np.fromiter(label_dict, dtype=np.int64, count=len(label_dict))
+        values = [
+            (
+                label["cell_x"],
+                label["cell_y"],
+                label["point_x"],
+                label["point_y"],
+                POSITIONS.index(label["position"]),
+            )
+            for label in label_dict.values()
+        ]
+        cell_x, cell_y, point_x, point_y, quadrants = (
+            np.array(values, dtype=float).reshape(-1, 5).T
+        )
+        routes = self.routes
+        anchors = routes.coords[
+            routes.offsets[route_ids] + self.closest_indices[route_ids]
+        ]
+        # Lattice cells, the grid origin cancels out of all differences
+        preferred_x, preferred_y = self._determine_cell_containing_point(
+            anchors.T, self.cell_width, self.cell_height
+        )
+        point_x, point_y = self._determine_cell_containing_point(
+            (point_x, point_y), self.cell_width, self.cell_height
+        )
+        distances = np.hypot(cell_x - preferred_x, cell_y - preferred_y)
+
+        # A label is attached if its cell is a quadrant of the cell of its point
+        offsets = np.array(QUADRANT_OFFSETS)[quadrants.astype(np.int64)].reshape(-1, 2)
+        attached = (cell_x == point_x + offsets[:, 0]) & (
+            cell_y == point_y + offsets[:, 1]
+        )
+        costs = np.where(
+            attached,
+            np.hypot(point_x - preferred_x, point_y - preferred_y),
+            DETACHED_COST + distances,
+        )
+
+        return dict(zip(route_ids.tolist(), costs.tolist()))
+
+    def _move_label(self, it, candidate, state):
+        cost, cell_x, cell_y, point_index, quadrant = candidate
+        label_dict, claims, costs = state
+
+        old = label_dict[it]
+        old_cell = self._to_grid(old["cell_x"], old["cell_y"])
+        # The old cell can already be taken over by a label swapping with this one
+        if claims.get(old_cell) == it:
+            del claims[old_cell]
+        claims[(cell_x, cell_y)] = it
+        costs[it] = cost
+
+        point = self.routes[it][point_index]
+        label_dict[it] = {
+            "point_x": point[0],
+            "point_y": point[1],
+            "position": POSITIONS[quadrant],
+            "cell_x": cell_x + self.grid_origin[0],
+            "cell_y": cell_y + self.grid_origin[1],
+        }
+
+    def _improve_label(self, it, candidates, state, route_occupancy):
+        """Move a label to a cheaper cell, pushing aside the label holding it
+
+        A cheaper cell held by another label is taken if that label can move
+        to a free cell of its own and the total cost goes down.
+
+        Returns:
+            improved: False if no cheaper layout was found
+        """
+        label_dict, claims, costs = state
+
+        for candidate in candidates[it]:
+            cost, cell_x, cell_y = candidate[:3]
+            if cost >= costs[it]:
+                break
+
+            holder = claims.get((cell_x, cell_y))
+            if holder is None:
+                self._move_label(it, candidate, state)
+                return True
+            if holder == it:
+                continue
+
+            if holder not in candidates:
+                candidates[holder] = self._candidates(holder, route_occupancy)
+            for alternative in candidates[holder]:
+                gain = costs[it] - cost + costs[holder] - alternative[0]
+                if gain <= 0:
+                    break
+                # The holder can also take the cell this label leaves
+                cell = alternative[1], alternative[2]
+                if cell != (cell_x, cell_y) and claims.get(cell, it) == it:
+                    self._move_label(holder, alternative, state)
+                    self._move_label(it, candidate, state)
+                    return True
+
+        return False
+
+    def improve_labels(self, label_dict, route_occupancy, deadline):
+        """Local search on a valid layout until no move helps or the deadline
+
+        Labels with a positive cost are visited in rounds, each one moved
+        to the cheapest cell it can get, see _improve_label.
+
+        Returns:
+            label_dict, metrics: Improved labels and their quality
+        """
+        costs = self._label_costs(label_dict)
+        greedy_cost = sum(costs.values())
+        rounds, moves = 0, 0
+        costly = sorted(it for it in costs if costs[it] > 0)
+        if not costly or time.perf_counter() >= deadline:
+            return label_dict, self.layout_metrics(costs, greedy_cost, rounds, moves)
+
+        claims = {
+            self._to_grid(label["cell_x"], label["cell_y"]): it
+            for it, label in label_dict.items()
+        }
+        state = label_dict, claims, costs
+        candidates = {}
+        while costly and time.perf_counter() < deadline:
+            rounds += 1
+            round_moves = 0
+            for it in costly:
+                if time.perf_counter() >= deadline:
+                    break
+                if it not in candidates:
+                    candidates[it] = self._candidates(it, route_occupancy)
+                if self._improve_label(it, candidates, state, route_occupancy):
+                    round_moves += 1
+
+            moves += round_moves
+            if not round_moves:
+                break
+            costly = [it for it in costly if costs[it] > 0]
+
+        return label_dict, self.layout_metrics(costs, greedy_cost, rounds, moves)
+
+    def layout_metrics(self, costs, greedy_cost=None, rounds=0, moves=0):
+        """Quality of a layout from the cost of each label"""
+        values = np.array(list(costs.values()), dtype=float)
+        detached = values >= DETACHED_COST
+        return {
+            "zoom_level": self.zoom_level,
+            "labels": len(values),
+            "detached_labels": int(np.sum(detached)),
+            "moved_from_closest_point": int(np.sum((values > 0) & ~detached)),
+            "mean_attached_distance": (
+                float(values[~detached].mean()) if np.any(~detached) else 0.0
+            ),
+            "cost": float(values.sum()),
+            "greedy_cost": greedy_cost,
+            "rounds": rounds,
+            "moves": moves,
+        }
+
+    def get_label_locations(self, route_indices=None):
+        """Place labels greedily, then improve them until the time budget is used
+
+        The greedy layout is always completed, also if that alone takes
+        longer than the time budget.
+
+        Returns:
+            label_dict: As for route.Solution.get_label_locations
+        """
+        start = time.perf_counter()
+        occupancy = self._get_route_occupancy()
+        route_occupancy = copy.deepcopy(occupancy)
+
+        label_dict = self._get_label_locations(
+            self.routes, self.closest_indices, occupancy, route_indices
+        )
+        label_dict, metrics = self.improve_labels(
+            label_dict, route_occupancy, start + self.time_budget
+        )
+        metrics["seconds"] = time.perf_counter() - start
+        self.metrics = metrics
+
+        return label_dict
+
+    def repair_labels(self, label_dict, revisit=None):
+        """Repair labels as route.Solution and measure the repaired layout
+
+        Used for layouts of tiles, which are improved in worker processes,
+        so rounds and moves of the local search are not known.
+        """
+        label_dict, num_replaced = super().repair_labels(label_dict, revisit)
+        costs = self._label_costs(label_dict)
+        self.metrics = self.layout_metrics(costs, rounds=None, moves=None)
+        self.metrics["replaced_labels"] = num_replaced
+
+        return label_dict, num_replaced
+
+
+if __name__ == "__main__":
+    parser = argument_parser()
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=1.0,
+        help="Seconds for placing and improving labels, per zoom level and tile",
+    )
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        default=64,
+        help="Route points tried per label when improving the layout",
+    )
+    parser.add_argument(
+        "--occupancy",
+        choices=route.OCCUPANCY_BACKENDS,
+        default="auto",
+        help="Dense array or sparse blocks of cells, see route.py",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Print the quality of each layout as a JSON line to stderr",
+    )
+    args = parser.parse_args()
+
+    profiler = Profiler() if args.profile else None
+    sol = read_solution(Solution, args, profiler)
+    sol.time_budget = args.time_budget
+    sol.max_candidates = args.max_candidates
+    sol.occupancy_backend = args.occupancy
+    for _, solution, _ in write_labels(sol, args):
+        if args.metrics:
+            print(json.dumps(solution.metrics), file=sys.stderr)
+    if profiler is not None:
+        profiler.write(args.profile)
@@ -1,72 +1,118 @@
-import argparse
+import copy
+import sys
 
 import numpy as np
 
-from src.plot_routes import parse_routes
-
-
-class Solution:
-    def __init__(self, routes):
-        self.routes = []
-        # ToDo: We should read each line directly as numpy arrays
-        # And then reshape
-        for route in routes:
-            self.routes.append(np.array(route))
-
-        self.bbox_center = self.bbox_center()
+from src.cli import argument_parser, read_solution, write_labels
+from src.geometry import segments_cross_rectangles
+from src.incremental import IncrementalRoutes
+from src.profiling import Profiler, phase
+from src.route_set import RouteSet
+from src.spatial_index import RectangleGrid, SegmentGrid
+from src.zoom import ZoomLevels
+
+
+class Solution(ZoomLevels):
+    # Methods timed and counted by a profiler, see Profiler.instrument
+    profiled_phases = {
+        "_simplify_routes": "simplify",
+        "get_label_locations": "placement",
+        "repair_labels": "repair",
+    }
+    profiled_counts = [
+        ("place_label", "labels", None),
+        ("free_quadrants", "candidate_points", len),
+        ("free_quadrants", "rejected_points", lambda free: np.sum(~free.any(axis=1))),
+        ("_first_feasible_label", "fallback_labels", lambda found: found is None),
+        ("rectangles_free_of_routes", "rectangle_tests", len),
+    ]
+
+    # Settings that tile workers copy from this solution, see label_in_tiles
+    tile_parameters = ("max_candidates",)
+    # Constructor arguments giving the label size at the current zoom level
+    size_parameters = ("width", "height", "tolerance")
+
+    def __init__(
+        self,
+        routes,
+        bbox_center=None,
+        profiler=None,
+        width=200,
+        height=100,
+        tolerance=50,
+        simplify_tolerance=None,
+    ):
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.instrument(self, self.profiled_phases, self.profiled_counts)
+
+        if not isinstance(routes, RouteSet):
+            routes = RouteSet.from_routes(routes)
+        self.routes = routes
+
+        # The center can be given when labeling part of a larger set of routes
+        if bbox_center is None:
+            bbox_center = self.bbox_center()
+        self.bbox_center = bbox_center
         self.closest_indices = self.route_points_closest_to_center(
             self.bbox_center, self.routes
         )
 
+        # Given routes, and the index into their coords of every point of
+        # self.routes, None unless the routes are simplified
+        self.original_routes, self.point_ids = self.routes, None
+        if simplify_tolerance:
+            self._simplify_routes(simplify_tolerance * min(width, height))
+
         # Label width and height
         # Taking a bigger value spreads it out
-        self.width = 200
-        self.height = 100
+        self.zoom_level = 1
+        self.width = width
+        self.height = height
 
         # Tolerance for checking overlap
-        self.tolerance = 50
-
-    def route_bbox(self, route):
-        """For a single polyline return bounding box
-
-        Args:
-            route (2D numpy.array): Polyline as numpy array
-
-        Returns:
-            bbox: Tuple of size 4, with first 2 coords as left bottom
-                and last 2 as right top
+        self.tolerance = tolerance
+
+        # Route points tried per label, tested in batches that double in size
+        # At most this many route points are tried per label, all by default.
+        # Labels that find no free position are marked as fallback labels
+        self.max_candidates = None
+        self.first_batch_size = 4
+
+        # Rectangle queries only look at route segments in nearby buckets
+        with phase(profiler, "segment_index"):
+            self.segment_index = SegmentGrid(
+                *self.routes.segments(), self.width, self.height
+            )
+
+    def label_extent(self):
+        """Width and height of the area a label claims, including tolerance"""
+        return self.width + self.tolerance, self.height + self.tolerance
+
+    def _simplify_routes(self, tolerance):
+        """Replace the routes by fewer of their points, see RouteSet.simplify
+
+        The point of every route closest to the center is kept and labels
+        always sit on points of the given routes. Rectangles are tested
+        against the simplified routes, which stay within tolerance of them,
+        and against the given points of their own route around the label,
+        see _crosses_original_route.
         """
-        return (
-            np.min(route[:, 0]),
-            np.min(route[:, 1]),
-            np.max(route[:, 0]),
-            np.max(route[:, 1]),
+        self.routes, self.point_ids, self.closest_indices = (
+            self.routes.simplify_keeping(tolerance, self.closest_indices)
         )
 
     def bbox(self, routes):
         """Get bbox of all routes
 
         Args:
-            routes (List of 2D numpy.array): List of all Polylines (each is numpy array)
+            routes (RouteSet): All Polylines
 
         Returns:
             bbox: Tuple of size 4, with first 2 coords as left bottom
                 and last 2 as right top
-
-        ToDo: These are all ints, we should use Int specialization
         """
-        bbox_routes = self.route_bbox(routes[0])
-        if len(routes) > 1:
-            for route in routes:
-                bbox_route = self.route_bbox(route)
-                bbox_routes = (
-                    np.min([bbox_routes[0], bbox_route[0]]),
-                    np.min([bbox_routes[1], bbox_route[1]]),
-                    np.max([bbox_routes[2], bbox_route[2]]),
-                    np.max([bbox_routes[3], bbox_route[3]]),
-                )
-
-        return bbox_routes
+        return routes.bbox()
 
     def bbox_center(self):
         bbox = self.bbox(self.routes)
@@ -76,67 +122,107 @@ class Solution:
     def line_rectangle_intersection(
         self, line_points, rect_left, rect_top, rect_width, rect_height
     ):
-        rect_right = rect_left + rect_width
-        rect_bottom = rect_top + rect_height
+        """Returns 1 if the polyline passes through the inside of the rectangle
+
+        Segments are tested, not only points, so coarse lines are handled
+        """
+        if len(line_points) == 1:
+            starts = ends = line_points
+        else:
+            starts, ends = line_points[:-1], line_points[1:]
 
-        # We may have to refine points for a coarse line
         if np.any(
-            (line_points[:, 0] < rect_right)
-            & (line_points[:, 0] > rect_left)
-            & (line_points[:, 1] < rect_bottom)
-            & (line_points[:, 1] > rect_top)
+            segments_cross_rectangles(
+                starts,
+                ends,
+                rect_left,
+                rect_top,
+                rect_left + rect_width,
+                rect_top + rect_height,
+            )
         ):
             return 1
         else:
             return 0
 
     def route_points_closest_to_center(self, bbox_center, routes):
-        closest_indices = []
-        for route in routes:
-            distances = np.linalg.norm(route - bbox_center, axis=1)
-            closest_index = np.argmin(distances)
-            closest_indices.append(closest_index)
-
-        return closest_indices
-
-    def routes_rectangle_intersection_at_point(self, routes, origin, width, height):
-        flag = 1
-        for route in routes:
-            if self.line_rectangle_intersection(
-                route,
-                origin[0],
-                origin[1],
-                width,
-                height,
-            ):
-                flag = 0
-                break
-        return flag
+        return routes.closest_point_indices(bbox_center)
 
-    def find_intersection_with_4_rectangles_at_point(
-        self, origin, width, height, routes
-    ):
-        if self.routes_rectangle_intersection_at_point(
-            routes, (origin[0] - width, origin[1] - height), width, height
-        ):
-            return (origin[0] - width, origin[1] - height)
-        if self.routes_rectangle_intersection_at_point(
-            routes, (origin[0], origin[1] - height), width, height
-        ):
-            return (origin[0], origin[1] - height)
-        if self.routes_rectangle_intersection_at_point(
-            routes, (origin[0] - width, origin[1]), width, height
-        ):
-            return (origin[0] - width, origin[1])
-        if self.routes_rectangle_intersection_at_point(routes, origin, width, height):
-            return origin
+    def index_rectangles_intersection(self, segment_index, lefts, tops, width, height):
+        """Check many rectangles against the segments of an index at once
 
-        # Return None if there is an intersection
-        return None
+        Candidate segments of all rectangles are gathered from the index
+        and tested in a single segment-rectangle intersection call.
+
+        Returns:
+            intersects: Boolean array, True where a segment passes through
+                the inside of the rectangle
+        """
+        lefts, tops = np.asarray(lefts), np.asarray(tops)
+        rights, bottoms = lefts + width, tops + height
+        rectangle_ids, segment_ids = segment_index.query_pairs(
+            lefts, tops, rights, bottoms
+        )
+        crosses = segments_cross_rectangles(
+            segment_index.starts[segment_ids],
+            segment_index.ends[segment_ids],
+            lefts[rectangle_ids],
+            tops[rectangle_ids],
+            rights[rectangle_ids],
+            bottoms[rectangle_ids],
+        )
 
-    def get_route_label_origin(self, point, routes):
+        return np.bincount(rectangle_ids[crosses], minlength=len(lefts)) > 0
+
+    def rectangles_free_of_routes(self, lefts, tops, width, height):
+        """Boolean array, True for rectangles that no route passes through"""
+        return ~self.index_rectangles_intersection(
+            self.segment_index, lefts, tops, width, height
+        )
+
+    def routes_rectangle_intersection_at_point(self, origin, width, height):
+        """Returns 1 if no route passes through the rectangle, else 0"""
+        return int(
+            self.rectangles_free_of_routes([origin[0]], [origin[1]], width, height)[0]
+        )
+
+    def quadrant_origins(self, points, width, height):
+        """Top left corners of the 4 rectangles with a corner at each point
+
+        Returns:
+            origins: Array of shape (number of points, 4, 2), in the order
+                the quadrants are tried
+        """
+        points = np.asarray(points).reshape(-1, 1, 2)
+        shifts = np.array([[-width, -height], [0, -height], [-width, 0], [0, 0]])
+
+        return points + shifts
+
+    def free_quadrants(self, points, width, height):
+        """For a batch of points which of the 4 quadrant rectangles are free of routes
+
+        Returns:
+            free: Boolean array of shape (number of points, 4)
+        """
+        origins = self.quadrant_origins(points, width, height).reshape(-1, 2)
+        free = self.rectangles_free_of_routes(
+            origins[:, 0], origins[:, 1], width, height
+        )
+
+        return free.reshape(-1, 4)
+
+    def find_intersection_with_4_rectangles_at_point(self, origin, width, height):
+        free = self.free_quadrants([origin], width, height)[0]
+        if not np.any(free):
+            # Return None if there is an intersection
+            return None
+
+        quadrant = np.argmax(free)
+        return tuple(self.quadrant_origins([origin], width, height)[0, quadrant])
+
+    def get_route_label_origin(self, point):
         return self.find_intersection_with_4_rectangles_at_point(
-            point, self.width, self.height, routes
+            point, self.width, self.height
         )
 
     def get_label_position(self, route_point, rectangle_point):
@@ -151,109 +237,414 @@ class Solution:
 
         return f"{prefix}-{suffix}"
 
-    def check_rectangle_overlap(self, rect_left, rect_top, rect_width, rect_height):
-        num_rectangles = len(rect_left)
-        if num_rectangles == 1:
+    def candidate_indices(self, it):
+        """Route point indices to try for a label, best first
+
+        We move away from the point closest to the center, trying both
+        directions in turn, see RouteSet.points_around.
+        """
+        return self.routes.points_around(
+            it, self.closest_indices[it], self.max_candidates
+        )
+
+    def _crosses_original_route(self, it, index, origin):
+        """Whether the unsimplified route passes through a label at its point
+
+        Only the given points between the neighbours of the point on the
+        simplified route are tested. Close to its own point a label is
+        crossed by the route wherever it deviates from the simplified one.
+        """
+        if self.point_ids is None:
             return False
 
-        for i in range(num_rectangles):
-            left_i = rect_left[i]
-            top_i = rect_top[i]
-            right_i = left_i + rect_width
-            bottom_i = top_i + rect_height
-
-            for j in range(i + 1, num_rectangles):
-                left_j = rect_left[j]
-                top_j = rect_top[j]
-                right_j = left_j + rect_width
-                bottom_j = top_j + rect_height
-
-                # Check if rectangles i and j overlap
-                if not (
-                    left_i > right_j
-                    or right_i < left_j
-                    or top_i > bottom_j
-                    or bottom_i < top_j
+        point = self.routes.offsets[it] + index
+        first = self.point_ids[max(point - 1, self.routes.offsets[it])]
+        last = self.point_ids[min(point + 1, self.routes.offsets[it + 1] - 1)]
+        return self.line_rectangle_intersection(
+            self.original_routes.coords[first : last + 1],
+            origin[0],
+            origin[1],
+            self.width,
+            self.height,
+        )
+
+    def _first_feasible_label(self, it, indices, placed_rectangles):
+        """Best candidate whose label is free of routes and placed labels
+
+        Candidates are scored in batches, all quadrants of all points of a
+        batch against the routes at once. Only rectangles free of routes
+        are then checked against placed labels, in order.
+
+        Returns:
+            point_index, rectangle_origin: None if no candidate is feasible
+        """
+        route = self.routes[it]
+        start, batch_size = 0, self.first_batch_size
+        while start < len(indices):
+            points = route[indices[start : start + batch_size]]
+            free = self.free_quadrants(points, self.width, self.height)
+            origins = self.quadrant_origins(points, self.width, self.height)
+            # Row major order, so by candidate first and then by quadrant
+            for point_id, quadrant in np.argwhere(free):
+                origin = tuple(origins[point_id, quadrant])
+                if self._crosses_original_route(it, indices[start + point_id], origin):
+                    continue
+                if not placed_rectangles.overlaps(
+                    origin[0] - self.tolerance, origin[1] - self.tolerance
                 ):
-                    return 1
+                    return indices[start + point_id], origin
 
-        return 0
+            start += batch_size
+            batch_size *= 2
 
-    def write_label_locations(self, output_path):
-        label_dict = {}
-        # To check for rectangle overlap
-        rect_left = []
-        rect_top = []
-        for it, route in enumerate(self.routes):
-            counter = 0
-            while True:
-                # Move away from center point if we don't find a match
-                closest_point = route[self.closest_indices[it] + counter]
-                # Find origin of label rectangle
-                # If no rectangle, we get None
-                rectangle_origin = self.get_route_label_origin(
-                    closest_point, self.routes
+        return None
+
+    def place_label(self, it, placed_rectangles):
+        """Find a label for a route and add its rectangle to placed_rectangles
+
+        See find_label.
+        """
+        label = self.find_label(it, placed_rectangles)
+        placed_rectangles.insert(label["rect_left"], label["rect_top"])
+
+        return label
+
+    def find_label(self, it, placed_rectangles):
+        """Label of a route free of routes and of placed_rectangles
+
+        If none of the candidates is feasible, the label is put at the first
+        candidate anyway, so every route gets a label. It can then overlap
+        routes or labels and is marked with fallback set.
+        """
+        route = self.routes[it]
+        indices = self.candidate_indices(it)
+        found = self._first_feasible_label(it, indices, placed_rectangles)
+        if found is None:
+            point_index = indices[0]
+            closest_point = route[point_index]
+            rectangle_origin = self.get_route_label_origin(closest_point)
+            if rectangle_origin is None:
+                rectangle_origin = tuple(
+                    self.quadrant_origins(closest_point, self.width, self.height)[0, 0]
                 )
+        else:
+            point_index, rectangle_origin = found
+            closest_point = route[point_index]
+
+        rect_left = rectangle_origin[0] - self.tolerance
+        rect_top = rectangle_origin[1] - self.tolerance
+
+        label_position = self.get_label_position(closest_point, rectangle_origin)
+        return {
+            "point_x": closest_point[0],
+            "point_y": closest_point[1],
+            "position": label_position,
+            "point_index": int(point_index),
+            "rect_left": rect_left,
+            "rect_top": rect_top,
+            "fallback": found is None,
+        }
+
+    def _new_placed_rectangles(self):
+        # Placed labels, to check for rectangle overlap
+        return RectangleGrid(self.width + self.tolerance, self.height + self.tolerance)
 
-                if rectangle_origin is not None:
-                    rect_left.append(rectangle_origin[0] - self.tolerance)
-                    rect_top.append(rectangle_origin[1] - self.tolerance)
-                    check_overlap = self.check_rectangle_overlap(
-                        rect_left,
-                        rect_top,
-                        self.width + self.tolerance,
-                        self.height + self.tolerance,
-                    )
-                    if check_overlap:
-                        rect_left.pop()
-                        rect_top.pop()
-                    else:
-                        break
-
-                # We want to both try positive and Negative direction
-                if counter > 0:
-                    closest_point = route[self.closest_indices[it] - counter]
-                    rectangle_origin = self.get_route_label_origin(
-                        closest_point, self.routes
-                    )
-                    if rectangle_origin is not None:
-                        rect_left.append(rectangle_origin[0] - self.tolerance)
-                        rect_top.append(rectangle_origin[1] - self.tolerance)
-                        check_overlap = self.check_rectangle_overlap(
-                            rect_left,
-                            rect_top,
-                            self.width + self.tolerance,
-                            self.height + self.tolerance,
-                        )
-                        if check_overlap:
-                            rect_left.pop()
-                            rect_top.pop()
-                        else:
-                            break
-
-                counter += 1
-
-            label_position = self.get_label_position(closest_point, rectangle_origin)
-            label_dict[it] = {
-                "point_x": closest_point[0],
-                "point_y": closest_point[1],
-                "position": label_position,
-            }
-
-        with open(output_path, "w") as fp:
-            for it in range(len(self.routes)):
-                fp.write(
-                    f"""{label_dict[it]["point_x"]} {label_dict[it]["point_y"]} {label_dict[it]["position"]}\n"""
+    def get_label_locations(self, route_indices=None):
+        """Place labels for the given routes, all routes by default
+
+        Labels are placed in the given order. All routes still count
+        for intersections, also the ones that are not labeled.
+
+        Returns:
+            label_dict: Label for each route index, with the anchor point,
+                the position and the rectangle including tolerance
+        """
+        if route_indices is None:
+            route_indices = range(len(self.routes))
+
+        placed_rectangles = self._new_placed_rectangles()
+        label_dict = {}
+        for it in route_indices:
+            label_dict[it] = self.place_label(it, placed_rectangles)
+
+        return label_dict
+
+    def label_rectangles(self, labels):
+        """Left, top, right and bottom of each label including tolerance"""
+        corners = np.array(
+            [(label["rect_left"], label["rect_top"]) for label in labels], dtype=float
+        ).reshape(-1, 2)
+
+        return np.hstack([corners, corners + self.label_extent()])
+
+    def repair_labels(self, label_dict, revisit=None):
+        """Replay labels placed independently and re-place conflicting ones
+
+        Labels not in revisit are known to be valid and are kept, by default
+        all labels are revisited. Revisited labels are replayed in route
+        order. A label is kept if its rectangle is free of routes and of
+        labels kept before it, otherwise it is placed again as in
+        get_label_locations.
+
+        Returns:
+            label_dict, num_replaced: Valid labels and how many were re-placed
+        """
+        placed_rectangles = self._new_placed_rectangles()
+        revisit = set(label_dict if revisit is None else revisit)
+        repaired_dict = {}
+        for it, label in label_dict.items():
+            if it not in revisit:
+                placed_rectangles.insert(label["rect_left"], label["rect_top"])
+                repaired_dict[it] = label
+
+        num_replaced = 0
+        for it in sorted(revisit):
+            rect_left, rect_top = (
+                label_dict[it]["rect_left"],
+                label_dict[it]["rect_top"],
+            )
+            rectangle_origin = (rect_left + self.tolerance, rect_top + self.tolerance)
+            point_index = label_dict[it]["point_index"]
+            if (
+                self.routes_rectangle_intersection_at_point(
+                    rectangle_origin, self.width, self.height
                 )
+                and not self._crosses_original_route(it, point_index, rectangle_origin)
+                and not placed_rectangles.overlaps(rect_left, rect_top)
+            ):
+                placed_rectangles.insert(rect_left, rect_top)
+                repaired_dict[it] = label_dict[it]
+            else:
+                repaired_dict[it] = self.place_label(it, placed_rectangles)
+                num_replaced += 1
+
+        return dict(sorted(repaired_dict.items())), num_replaced
+
+
+class IncrementalSolution(IncrementalRoutes, Solution):
+    """Solution that keeps its layout up to date while routes change
+
+    The segment index and the placed labels are kept between updates, and
+    an update only places labels again for routes whose neighbourhood
+    changed: the changed route itself, routes whose label rectangle is now
+    hit by a route, and routes whose label search starts close to a
+    removed route.
+
+    Route ids are positions in self.routes and stay valid. Removed routes
+    keep their id and are skipped. The bbox center is fixed at construction.
+    """
+
+    def __init__(
+        self,
+        routes,
+        bbox_center=None,
+        profiler=None,
+        width=200,
+        height=100,
+        tolerance=50,
+    ):
+        super().__init__(routes, bbox_center, profiler, width, height, tolerance)
+        self.removed_routes = set()
+        # Routes added or updated since segment_index was built are kept in
+        # their own small index, their old segments are deactivated in
+        # segment_index, see _update_changed_segment_index
+        self.changed_routes = {}
+        self.changed_segment_index = None
+        self._indexed_segment_offsets = self.routes.segment_offsets()
+        # Current layout, created on first use
+        self.label_dict = None
+
+    def for_zoom_level(self, zoom_level):
+        solution = super().for_zoom_level(zoom_level)
+        solution.segment_index = copy.copy(self.segment_index)
+        solution.segment_index.active = self.segment_index.active.copy()
+        solution.removed_routes = set(self.removed_routes)
+        solution.changed_routes = dict(self.changed_routes)
+        solution.label_dict = None
+
+        return solution
+
+    def rectangles_free_of_routes(self, lefts, tops, width, height):
+        free = super().rectangles_free_of_routes(lefts, tops, width, height)
+        if self.changed_segment_index is not None:
+            free &= ~self.index_rectangles_intersection(
+                self.changed_segment_index, lefts, tops, width, height
+            )
+
+        return free
+
+    def get_label_locations(self, route_indices=None):
+        if route_indices is None:
+            route_indices = self.active_routes()
+
+        return super().get_label_locations(route_indices)
+
+    def _ensure_layout(self):
+        if self.label_dict is not None:
+            return
+
+        self._placed_rectangles = self._new_placed_rectangles()
+        # Index in _placed_rectangles of the label of each route
+        self._label_rectangles = {}
+        self.label_dict = {}
+        self._relabel(self.active_routes())
+
+    def _unplace_label(self, route_id):
+        if route_id in self.label_dict:
+            del self.label_dict[route_id]
+            self._placed_rectangles.remove(self._label_rectangles.pop(route_id))
+
+    def _relabel(self, route_ids):
+        """Place labels of the given routes again, in route order"""
+        route_ids = sorted(route_ids)
+        for it in route_ids:
+            self._unplace_label(it)
+
+        for it in route_ids:
+            label = self.find_label(it, self._placed_rectangles)
+            self.label_dict[it] = label
+            self._label_rectangles[it] = self._placed_rectangles.insert(
+                label["rect_left"], label["rect_top"]
+            )
+
+        return route_ids
+
+    def _remove_route_segments(self, route_id):
+        if route_id in self.changed_routes:
+            del self.changed_routes[route_id]
+            self._update_changed_segment_index()
+        else:
+            first, last = self._indexed_segment_offsets[route_id : route_id + 2]
+            self.segment_index.active[first:last] = False
+
+    def _store_route(self, route_id, route):
+        super()._store_route(route_id, route)
+        self.changed_routes[route_id] = self.routes[route_id]
+        self._update_changed_segment_index()
+
+    def _update_changed_segment_index(self):
+        """Index the changed routes, or merge them into segment_index
+
+        The small index is rebuilt on every update, so once it holds more
+        than the square root of the number of indexed segments, all routes
+        are indexed again in segment_index. That bounds the cost per update
+        to O(sqrt(segments)) on average.
+        """
+        if not self.changed_routes:
+            self.changed_segment_index = None
+            return
+
+        starts, ends = RouteSet.from_routes(
+            list(self.changed_routes.values())
+        ).segments()
+        if len(starts) ** 2 > len(self.segment_index.starts):
+            self._index_all_routes()
+        else:
+            self.changed_segment_index = SegmentGrid(
+                starts, ends, self.width, self.height
+            )
+
+    def _index_all_routes(self):
+        """Index the segments of all routes in segment_index, hiding removed ones"""
+        self.segment_index = SegmentGrid(
+            *self.routes.segments(), self.width, self.height
+        )
+        self._indexed_segment_offsets = self.routes.segment_offsets()
+        for it in self.removed_routes:
+            first, last = self._indexed_segment_offsets[it : it + 2]
+            self.segment_index.active[first:last] = False
+        self.changed_routes = {}
+        self.changed_segment_index = None
+
+    def _labels_hit_by(self, route_id):
+        """Routes whose label rectangle is hit by a route"""
+        route = self.routes[route_id]
+        left, top, right, bottom = RouteSet.from_routes([route]).bbox()
+        candidates = np.array(
+            sorted(self._placed_rectangles.query(left, top, right, bottom)),
+            dtype=np.int64,
+        )
+        lefts = np.asarray(self._placed_rectangles.left)[candidates] + self.tolerance
+        tops = np.asarray(self._placed_rectangles.top)[candidates] + self.tolerance
+
+        # All segments of the route against all candidate labels at once
+        starts, ends = RouteSet.from_routes([route]).segments()
+        crosses = segments_cross_rectangles(
+            starts,
+            ends,
+            lefts[:, None],
+            tops[:, None],
+            lefts[:, None] + self.width,
+            tops[:, None] + self.height,
+        )
+        hit = set(candidates[np.any(crosses, axis=1)].tolist())
+
+        return [it for it, index in self._label_rectangles.items() if index in hit]
+
+    def add_route(self, route):
+        """Add a route and label it
+
+        Returns:
+            route_id, relabeled: Id of the new route and the ids of all
+                routes whose label was placed
+        """
+        self._ensure_layout()
+        route_id = len(self.routes)
+        self._store_route(route_id, route)
+
+        return route_id, self._relabel(self._labels_hit_by(route_id) + [route_id])
+
+    def remove_route(self, route_id):
+        """Remove a route and its label
+
+        Returns:
+            relabeled: Ids of the routes whose label was placed again
+        """
+        self._ensure_layout()
+        self._remove_route_segments(route_id)
+        self._unplace_label(route_id)
+        self.removed_routes.add(route_id)
+
+        return self._relabel(self._routes_starting_near(self.routes[route_id]))
+
+    def update_route(self, route_id, route):
+        """Replace the points of a route and label it again
+
+        Returns:
+            relabeled: Ids of the routes whose label was placed again
+        """
+        self._ensure_layout()
+        self._remove_route_segments(route_id)
+        self._unplace_label(route_id)
+        near_old_route = self._routes_starting_near(self.routes[route_id])
+        self._store_route(route_id, route)
+
+        return self._relabel(
+            set(near_old_route + self._labels_hit_by(route_id) + [route_id])
+        )
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("routes_path", type=str)
-    parser.add_argument("output_path", type=str)
+    parser = argument_parser()
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        help="Route points tried per label before giving up on a free spot, "
+        "all by default. Labels that give up can collide and are reported",
+    )
     args = parser.parse_args()
 
-    parsed_routes = parse_routes(args.routes_path)
-
-    sol = Solution(parsed_routes)
-    sol.write_label_locations(args.output_path)
+    profiler = Profiler() if args.profile else None
+    sol = read_solution(Solution, args, profiler)
+    sol.max_candidates = args.max_candidates
+    for zoom_level, _, label_dict in write_labels(sol, args):
+        num_fallback = sum(label["fallback"] for label in label_dict.values())
+        if num_fallback:
+            print(
+                f"Zoom level {zoom_level}: {num_fallback} labels found no free "
+                "position and can collide, try a larger --max-candidates",
+                file=sys.stderr,
+            )
+
+    if profiler is not None:
+        profiler.write(args.profile)
@@ -0,0 +1,373 @@
+import argparse
+import os
+import struct
+
+import numpy as np
+
+# Files are parsed in chunks of this many bytes to bound peak memory
+PARSE_CHUNK_SIZE = 16 * 2**20
+
+# Binary routes: header, int64 offsets of size number of routes + 1,
+# then int32 x y pairs of all points. Binary labels: header, int32 x,
+# int32 y and uint8 position codes, each an array with one value per label.
+ROUTES_MAGIC = b"GTRT"
+LABELS_MAGIC = b"GTLB"
+FORMAT_VERSION = 1
+_ROUTES_HEADER = struct.Struct("<4sIQQ")
+_LABELS_HEADER = struct.Struct("<4sIQ")
+# Labels are written in binary for output paths with this extension
+BINARY_EXTENSION = ".bin"
+# Position of a label at its route point, by code in binary labels
+POSITIONS = ("bottom-right", "bottom-left", "top-right", "top-left")
+
+
+def _parse_route_lines(buffer, dtype):
+    """Parse complete lines of integers into flat values and tokens per line"""
+    values = np.fromstring(buffer, dtype=dtype, sep=" ")
+
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    # Whitespace bytes (space, tab, newline, carriage return) are all <= 32
+    is_space = data <= 32
+    token_starts = np.flatnonzero(~is_space & np.concatenate(([True], is_space[:-1])))
+    line_ends = np.append(np.flatnonzero(data == ord("\n")), len(data))
+    tokens_per_line = np.diff(np.searchsorted(token_starts, line_ends), prepend=0)
+
+    if len(values) != len(token_starts):
+        raise ValueError("Routes file contains tokens that are not integers")
+    return values, tokens_per_line
+
+
+def _parsed_chunks(path, dtype, chunk_size):
+    """Values and tokens per line of the complete lines of each chunk of a file"""
+    remainder = b""
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            # Only parse complete lines, the rest is carried over to the next chunk
+            complete = chunk.rfind(b"\n") + 1
+            remainder = chunk[complete:]
+            # Lines without tokens are skipped anyway, and numpy parses an
+            # empty buffer as a single 0
+            if chunk[:complete].strip():
+                yield _parse_route_lines(chunk[: complete - 1], dtype)
+
+    if remainder.strip():
+        yield _parse_route_lines(remainder, dtype)
+
+
+def _routes_of_lines(values, tokens_per_line):
+    """Coordinates and offsets of parsed lines, empty lines are skipped"""
+    tokens_per_line = tokens_per_line[tokens_per_line > 0]
+    if np.any(tokens_per_line % 2):
+        raise ValueError("Every route needs an even number of coordinates")
+
+    offsets = np.concatenate(([0], np.cumsum(tokens_per_line // 2)))
+    return values.reshape(-1, 2), offsets
+
+
+def parse_routes_array(path, dtype=np.int64, chunk_size=PARSE_CHUNK_SIZE):
+    """Parse routes straight into one contiguous coordinate array
+
+    Every line holds one route as x y pairs, empty lines are skipped.
+
+    Returns:
+        coords, offsets: coords is an (N, 2) array with the points of all routes,
+            route i is coords[offsets[i]:offsets[i + 1]]
+    """
+    values = []
+    tokens_per_line = []
+    for chunk_values, chunk_tokens in _parsed_chunks(path, dtype, chunk_size):
+        values.append(chunk_values)
+        tokens_per_line.append(chunk_tokens)
+
+    tokens_per_line = (
+        np.concatenate(tokens_per_line)
+        if tokens_per_line
+        else np.zeros(0, dtype=np.int64)
+    )
+    values = np.concatenate(values) if values else np.zeros(0, dtype=dtype)
+
+    return _routes_of_lines(values, tokens_per_line)
+
+
+def iter_routes(path, chunk_size=PARSE_CHUNK_SIZE):
+    """Routes of a text or binary routes file, a chunk of whole routes at a time
+
+    Only one chunk is in memory at a time. A chunk holds the routes of
+    about chunk_size bytes of the file, or one route if it is longer.
+
+    Yields:
+        coords, offsets: As for parse_routes_array, for the routes of a chunk
+    """
+    if not _has_magic(path, ROUTES_MAGIC):
+        for values, tokens_per_line in _parsed_chunks(path, np.int64, chunk_size):
+            coords, offsets = _routes_of_lines(values, tokens_per_line)
+            if len(offsets) > 1:
+                yield coords, offsets
+        return
+
+    coords, offsets = read_routes_binary(path)
+    # A point takes 8 bytes in binary files
+    points_per_chunk = max(chunk_size // 8, 1)
+    first, num_routes = 0, len(offsets) - 1
+    while first < num_routes:
+        last = np.searchsorted(offsets, offsets[first] + points_per_chunk, "right") - 1
+        last = min(max(last, first + 1), num_routes)
+        chunk_offsets = np.array(offsets[first : last + 1])
+        yield np.array(coords[chunk_offsets[0] : chunk_offsets[-1]]), (
+            chunk_offsets - chunk_offsets[0]
+        )
+        first = last
+
+
+def write_label_lines(file, label_dict):
+    for it in sorted(label_dict):
+        label = label_dict[it]
+        file.write(f'{label["point_x"]} {label["point_y"]} {label["position"]}\n')
+
+
+def write_labels(path, label_dict):
+    with open(path, "w") as file:
+        write_label_lines(file, label_dict)
+
+
+def zoom_output_path(path, zoom):
+    # labels.txt at zoom level 2 becomes labels_zoom2.txt
+    root, extension = os.path.splitext(path)
+    return f"{root}_zoom{zoom}{extension}"
+
+
+def _check_int32(values, what):
+    info = np.iinfo(np.int32)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(f"{what} do not fit into 32 bit integers")
+
+
+def _has_magic(path, magic):
+    with open(path, "rb") as file:
+        return file.read(len(magic)) == magic
+
+
+def _read_header(path, header, magic):
+    with open(path, "rb") as file:
+        fields = header.unpack(file.read(header.size))
+    if fields[0] != magic:
+        raise ValueError(f"{path} is not a binary file of this kind")
+    if fields[1] != FORMAT_VERSION:
+        raise ValueError(f"{path} has unsupported format version {fields[1]}")
+
+    return fields[2:]
+
+
+def _map_array(path, dtype, offset, count):
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def write_routes_binary(path, coords, offsets):
+    coords = np.asarray(coords).reshape(-1, 2)
+    _check_int32(coords.ravel(), "Route coordinates")
+    with open(path, "wb") as file:
+        file.write(
+            _ROUTES_HEADER.pack(
+                ROUTES_MAGIC, FORMAT_VERSION, len(offsets) - 1, len(coords)
+            )
+        )
+        file.write(np.asarray(offsets, dtype="<i8").tobytes())
+        file.write(np.ascontiguousarray(coords, dtype="<i4").tobytes())
+
+
+def read_routes_binary(path):
+    """Memory map a binary routes file
+
+    Nothing is read up front, the arrays are read only views of the file.
+
+    Returns:
+        coords, offsets: As for parse_routes_array, coords are int32
+    """
+    num_routes, num_points = _read_header(path, _ROUTES_HEADER, ROUTES_MAGIC)
+    offsets = _map_array(path, "<i8", _ROUTES_HEADER.size, num_routes + 1)
+    coords = _map_array(
+        path, "<i4", _ROUTES_HEADER.size + 8 * (num_routes + 1), 2 * num_points
+    )
+
+    return coords.reshape(-1, 2), offsets
+
+
+def read_routes(path):
+    """Routes of a text or binary routes file, see parse_routes_array"""
+    if _has_magic(path, ROUTES_MAGIC):
+        return read_routes_binary(path)
+    return parse_routes_array(path)
+
+
+def parse_routes(path):
+    """Routes as lists of [x, y] points, for callers of the former parser
+
+    Solutions take these lists as well as the arrays of read_routes,
+    which are faster to build and smaller.
+    """
+    coords, offsets = read_routes(path)
+    return [coords[start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def write_routes_text(path, coords, offsets):
+    with open(path, "w") as file:
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            file.write(" ".join(map(str, coords[start:end].ravel().tolist())) + "\n")
+
+
+def labels_as_arrays(label_dict):
+    """Labels in route order as arrays
+
+    Returns:
+        x, y, codes: Label points and uint8 position codes into POSITIONS
+    """
+    keys = sorted(label_dict)
+    x = np.array([label_dict[it]["point_x"] for it in keys])
+    y = np.array([label_dict[it]["point_y"] for it in keys])
+    codes = np.array(
+        [POSITIONS.index(label_dict[it]["position"]) for it in keys], dtype=np.uint8
+    )
+
+    return x, y, codes
+
+
+class LabelFileWriter:
+    """Write the labels of consecutive routes chunk by chunk
+
+    Labels are written as text, or binary if the path ends with
+    BINARY_EXTENSION, like write_label_file. Binary files hold all x
+    before all y, so the number of labels has to be known up front.
+    """
+
+    def __init__(self, path, num_labels, binary=None):
+        if binary is None:
+            binary = os.path.splitext(path)[1] == BINARY_EXTENSION
+        self.binary = binary
+        self.num_labels = num_labels
+        self.num_written = 0
+        self.file = open(path, "wb" if binary else "w")
+        if binary:
+            self.file.write(
+                _LABELS_HEADER.pack(LABELS_MAGIC, FORMAT_VERSION, num_labels)
+            )
+
+    def write(self, label_dict):
+        """Write labels of the routes following the ones written before"""
+        if not self.binary:
+            write_label_lines(self.file, label_dict)
+            self.num_written += len(label_dict)
+            return
+
+        x, y, codes = labels_as_arrays(label_dict)
+        x, y = x.astype(np.int64), y.astype(np.int64)
+        _check_int32(x, "Label points")
+        _check_int32(y, "Label points")
+        if self.num_written + len(codes) > self.num_labels:
+            raise ValueError("More labels written than announced")
+
+        start = _LABELS_HEADER.size
+        for values, array_start in (
+            (x.astype("<i4"), start),
+            (y.astype("<i4"), start + 4 * self.num_labels),
+            (codes, start + 8 * self.num_labels),
+        ):
+            self.file.seek(array_start + values.itemsize * self.num_written)
+            self.file.write(values.tobytes())
+        self.num_written += len(codes)
+
+    def close(self):
+        self.file.close()
+        if self.num_written != self.num_labels:
+            raise ValueError(
+                f"{self.num_written} labels written, {self.num_labels} announced"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+def write_labels_binary(path, label_dict):
+    with LabelFileWriter(path, len(label_dict), binary=True) as writer:
+        writer.write(label_dict)
+
+
+def write_label_file(path, label_dict):
+    """Write labels as text, or binary if path ends with BINARY_EXTENSION"""
+    if os.path.splitext(path)[1] == BINARY_EXTENSION:
+        write_labels_binary(path, label_dict)
+    else:
+        write_labels(path, label_dict)
+
+
+def read_labels(path):
+    """Labels of a text or binary labels file
+
+    Returns:
+        points, positions: (N, 2) array of label points and a list of
+            position names
+    """
+    if not _has_magic(path, LABELS_MAGIC):
+        with open(path) as file:
+            rows = [line.split() for line in file if line.strip()]
+        values = [[x, y] for x, y, _ in rows]
+        try:
+            points = np.array(values, dtype=np.int64)
+        except ValueError:
+            points = np.array(values, dtype=np.float64)
+        return points.reshape(-1, 2), [position for _, _, position in rows]
+
+    (num_labels,) = _read_header(path, _LABELS_HEADER, LABELS_MAGIC)
+    offset = _LABELS_HEADER.size
+    x = _map_array(path, "<i4", offset, num_labels)
+    y = _map_array(path, "<i4", offset + 4 * num_labels, num_labels)
+    codes = _map_array(path, np.uint8, offset + 8 * num_labels, num_labels)
+
+    return np.column_stack([x, y]), [POSITIONS[code] for code in codes]
+
+
+def _labels_as_dict(points, positions):
+    return {
+        it: {"point_x": x, "point_y": y, "position": position}
+        for it, ((x, y), position) in enumerate(zip(points.tolist(), positions))
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert routes or labels between text and binary files"
+    )
+    parser.add_argument("kind", choices=["routes", "labels"])
+    parser.add_argument("input_path", type=str)
+    parser.add_argument("output_path", type=str)
+    parser.add_argument(
+        "--to",
+        choices=["binary", "text"],
+        default="binary",
+        help="Format of the output file",
+    )
+    args = parser.parse_args()
+
+    if args.kind == "routes":
+        coords, offsets = read_routes(args.input_path)
+        if args.to == "binary":
+            write_routes_binary(args.output_path, coords, offsets)
+        else:
+            write_routes_text(args.output_path, coords, offsets)
+    else:
+        label_dict = _labels_as_dict(*read_labels(args.input_path))
+        if args.to == "binary":
+            write_labels_binary(args.output_path, label_dict)
+        else:
+            write_labels(args.output_path, label_dict)
@@ -0,0 +1,256 @@
+import numpy as np
+
+
+class RouteSet:
+    """All routes stored as one flat coordinate array plus offsets
+
+    Route i is coords[offsets[i]:offsets[i + 1]]. Indexing and iterating
+    give views into coords, so routes are never copied, and per route
+    reductions are done for all routes at once with segmented NumPy calls.
+    """
+
+    def __init__(self, coords, offsets):
+        self.coords = np.asarray(coords).reshape(-1, 2)
+        self.offsets = np.asarray(offsets)
+        if np.any(np.diff(self.offsets) <= 0):
+            raise ValueError("Every route needs at least one point")
+        self._segments = None
+
+    @classmethod
+    def from_routes(cls, routes):
+        """Build from a list of polylines, each a list of [x, y] or a 2D numpy.array"""
+        routes = [np.asarray(route).reshape(-1, 2) for route in routes]
+        offsets = np.concatenate([[0], np.cumsum([len(route) for route in routes])])
+
+        return cls(np.concatenate(routes), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.coords[self.offsets[index] : self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def point_indices(self, route_indices):
+        """Indices into coords of the points of the given routes, in order"""
+        route_indices = np.asarray(route_indices, dtype=np.int64)
+        lengths = self.lengths[route_indices]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        starts = np.repeat(self.offsets[route_indices] - offsets[:-1], lengths)
+
+        return starts + np.arange(offsets[-1])
+
+    def subset(self, route_indices):
+        """New RouteSet with copies of the given routes, in the given order"""
+        lengths = self.lengths[np.asarray(route_indices, dtype=np.int64)]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        return RouteSet(self.coords[self.point_indices(route_indices)], offsets)
+
+    @property
+    def lengths(self):
+        """Number of points of every route"""
+        return np.diff(self.offsets)
+
+    def route_ids(self):
+        """Route index of every point in coords"""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def bbox(self):
+        """Get bbox of all routes
+
+        Returns:
+            bbox: Tuple of size 4, with first 2 coords as left bottom
+                and last 2 as right top
+        """
+        lower = self.coords.min(axis=0)
+        upper = self.coords.max(axis=0)
+
+        return lower[0], lower[1], upper[0], upper[1]
+
+    def route_bboxes(self):
+        """Get bbox of every route
+
+        Returns:
+            bboxes: Array of shape (number of routes, 4), each row
+                ordered like bbox
+        """
+        starts = self.offsets[:-1]
+        lower = np.minimum.reduceat(self.coords, starts, axis=0)
+        upper = np.maximum.reduceat(self.coords, starts, axis=0)
+
+        return np.hstack([lower, upper])
+
+    def closest_point_indices(self, point):
+        """For every route the index of its point closest to a given point
+
+        Indices are relative to the start of each route. On ties the
+        first point of the route wins, as with numpy.argmin.
+        """
+        distances = np.sum((self.coords - np.asarray(point)) ** 2, axis=1)
+        closest_distances = np.minimum.reduceat(distances, self.offsets[:-1])
+
+        is_closest = distances == np.repeat(closest_distances, self.lengths)
+        closest_points = np.flatnonzero(is_closest)
+        _, first = np.unique(self.route_ids()[closest_points], return_index=True)
+
+        return closest_points[first] - self.offsets[:-1]
+
+    def points_around(self, route_id, index, max_points=None):
+        """Indices of up to max_points points of a route around a point
+
+        Indices alternate after and before the given point index, so they
+        are sorted by their distance along the route, up to its ends.
+        All points of the route if max_points is None.
+        """
+        num_points = self.lengths[route_id]
+        if max_points is None:
+            max_points = num_points
+        steps = np.arange(1, min(num_points, max_points))
+
+        indices = np.empty(2 * len(steps) + 1, dtype=np.int64)
+        indices[0] = index
+        indices[1::2] = index + steps
+        indices[2::2] = index - steps
+        indices = indices[(indices >= 0) & (indices < num_points)]
+
+        return indices[:max_points]
+
+    def simplify(self, tolerance, keep=None):
+        """Douglas-Peucker simplification of all routes at once
+
+        Only points of the routes are kept, so every point of the simplified
+        routes is exactly a point of these routes, and every removed point is
+        within tolerance of the simplified route. First and last points are
+        always kept. Every round splits all open spans of all routes at their
+        farthest point, with segmented NumPy calls.
+
+        Args:
+            tolerance (float): Largest distance of a removed point from the
+                segment replacing it
+            keep: Indices into coords of points that are kept in any case
+
+        Returns:
+            routes, point_ids: Simplified RouteSet and the index into coords
+                of each of its points, increasing
+        """
+        kept = np.zeros(len(self.coords), dtype=bool)
+        kept[self.offsets[:-1]] = True
+        kept[self.offsets[1:] - 1] = True
+        if keep is not None:
+            kept[np.asarray(keep, dtype=np.int64)] = True
+
+        x, y = self.coords.astype(float).T
+        # Spans between consecutive kept points of a route, with points in between
+        starts = np.flatnonzero(kept)
+        starts, ends = starts[:-1], starts[1:]
+        while True:
+            open_spans = ends - starts > 1
+            starts, ends = starts[open_spans], ends[open_spans]
+            if len(starts) == 0:
+                break
+
+            counts = ends - starts - 1
+            first_inner = np.cumsum(counts) - counts
+            span_ids = np.repeat(np.arange(len(starts)), counts)
+            inner = np.arange(counts.sum()) + (starts - first_inner + 1)[span_ids]
+
+            # Squared distance to the segment, not the line, as a span can be a loop
+            start_x, start_y = x[starts][span_ids], y[starts][span_ids]
+            delta_x = x[ends][span_ids] - start_x
+            delta_y = y[ends][span_ids] - start_y
+            relative_x, relative_y = x[inner] - start_x, y[inner] - start_y
+            lengths = delta_x**2 + delta_y**2
+            along = relative_x * delta_x + relative_y * delta_y
+            along = np.clip(along / np.where(lengths > 0, lengths, 1), 0, 1)
+            offset_x = relative_x - along * delta_x
+            offset_y = relative_y - along * delta_y
+            distances = offset_x**2 + offset_y**2
+
+            # Split every span at its first farthest point if that is too far
+            farthest = np.maximum.reduceat(distances, first_inner)
+            candidates = np.flatnonzero(distances == farthest[span_ids])
+            is_first = np.diff(span_ids[candidates], prepend=-1) > 0
+            splits = inner[candidates[is_first]]
+            is_split = farthest > tolerance**2
+            splits = splits[is_split]
+
+            kept[splits] = True
+            starts, ends = (
+                np.concatenate([starts[is_split], splits]),
+                np.concatenate([splits, ends[is_split]]),
+            )
+
+        point_ids = np.flatnonzero(kept)
+        offsets = np.searchsorted(point_ids, self.offsets)
+        return RouteSet(self.coords[point_ids], offsets), point_ids
+
+    def simplify_keeping(self, tolerance, point_indices):
+        """Simplify as simplify, keeping one given point of every route
+
+        Args:
+            tolerance (float): As for simplify
+            point_indices: Index of the kept point of every route, relative
+                to the start of the route
+
+        Returns:
+            routes, point_ids, point_indices: As for simplify, and the
+                index of the kept point of every simplified route
+        """
+        kept = self.offsets[:-1] + point_indices
+        routes, point_ids = self.simplify(tolerance, keep=kept)
+        point_indices = np.searchsorted(point_ids, kept) - routes.offsets[:-1]
+
+        return routes, point_ids, point_indices
+
+    def segment_offsets(self):
+        """Offsets of the segments of every route into segments()
+
+        Segments of route i are segments()[offsets[i]:offsets[i + 1]].
+        """
+        return np.concatenate([[0], np.cumsum(np.maximum(self.lengths - 1, 1))])
+
+    def segments(self):
+        """Split all routes into segments, in route order
+
+        A route with a single point gives one segment of zero length,
+        so every route point is the end point of at least one segment.
+        The segments are computed once and shared by later calls.
+
+        Returns:
+            starts, ends: 2D numpy arrays with the start and end point of each segment
+        """
+        if self._segments is None:
+            is_single = np.repeat(self.lengths == 1, self.lengths)
+            is_last = np.zeros(len(self.coords), dtype=bool)
+            is_last[self.offsets[1:] - 1] = True
+
+            # Every point starts a segment to the next point, except the last
+            # point of a route. A single point is a segment on its own.
+            starts = np.flatnonzero(~is_last | is_single)
+            ends = starts + ~is_single[starts]
+
+            self._segments = self.coords[starts], self.coords[ends]
+
+        return self._segments
+
+    def with_route(self, route_id, route):
+        """New RouteSet with route_id replaced by route
+
+        The route is appended if route_id is len(self).
+        """
+        route = np.asarray(route, dtype=self.coords.dtype).reshape(-1, 2)
+        lengths = self.lengths
+        if route_id == len(self):
+            start = end = len(self.coords)
+            lengths = np.append(lengths, len(route))
+        else:
+            start, end = self.offsets[route_id], self.offsets[route_id + 1]
+            lengths = lengths.copy()
+            lengths[route_id] = len(route)
+
+        coords = np.concatenate([self.coords[:start], route, self.coords[end:]])
+        return RouteSet(coords, np.concatenate([[0], np.cumsum(lengths)]))
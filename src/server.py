@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.api import ENGINES
+from src.route_io import read_routes, write_label_file, zoom_output_path
+from src.route_set import RouteSet
+
+# Request keys that set a parameter of the solution
+PARAMETERS = ("max_candidates", "time_budget")
+
+# Solutions kept warm in each worker, by engine and route set
+CACHE_SIZE = 8
+_solutions = OrderedDict()
+
+
+def _get_solution(engine, routes):
+    """Solution for a route set, reused while it is in the cache
+
+    The segment index, occupancy grid inputs and closest points of a
+    route set are kept, so asking for other zoom levels or settings of
+    the same routes skips that work.
+    """
+    digest = hashlib.sha1(routes.coords.tobytes() + routes.offsets.tobytes())
+    key = (engine, digest.hexdigest())
+    if key in _solutions:
+        _solutions.move_to_end(key)
+    else:
+        _solutions[key] = ENGINES[engine](routes)
+        if len(_solutions) > CACHE_SIZE:
+            _solutions.popitem(last=False)
+
+    return _solutions[key]
+
+
+def _label_rows(label_dict):
+    """Labels in route order as [x, y, position], like the lines of a labels file"""
+    return [
+        [
+            label_dict[it]["point_x"],
+            label_dict[it]["point_y"],
+            label_dict[it]["position"],
+        ]
+        for it in sorted(label_dict)
+    ]
+
+
+def label_request(request):
+    """Label the routes of one request, runs in a worker process
+
+    Args:
+        request (dict): With either "routes", a list of routes each as
+            [x1, y1, x2, y2, ...] or [[x1, y1], ...], or "routes_path" to a
+            routes file. Optional are "engine" ("grid", "intersection" or
+            "anytime"), "zoom_levels", "max_candidates", "time_budget" in
+            seconds per zoom level for the anytime engine and "output_path",
+            to write labels files instead of returning labels.
+
+    Returns:
+        response: Dict with "labels", a list of [x, y, position] per route,
+            or with one list per zoom level if zoom levels are given
+    """
+    if "routes_path" in request:
+        routes = RouteSet(*read_routes(request["routes_path"]))
+    else:
+        routes = RouteSet.from_routes(request["routes"])
+
+    solution = _get_solution(request.get("engine", "grid"), routes)
+
+    zoom_levels = request.get("zoom_levels")
+    labels = {}
+    for zoom_level in zoom_levels or [1]:
+        # A copy, settings of a request do not change the cached solution
+        zoom_solution = solution.for_zoom_level(zoom_level)
+        for name in PARAMETERS:
+            if name in request:
+                setattr(zoom_solution, name, request[name])
+        label_dict = zoom_solution.get_label_locations()
+        if "output_path" in request:
+            output_path = request["output_path"]
+            if zoom_levels:
+                output_path = zoom_output_path(output_path, zoom_level)
+            write_label_file(output_path, label_dict)
+        else:
+            labels[str(zoom_level)] = _label_rows(label_dict)
+
+    if "output_path" in request:
+        return {}
+    if zoom_levels:
+        return {"labels": labels}
+    return {"labels": labels["1"]}
+
+
+def _warm_up():
+    # Run a tiny job, so imports and first-call costs are paid before requests
+    for engine in ENGINES:
+        ENGINES[engine](
+            RouteSet.from_routes([[[0, 0], [10, 10]]])
+        ).get_label_locations()
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class LabelServer:
+    """Answers label requests given as JSON lines
+
+    Every line is one request, handled concurrently in a pool of warm
+    worker processes. Every request gets one response line, with the "id"
+    of the request if it had one. Responses are written as they finish,
+    so they can come in another order than the requests. At most
+    max_pending requests are handled at a time, reading waits until one
+    of them is done.
+    """
+
+    def __init__(self, processes=None, max_pending=64):
+        self.executor = ProcessPoolExecutor(max_workers=processes, initializer=_warm_up)
+        self.pending = asyncio.Semaphore(max_pending)
+
+    async def handle_line(self, line, write):
+        request = {}
+        try:
+            request = json.loads(line)
+            response = await asyncio.get_running_loop().run_in_executor(
+                self.executor, label_request, request
+            )
+        except Exception as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+        finally:
+            self.pending.release()
+
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        await write(json.dumps(response, default=_to_json) + "\n")
+
+    async def serve_lines(self, readline, write):
+        """Handle all requests of a stream until it is closed
+
+        Args:
+            readline: Coroutine function returning the next line, empty at the end
+            write: Coroutine function writing a response line
+        """
+        tasks = set()
+        while True:
+            await self.pending.acquire()
+            line = await readline()
+            if not line:
+                self.pending.release()
+                break
+            if not line.strip():
+                self.pending.release()
+                continue
+
+            task = asyncio.create_task(self.handle_line(line, write))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+
+        # Reading in a thread works for pipes, files and terminals alike
+        async def readline():
+            return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+        async def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.serve_lines(readline, write)
+
+    async def serve_socket(self, path):
+        async def handle_client(reader, writer):
+            async def write(text):
+                writer.write(text.encode())
+                await writer.drain()
+
+            try:
+                await self.serve_lines(reader.readline, write)
+            finally:
+                writer.close()
+
+        server = await asyncio.start_unix_server(handle_client, path, limit=2**30)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="Listen on a unix socket at this path instead of stdin/stdout",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes, all cores by default",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=64,
+        help="Number of requests handled at the same time",
+    )
+    args = parser.parse_args()
+
+    async def main():
+        server = LabelServer(args.processes, args.max_pending)
+        try:
+            if args.socket:
+                await server.serve_socket(args.socket)
+            else:
+                await server.serve_stdio()
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,193 @@
+import numpy as np
+
+from src.geometry import cell_crossing_points
+
+
+def enumerate_buckets(first_x, first_y, last_x, last_y):
+    """All buckets of a range of buckets per item, for all items at once
+
+    Args:
+        first_x, first_y, last_x, last_y: Arrays with the first and last
+            bucket of each item along x and y, inclusive. Items with an
+            empty range have no buckets.
+
+    Returns:
+        item_ids, bucket_x, bucket_y: One entry per item and bucket
+    """
+    span_x = np.maximum(last_x - first_x + 1, 0)
+    num_buckets = span_x * np.maximum(last_y - first_y + 1, 0)
+    item_ids = np.repeat(np.arange(len(num_buckets)), num_buckets)
+    first = np.cumsum(num_buckets) - num_buckets
+    k = np.arange(len(item_ids)) - np.repeat(first, num_buckets)
+    bucket_x = first_x[item_ids] + k % span_x[item_ids]
+    bucket_y = first_y[item_ids] + k // span_x[item_ids]
+
+    return item_ids, bucket_x, bucket_y
+
+
+class SegmentGrid:
+    """Uniform grid of buckets over segments
+
+    Each segment is stored in every bucket it crosses, found with the
+    batched grid traversal of geometry.cell_crossing_points, so memory
+    grows with the length of the segments and not with their bbox area.
+    Only buckets that hold segments are kept, as sorted bucket keys with
+    offsets into one array of segment ids, so memory scales with the
+    number of segments and not with the extent of the map.
+    Segments can be deactivated, which hides them from queries.
+    """
+
+    def __init__(self, starts, ends, bucket_width, bucket_height):
+        self.starts = starts
+        self.ends = ends
+        self.bucket_width = bucket_width
+        self.bucket_height = bucket_height
+
+        lower = np.minimum(starts, ends)
+        upper = np.maximum(starts, ends)
+        self.origin = lower.min(axis=0)
+
+        last_x, last_y = self._bucket_of(upper[:, 0], upper[:, 1])
+        self.num_x = int(last_x.max()) + 1
+        self.num_y = int(last_y.max()) + 1
+
+        # A segment running along a bucket border is kept in the bucket
+        # holding its points, as queries look up buckets of points
+        segment_ids, points = cell_crossing_points(
+            starts - self.origin, ends - self.origin, bucket_width, bucket_height
+        )
+        bucket_x = np.floor(points[:, 0] / bucket_width).astype(np.int64)
+        bucket_y = np.floor(points[:, 1] / bucket_height).astype(np.int64)
+        bucket_x = np.clip(bucket_x, 0, self.num_x - 1)
+        bucket_y = np.clip(bucket_y, 0, self.num_y - 1)
+        keys = bucket_y * self.num_x + bucket_x
+
+        order = np.argsort(keys, kind="stable")
+        self.segment_ids = segment_ids[order]
+        self.keys, counts = np.unique(keys[order], return_counts=True)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        self.active = np.ones(len(starts), dtype=bool)
+
+    def _bucket_of(self, x, y):
+        bucket_x = np.floor((x - self.origin[0]) / self.bucket_width).astype(np.int64)
+        bucket_y = np.floor((y - self.origin[1]) / self.bucket_height).astype(np.int64)
+        return bucket_x, bucket_y
+
+    def query_pairs(self, left, top, right, bottom):
+        """Candidate segments for many rectangles at once
+
+        Segments stored in buckets touching each rectangle, a superset of
+        the segments that intersect it. A pair of rectangle and segment
+        can appear more than once.
+
+        Returns:
+            rectangle_ids, segment_ids: 1D numpy arrays of equal length
+        """
+        first_x, first_y = self._bucket_of(np.asarray(left), np.asarray(top))
+        last_x, last_y = self._bucket_of(np.asarray(right), np.asarray(bottom))
+        rectangle_ids, bucket_x, bucket_y = enumerate_buckets(
+            np.maximum(first_x, 0),
+            np.maximum(first_y, 0),
+            np.minimum(last_x, self.num_x - 1),
+            np.minimum(last_y, self.num_y - 1),
+        )
+
+        positions, found = self._find_keys(bucket_y * self.num_x + bucket_x)
+        positions, rectangle_ids = positions[found], rectangle_ids[found]
+        counts = self.offsets[positions + 1] - self.offsets[positions]
+        rectangle_ids = np.repeat(rectangle_ids, counts)
+        segment_ids = self.segment_ids[self._entries(positions)]
+
+        active = self.active[segment_ids]
+        return rectangle_ids[active], segment_ids[active]
+
+    def _find_keys(self, keys):
+        # Only buckets holding segments are stored
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+
+        return positions, found
+
+    def _entries(self, positions):
+        """Indices into segment_ids of all entries of the given buckets"""
+        begin = self.offsets[positions]
+        counts = self.offsets[positions + 1] - begin
+        first = np.cumsum(counts) - counts
+
+        return np.repeat(begin - first, counts) + np.arange(counts.sum())
+
+
+class RectangleGrid:
+    """Uniform grid of buckets over equally sized rectangles
+
+    Rectangles are added and removed one at a time. The bucket size equals
+    the rectangle size, so each rectangle lands in at most 4 buckets and
+    testing a new rectangle only compares it with rectangles in those buckets.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.left = []
+        self.top = []
+        self.buckets = {}
+
+    def _buckets_touched(self, left, top, right=None, bottom=None):
+        if right is None:
+            right, bottom = left + self.width, top + self.height
+        first_x = int(np.floor(left / self.width))
+        first_y = int(np.floor(top / self.height))
+        last_x = int(np.floor(right / self.width))
+        last_y = int(np.floor(bottom / self.height))
+
+        return [
+            (bucket_x, bucket_y)
+            for bucket_x in range(first_x, last_x + 1)
+            for bucket_y in range(first_y, last_y + 1)
+        ]
+
+    def overlaps(self, left, top):
+        """Check if a rectangle overlaps or touches any stored rectangle"""
+        for bucket in self._buckets_touched(left, top):
+            for i in self.buckets.get(bucket, ()):
+                if not (
+                    left > self.left[i] + self.width
+                    or left + self.width < self.left[i]
+                    or top > self.top[i] + self.height
+                    or top + self.height < self.top[i]
+                ):
+                    return True
+
+        return False
+
+    def insert(self, left, top):
+        """Store a rectangle and return its index"""
+        index = len(self.left)
+        self.left.append(left)
+        self.top.append(top)
+        for bucket in self._buckets_touched(left, top):
+            self.buckets.setdefault(bucket, []).append(index)
+
+        return index
+
+    def remove(self, index):
+        """Remove a stored rectangle, indices of other rectangles stay valid"""
+        for bucket in self._buckets_touched(self.left[index], self.top[index]):
+            self.buckets[bucket].remove(index)
+
+    def query(self, left, top, right, bottom):
+        """Indices of stored rectangles overlapping or touching an area"""
+        indices = set()
+        for bucket in self._buckets_touched(left, top, right, bottom):
+            for i in self.buckets.get(bucket, ()):
+                if not (
+                    left > self.left[i] + self.width
+                    or right < self.left[i]
+                    or top > self.top[i] + self.height
+                    or bottom < self.top[i]
+                ):
+                    indices.add(i)
+
+        return indices
@@ -0,0 +1,168 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.route_set import RouteSet
+
+
+def _label_tile(solution_class, coords, offsets, bbox_center, sizes, parameters, owned):
+    """Label the owned routes of one tile, runs in a worker process
+
+    Parameters are set on the solution of the tile after it is built, the
+    tile_parameters of the solution of all routes and original_routes_of_tile.
+    """
+    solution = solution_class(
+        RouteSet(coords, offsets), bbox_center=bbox_center, **sizes
+    )
+    for name, value in parameters.items():
+        setattr(solution, name, value)
+
+    return solution.get_label_locations(owned)
+
+
+def original_routes_of_tile(solution, context):
+    """Given points of the routes of a tile, for solutions of simplified routes
+
+    Labels are tested against the given points of their own route, see
+    _simplify_routes of both engines.
+
+    Returns:
+        attributes: original_routes and point_ids of the solution of the
+            tile, empty unless the routes are simplified
+    """
+    if solution.point_ids is None:
+        return {}
+
+    original_routes = solution.original_routes.subset(context)
+    # Point ids relative to their route, then into the tile routes
+    lengths = solution.routes.lengths[context]
+    first_ids = np.repeat(
+        original_routes.offsets[:-1] - solution.original_routes.offsets[context],
+        lengths,
+    )
+    point_ids = solution.point_ids[solution.routes.point_indices(context)] + first_ids
+    return {"original_routes": original_routes, "point_ids": point_ids}
+
+
+def _assign_tiles(solution, tiles_per_axis, margin):
+    """Split routes into tiles over the routes bbox
+
+    A route is owned by the tile that contains its point closest to the
+    center, which is where labeling starts. The context of a tile are all
+    routes whose bbox touches the tile grown by the margin, so that labels
+    close to the tile are checked against all routes around them.
+
+    Returns:
+        tiles: List of (context route indices, owned route indices, bounds)
+            per tile, owned indices point into the context. Bounds are left,
+            top, right and bottom, infinite on the outer sides of the bbox
+    """
+    routes = solution.routes
+    bbox = routes.bbox()
+    tile_width = max(bbox[2] - bbox[0], 1) / tiles_per_axis
+    tile_height = max(bbox[3] - bbox[1], 1) / tiles_per_axis
+
+    anchors = routes.coords[routes.offsets[:-1] + solution.closest_indices]
+    tile_x = np.minimum((anchors[:, 0] - bbox[0]) // tile_width, tiles_per_axis - 1)
+    tile_y = np.minimum((anchors[:, 1] - bbox[1]) // tile_height, tiles_per_axis - 1)
+    route_bboxes = routes.route_bboxes()
+
+    tiles = []
+    for j in range(tiles_per_axis):
+        for i in range(tiles_per_axis):
+            owned = np.flatnonzero((tile_x == i) & (tile_y == j))
+            if len(owned) == 0:
+                continue
+
+            left = bbox[0] + i * tile_width - margin[0]
+            top = bbox[1] + j * tile_height - margin[1]
+            right = bbox[0] + (i + 1) * tile_width + margin[0]
+            bottom = bbox[1] + (j + 1) * tile_height + margin[1]
+            context = np.flatnonzero(
+                (route_bboxes[:, 0] <= right)
+                & (route_bboxes[:, 2] >= left)
+                & (route_bboxes[:, 1] <= bottom)
+                & (route_bboxes[:, 3] >= top)
+            )
+            bounds = (
+                bbox[0] + i * tile_width if i > 0 else -np.inf,
+                bbox[1] + j * tile_height if j > 0 else -np.inf,
+                bbox[0] + (i + 1) * tile_width if i < tiles_per_axis - 1 else np.inf,
+                bbox[1] + (j + 1) * tile_height if j < tiles_per_axis - 1 else np.inf,
+            )
+            tiles.append((context, np.searchsorted(context, owned), bounds))
+
+    return tiles
+
+
+def _near_seam(rectangles, bounds, margin):
+    """Whether rectangles grown by the margin leave their tile
+
+    Labels of a tile that stay the margin away from its seams cannot meet
+    labels of other tiles, and the worker saw all routes around them.
+    """
+    left, top, right, bottom = bounds
+    return ~(
+        (rectangles[:, 0] - margin[0] >= left)
+        & (rectangles[:, 1] - margin[1] >= top)
+        & (rectangles[:, 2] + margin[0] <= right)
+        & (rectangles[:, 3] + margin[1] <= bottom)
+    )
+
+
+def label_in_tiles(solution, tiles_per_axis, processes=None):
+    """Label routes tile by tile in a process pool
+
+    The routes bbox is split into tiles_per_axis x tiles_per_axis tiles,
+    each labeled independently in a worker process with the routes around it.
+    Labels of different tiles can collide close to tile seams, so labels
+    within the margin of a seam are then replayed in route order by
+    solution.repair_labels, which only places the conflicting ones again.
+
+    Args:
+        solution: route.Solution or route_intersection_based.Solution
+            for all routes
+        tiles_per_axis (int): Number of tiles along x and along y
+        processes (int): Number of worker processes, all cores by default
+
+    Returns:
+        label_dict, num_replaced: Labels for all routes and how many of
+            them had to be placed again at tile seams
+    """
+    routes = solution.routes
+    # Labels are searched a few label sizes away from the tile
+    margin = 2 * np.asarray(solution.label_extent())
+    tiles = _assign_tiles(solution, tiles_per_axis, margin)
+    # Labels of the workers have the size of this solution at its zoom level
+    sizes = {name: getattr(solution, name) for name in solution.size_parameters}
+    parameters = {name: getattr(solution, name) for name in solution.tile_parameters}
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = []
+        for context, owned, _ in tiles:
+            context_routes = routes.subset(context)
+            futures.append(
+                executor.submit(
+                    _label_tile,
+                    type(solution),
+                    context_routes.coords,
+                    context_routes.offsets,
+                    solution.bbox_center,
+                    sizes,
+                    {**parameters, **original_routes_of_tile(solution, context)},
+                    owned,
+                )
+            )
+
+        label_dict = {}
+        revisit = []
+        for (context, _, bounds), future in zip(tiles, futures):
+            tile_dict = future.result()
+            route_ids = context[list(tile_dict)].tolist()
+            label_dict.update(zip(route_ids, tile_dict.values()))
+
+            rectangles = solution.label_rectangles(tile_dict.values())
+            near_seam = _near_seam(rectangles, bounds, margin)
+            revisit.extend(np.array(route_ids, dtype=np.int64)[near_seam].tolist())
+
+    return solution.repair_labels(label_dict, revisit)
@@ -0,0 +1,241 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from src.geometry import segments_cross_rectangles
+from src.plot_routes import label_boxes
+from src.route_io import read_labels, read_routes, zoom_output_path
+from src.route_set import RouteSet
+from src.spatial_index import SegmentGrid, enumerate_buckets
+
+# Candidate pairs are tested in batches of about this many pairs to bound memory
+PAIR_BATCH_SIZE = 2**22
+# Labels are tested against routes in batches of this many labels
+LABEL_BATCH_SIZE = 2**16
+
+
+def _batches(counts, batch_size):
+    """Split items into consecutive ranges holding about batch_size counts each"""
+    totals = np.cumsum(counts)
+    bounds = np.searchsorted(
+        totals, np.arange(batch_size, totals[-1] if len(totals) else 0, batch_size)
+    )
+    bounds = [0] + bounds.tolist() + [len(counts)]
+
+    return zip(bounds[:-1], bounds[1:])
+
+
+def overlapping_label_pairs(lower, upper):
+    """Pairs of labels whose boxes overlap, touching borders does not count
+
+    Boxes are put into buckets of the largest box size, so every box is
+    in at most 4 buckets, and only boxes sharing a bucket are compared.
+    A pair is counted in the bucket holding the lower corner of the area
+    where the two boxes overlap, so it is found once.
+
+    Args:
+        lower, upper: (N, 2) arrays with the lower and upper corner of each box
+
+    Returns:
+        first, second: Label indices of each overlapping pair, first < second
+    """
+    pairs = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]
+    if len(lower) < 2:
+        return tuple(pairs)
+
+    bucket_size = np.max(upper - lower, axis=0)
+    first_x, first_y = np.floor(lower / bucket_size).astype(np.int64).T
+    last_x, last_y = np.floor(upper / bucket_size).astype(np.int64).T
+    label_ids, bucket_x, bucket_y = enumerate_buckets(first_x, first_y, last_x, last_y)
+    origin_x, origin_y = bucket_x.min(), bucket_y.min()
+    num_x = bucket_x.max() - origin_x + 1
+    keys = (bucket_y - origin_y) * num_x + (bucket_x - origin_x)
+
+    order = np.argsort(keys, kind="stable")
+    label_ids, keys = label_ids[order], keys[order]
+    # Every entry is paired with the entries after it in the same bucket
+    bucket_ends = np.searchsorted(keys, keys, side="right")
+    num_partners = bucket_ends - np.arange(len(keys)) - 1
+
+    for begin, end in _batches(num_partners, PAIR_BATCH_SIZE):
+        counts = num_partners[begin:end]
+        entries = np.repeat(np.arange(begin, end), counts)
+        step = np.arange(len(entries)) - np.repeat(np.cumsum(counts) - counts, counts)
+        first, second = label_ids[entries], label_ids[entries + step + 1]
+
+        overlap_lower = np.maximum(lower[first], lower[second])
+        overlap_upper = np.minimum(upper[first], upper[second])
+        overlaps = np.all(overlap_lower < overlap_upper, axis=1)
+
+        reference_x, reference_y = np.floor(overlap_lower / bucket_size).T
+        reference_keys = (reference_y - origin_y) * num_x + (reference_x - origin_x)
+        in_bucket = reference_keys == keys[entries]
+
+        found = overlaps & in_bucket
+        pairs[0] = np.concatenate([pairs[0], np.minimum(first, second)[found]])
+        pairs[1] = np.concatenate([pairs[1], np.maximum(first, second)[found]])
+
+    return tuple(pairs)
+
+
+def label_route_crossings(lower, upper, routes, segment_index=None):
+    """Pairs of label and route where a route segment passes through the label
+
+    Segments are clipped against the open box, see segments_cross_rectangles.
+
+    Args:
+        lower, upper: (N, 2) arrays with the lower and upper corner of each box
+        routes (RouteSet): All routes
+        segment_index (SegmentGrid): Index over the segments of routes,
+            built with buckets of the box size if not given
+
+    Returns:
+        label_ids, route_ids: Each crossing pair once
+    """
+    starts, ends = routes.segments()
+    if segment_index is None:
+        bucket_size = np.max(upper - lower, axis=0)
+        segment_index = SegmentGrid(starts, ends, *bucket_size)
+    segment_routes = np.repeat(
+        np.arange(len(routes)), np.diff(routes.segment_offsets())
+    )
+
+    keys = []
+    for begin in range(0, len(lower), LABEL_BATCH_SIZE):
+        end = begin + LABEL_BATCH_SIZE
+        label_ids, segment_ids = segment_index.query_pairs(
+            lower[begin:end, 0],
+            lower[begin:end, 1],
+            upper[begin:end, 0],
+            upper[begin:end, 1],
+        )
+        crosses = segments_cross_rectangles(
+            starts[segment_ids],
+            ends[segment_ids],
+            lower[begin + label_ids, 0],
+            lower[begin + label_ids, 1],
+            upper[begin + label_ids, 0],
+            upper[begin + label_ids, 1],
+        )
+        keys.append(
+            np.unique(
+                (begin + label_ids[crosses]) * len(routes)
+                + segment_routes[segment_ids[crosses]]
+            )
+        )
+
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    return keys // len(routes), keys % len(routes)
+
+
+def validate_layout(routes, points, positions, width, height):
+    """Collision metrics of one layout
+
+    Label i belongs to route i, as in labels files.
+
+    Returns:
+        metrics: Dict with counts of colliding pairs and of labels involved
+    """
+    start = time.perf_counter()
+    lower, upper = label_boxes(points, positions, width, height)
+
+    first, second = overlapping_label_pairs(lower, upper)
+    label_ids, route_ids = label_route_crossings(lower, upper, routes)
+
+    return {
+        "labels": len(lower),
+        "label_label_collisions": len(first),
+        "labels_overlapping_labels": len(np.union1d(first, second)),
+        "label_route_collisions": len(label_ids),
+        "labels_crossing_routes": len(np.unique(label_ids)),
+        "labels_crossing_own_route": int(np.sum(label_ids == route_ids)),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def validate_files(
+    routes_path, labels_path, zoom_levels, labels_per_zoom=False, label_size=(100, 50)
+):
+    """Collision metrics per zoom level, labels are scaled as by plot_routes
+
+    Returns:
+        results: Dict of metrics by zoom level
+    """
+    routes = RouteSet(*read_routes(routes_path))
+    if not labels_per_zoom:
+        labels = read_labels(labels_path)
+
+    results = {}
+    for zoom_level in zoom_levels:
+        if labels_per_zoom:
+            labels = read_labels(zoom_output_path(labels_path, zoom_level))
+        results[str(zoom_level)] = validate_layout(
+            routes,
+            *labels,
+            label_size[0] * zoom_level,
+            label_size[1] * zoom_level,
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Count label-label and label-route collisions of a layout"
+    )
+    parser.add_argument("routes_path", type=str)
+    parser.add_argument("labels_path", type=str)
+    parser.add_argument("--zoom-levels", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--labels-per-zoom",
+        action="store_true",
+        help="Read the labels of each zoom level from its own file, as written "
+        "with --zoom-levels",
+    )
+    parser.add_argument(
+        "--label-size",
+        type=float,
+        nargs=2,
+        default=[100, 50],
+        help="Label width and height at zoom level 1, as drawn by plot_routes",
+    )
+    parser.add_argument(
+        "--max-label-collisions",
+        type=int,
+        help="Fail if a zoom level has more overlapping label pairs",
+    )
+    parser.add_argument(
+        "--max-route-collisions",
+        type=int,
+        help="Fail if a zoom level has more label and route crossings",
+    )
+    args = parser.parse_args()
+
+    results = validate_files(
+        args.routes_path,
+        args.labels_path,
+        args.zoom_levels,
+        args.labels_per_zoom,
+        args.label_size,
+    )
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    failed = False
+    for zoom_level, metrics in results.items():
+        for key, limit in (
+            ("label_label_collisions", args.max_label_collisions),
+            ("label_route_collisions", args.max_route_collisions),
+        ):
+            if limit is not None and metrics[key] > limit:
+                print(
+                    f"Zoom level {zoom_level}: {metrics[key]} {key}, limit is {limit}",
+                    file=sys.stderr,
+                )
+                failed = True
+
+    if failed:
+        raise SystemExit(1)
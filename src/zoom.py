@@ -0,0 +1,73 @@
+import copy
+
+from src.profiling import phase
+from src.route_io import write_label_file, zoom_output_path
+from src.tiles import label_in_tiles
+
+
+class ZoomLevels:
+    """Zoom levels and labels files of the solutions of all engines
+
+    Mixed into a solution, which has a profiler, profiled_phases and
+    profiled_counts, zoom_level, size_parameters giving the label size
+    and get_label_locations.
+    """
+
+    def for_zoom_level(self, zoom_level):
+        """Solution for labels scaled by the zoom level
+
+        Routes and everything found from them are shared with this
+        solution, only the size_parameters are scaled.
+        """
+        solution = copy.copy(self)
+        if self.profiler is not None:
+            # The copied wrappers would still call the methods of this solution
+            self.profiler.instrument(
+                solution, self.profiled_phases, self.profiled_counts
+            )
+        solution.zoom_level = self.zoom_level * zoom_level
+        for name in self.size_parameters:
+            setattr(solution, name, getattr(self, name) * zoom_level)
+
+        return solution
+
+    def zoom_solutions(self, output_path, zoom_levels):
+        """Zoom level, its solution and its labels path, see zoom_output_path"""
+        for zoom_level in zoom_levels:
+            yield (
+                zoom_level,
+                self.for_zoom_level(zoom_level),
+                zoom_output_path(output_path, zoom_level),
+            )
+
+    def write_label_locations(self, output_path, tiles_per_axis=None, processes=None):
+        """Write labels, optionally labeling tiles in parallel, see label_in_tiles
+
+        Returns:
+            label_dict: The written labels
+        """
+        if tiles_per_axis:
+            with phase(self.profiler, "tiles"):
+                label_dict, _ = label_in_tiles(self, tiles_per_axis, processes)
+        else:
+            label_dict = self.get_label_locations()
+
+        with phase(self.profiler, "write"):
+            write_label_file(output_path, label_dict)
+
+        return label_dict
+
+    def write_zoom_label_locations(
+        self, output_path, zoom_levels, tiles_per_axis=None, processes=None
+    ):
+        """Write one labels file per zoom level, see zoom_output_path
+
+        Returns:
+            label_dicts: The written labels by zoom level
+        """
+        return {
+            zoom_level: solution.write_label_locations(path, tiles_per_axis, processes)
+            for zoom_level, solution, path in self.zoom_solutions(
+                output_path, zoom_levels
+            )
+        }
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+from src.batch import collect_jobs, output_path_for, run_batch
+from src.benchmark import random_walk_routes
+from src.route_io import read_labels, write_routes_text
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_inputs(tmp_path):
+    routes = random_walk_routes(20, 10)
+    valid, malformed = tmp_path / "valid.txt", tmp_path / "malformed.txt"
+    write_routes_text(valid, routes.coords, routes.offsets)
+    malformed.write_text("1 2 3\n")
+    return valid, malformed
+
+
+def test_batch_labels_valid_files_and_counts_failures(tmp_path):
+    valid, malformed = write_inputs(tmp_path)
+
+    summary = run_batch("grid", collect_jobs([str(tmp_path)]), processes=2)
+
+    assert (summary["files"], summary["failed"], summary["routes"]) == (2, 1, 20)
+    points, _ = read_labels(output_path_for(str(valid)))
+    assert len(points) == 20
+    assert not os.path.exists(output_path_for(str(malformed)))
+
+
+def test_batch_exits_with_an_error_if_a_file_fails(tmp_path):
+    valid, _ = write_inputs(tmp_path)
+
+    result = subprocess.run(
+        [sys.executable, "-m", "src.batch", str(tmp_path), "--processes", "2"],
+        capture_output=True,
+        text=True,
+        cwd=REPOSITORY,
+    )
+
+    assert result.returncode == 1
+    assert "Failed" in result.stderr and "malformed.txt" in result.stderr
+    assert os.path.exists(output_path_for(str(valid)))
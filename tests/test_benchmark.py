@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_benchmark(*args):
+    return subprocess.run(
+        [sys.executable, "-m", "src.benchmark", "--generators", "random_walk"]
+        + ["--route-counts", "10", "--route-lengths", "5", *args],
+        capture_output=True,
+        text=True,
+        cwd=REPOSITORY,
+    )
+
+
+@pytest.mark.parametrize(
+    "engines, returncode", [(["grid"], 0), (["grid", "unknown"], 1)]
+)
+def test_benchmark_fails_if_a_case_fails(engines, returncode):
+    result = run_benchmark("--engines", *engines)
+
+    assert result.returncode == returncode, result.stderr
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.benchmark import random_walk_routes
+from src.route_io import read_labels, write_routes_text
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize(
+    "module", ["src.route", "src.route_intersection_based", "src.route_anytime"]
+)
+def test_command_line_writes_one_labels_file_per_zoom_level(tmp_path, module):
+    routes = random_walk_routes(30, 10)
+    routes_path = tmp_path / "routes.txt"
+    write_routes_text(routes_path, routes.coords, routes.offsets)
+
+    result = subprocess.run(
+        [sys.executable, "-m", module, str(routes_path), str(tmp_path / "labels.txt")]
+        + ["--zoom-levels", "1", "2", "--simplify", "0.1"],
+        capture_output=True,
+        text=True,
+        cwd=REPOSITORY,
+    )
+
+    assert result.returncode == 0, result.stderr
+    for zoom_level in (1, 2):
+        points, _ = read_labels(tmp_path / f"labels_zoom{zoom_level}.txt")
+        assert len(points) == 30
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+from src import plot_routes, route
+from src.benchmark import random_walk_routes
+from src.route_io import POSITIONS, write_label_file, write_routes_text
+
+
+def test_label_outlines_match_get_label():
+    points = np.array([[100, 200], [-30, 40], [0, 0], [7, -9]])
+    positions = list(POSITIONS)
+
+    outlines = plot_routes.label_outlines(points, positions, 30, 20)
+
+    for outline, (x, y), orient in zip(outlines, points.tolist(), positions):
+        expected = plot_routes.get_label(x, y, orient, 30, 20)
+        # Same rectangle, the outlines may start at a different corner
+        assert sorted(map(tuple, outline[:-1].tolist())) == sorted(expected[:-1])
+
+
+def test_label_outlines_reject_unknown_positions():
+    with pytest.raises(Exception, match="Invalid label orientation"):
+        plot_routes.label_outlines([[0, 0]], ["middle"])
+
+
+def write_job(tmp_path, name):
+    routes = random_walk_routes(10, 10)
+    routes_path, labels_path = tmp_path / f"{name}.txt", tmp_path / f"{name}_labels.txt"
+    write_routes_text(routes_path, routes.coords, routes.offsets)
+    write_label_file(str(labels_path), route.Solution(routes).get_label_locations())
+    return str(routes_path), str(labels_path)
+
+
+def test_render_results_writes_one_image_per_zoom_level(tmp_path):
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    routes_path, labels_path = write_job(tmp_path, "routes")
+
+    output_paths = plot_routes.render_results(
+        routes_path, labels_path, str(tmp_path / "out.png"), [1, 2], dpi=20
+    )
+
+    assert [os.path.basename(path) for path in output_paths] == [
+        "out_zoom1.png",
+        "out_zoom2.png",
+    ]
+    assert all(os.path.getsize(path) > 0 for path in output_paths)
+
+
+def test_render_many_renders_every_pair_and_counts_failures(tmp_path):
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    jobs = [write_job(tmp_path, "first"), write_job(tmp_path, "second")]
+    jobs.append((jobs[0][0], str(tmp_path / "missing_labels.txt")))
+
+    output_paths, failed = plot_routes.render_many(
+        jobs, str(tmp_path / "images"), [1], processes=2, dpi=20
+    )
+
+    assert sorted(os.path.basename(path) for path in output_paths) == [
+        "first_labels_zoom1.png",
+        "second_labels_zoom1.png",
+    ]
+    assert failed == 1
@@ -0,0 +1,26 @@
+import pytest
+
+from src.api import ENGINES
+from src.benchmark import random_walk_routes
+from src.profiling import Profiler
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_profiling_does_not_change_labels_of_zoom_levels(tmp_path, engine):
+    routes = random_walk_routes(100, 30)
+    profiler = Profiler()
+    profiled = ENGINES[engine](routes, profiler=profiler)
+    plain = ENGINES[engine](routes)
+    if engine == "anytime":
+        profiled.time_budget = plain.time_budget = 0
+
+    profiled.write_zoom_label_locations(str(tmp_path / "profiled.txt"), [1, 2, 4])
+    plain.write_zoom_label_locations(str(tmp_path / "plain.txt"), [1, 2, 4])
+
+    for zoom_level in [1, 2, 4]:
+        name = f"_zoom{zoom_level}.txt"
+        assert (tmp_path / f"profiled{name}").read_text() == (
+            tmp_path / f"plain{name}"
+        ).read_text()
+    assert profiler.counts["labels"] == 3 * 100
+    assert profiler.phases["placement"] > 0
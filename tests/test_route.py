@@ -0,0 +1,233 @@
+import numpy as np
+import pytest
+
+from src import route
+from src.benchmark import random_walk_routes
+from src.geometry import segments_cross_rectangles
+from src.route_io import (
+    read_labels,
+    write_label_file,
+    write_routes_binary,
+    write_routes_text,
+)
+from src.route_set import RouteSet
+
+
+def route_cells(solution):
+    """Lattice cells crossed by any route of a solution"""
+    cell_x, cell_y = solution._rasterize_segments(
+        *solution.original_routes.segments(),
+        solution.cell_width,
+        solution.cell_height,
+    )
+    return set(zip(cell_x.tolist(), cell_y.tolist()))
+
+
+def assert_valid_layout(solution, label_dict, route_ids):
+    assert sorted(label_dict) == sorted(route_ids)
+    cells = [(label["cell_x"], label["cell_y"]) for label in label_dict.values()]
+    assert len(set(cells)) == len(cells)
+    assert not set(cells) & route_cells(solution)
+
+
+@pytest.mark.parametrize("cell_size", [(100, 50), (7, 3)])
+def test_rasterize_segments_finds_exactly_the_crossed_cells(cell_size):
+    rng = np.random.default_rng(0)
+    starts = rng.integers(-300, 300, size=(200, 2))
+    ends = starts + rng.integers(-200, 200, size=(200, 2))
+    solution = route.Solution([[[0, 0], [1, 1]]])
+
+    cell_x, cell_y = solution._rasterize_segments(starts, ends, *cell_size)
+    found = set(zip(cell_x.tolist(), cell_y.tolist()))
+
+    # Every found cell is crossed by a segment
+    width, height = cell_size
+    lefts, tops = np.array(sorted(found)).T * np.array(cell_size)[:, None]
+    crosses = segments_cross_rectangles(
+        starts[:, None],
+        ends[:, None],
+        lefts,
+        tops,
+        lefts + width,
+        tops + height,
+    )
+    assert np.all(crosses.any(axis=0))
+
+    # Every cell holding a sampled point strictly inside it is found
+    t = np.linspace(0, 1, 1001)[:, None, None]
+    points = (starts + t * (ends - starts)).reshape(-1, 2)
+    cells = np.floor(points / cell_size)
+    inside = np.all(points % cell_size != 0, axis=1)
+    sampled = set(map(tuple, cells[inside].astype(int).tolist()))
+    assert sampled <= found
+
+
+def test_rasterize_segments_skips_segments_on_grid_lines():
+    solution = route.Solution([[[0, 0], [1, 1]]])
+    cell_x, cell_y = solution._rasterize_segments(
+        np.array([[0, 50], [200, 0]]), np.array([[300, 50], [200, 100]]), 100, 50
+    )
+
+    assert len(cell_x) == len(cell_y) == 0
+
+
+def test_find_closest_empty_occupancy_matches_a_full_scan():
+    rng = np.random.default_rng(1)
+    solution = route.Solution([[[0, 0], [1, 1]]])
+    for _ in range(20):
+        occupancy = rng.random((15, 20)) < 0.8
+        solution._closest_empty_distance = {}
+        cell_x, cell_y = rng.integers(0, 20), rng.integers(0, 15)
+
+        empty_y, empty_x = np.nonzero(~occupancy)
+        distances = (empty_x - cell_x) ** 2 + (empty_y - cell_y) ** 2
+        best = np.lexsort((empty_y, empty_x, distances))[0]
+
+        assert solution._find_closest_empty_occupancy(cell_x, cell_y, occupancy) == (
+            empty_x[best],
+            empty_y[best],
+        )
+
+
+def test_layout_is_valid():
+    solution = route.Solution(random_walk_routes(100, 30))
+    label_dict = solution.get_label_locations()
+
+    assert_valid_layout(solution, label_dict, range(100))
+
+
+def test_zoom_levels_scale_labels_and_keep_routes():
+    solution = route.Solution(random_walk_routes(50, 30))
+    zoomed = solution.for_zoom_level(2)
+
+    assert (zoomed.cell_width, zoomed.cell_height) == (200, 100)
+    assert zoomed.routes is solution.routes
+    assert_valid_layout(zoomed, zoomed.get_label_locations(), range(50))
+    assert (solution.cell_width, solution.cell_height) == (100, 50)
+
+
+def test_sparse_occupancy_gives_the_same_labels():
+    routes = random_walk_routes(100, 30)
+    dense = route.Solution(routes)
+    dense.occupancy_backend = "dense"
+    sparse = route.Solution(routes)
+    sparse.occupancy_backend = "sparse"
+
+    assert sparse.get_label_locations() == dense.get_label_locations()
+
+
+@pytest.mark.parametrize("simplify_tolerance", [0.1, 0.5])
+def test_simplified_routes_give_a_valid_layout(tmp_path, simplify_tolerance):
+    routes = random_walk_routes(100, 200, step=20)
+    routes_path = tmp_path / "routes.txt"
+    write_routes_text(routes_path, routes.coords, routes.offsets)
+    solution = route.Solution(routes, simplify_tolerance=simplify_tolerance)
+    streaming = route.StreamingSolution(
+        str(routes_path), chunk_size=4096, simplify_tolerance=simplify_tolerance
+    )
+
+    # Labels stay off the cells of the given routes, not the simplified ones
+    assert_valid_layout(solution, solution.get_label_locations(), range(100))
+    assert_valid_layout(solution, streaming.get_label_locations(), range(100))
+
+
+def test_streaming_and_binary_files_give_the_same_labels(tmp_path):
+    routes = random_walk_routes(200, 30)
+    text_path, binary_path = tmp_path / "routes.txt", tmp_path / "routes.bin"
+    write_routes_text(text_path, routes.coords, routes.offsets)
+    write_routes_binary(binary_path, routes.coords, routes.offsets)
+
+    expected_path = tmp_path / "expected.txt"
+    write_label_file(str(expected_path), route.Solution(routes).get_label_locations())
+    for routes_path in (text_path, binary_path):
+        output_path = tmp_path / "streamed.txt"
+        # Small chunks, so routes are read in many chunks
+        solution = route.StreamingSolution(str(routes_path), chunk_size=2048)
+        solution.write_label_locations(str(output_path))
+
+        assert output_path.read_text() == expected_path.read_text()
+
+
+def test_streaming_solution_returns_the_same_labels(tmp_path):
+    routes = random_walk_routes(200, 30)
+    routes_path = tmp_path / "routes.txt"
+    write_routes_text(routes_path, routes.coords, routes.offsets)
+    solution = route.StreamingSolution(str(routes_path), chunk_size=2048)
+    expected = route.Solution(routes)
+
+    assert solution.get_label_locations() == expected.get_label_locations()
+    assert solution.get_label_locations([150, 3, 70]) == expected.get_label_locations(
+        [3, 70, 150]
+    )
+
+
+def test_streaming_solution_writes_zoom_levels(tmp_path):
+    routes = random_walk_routes(50, 30)
+    routes_path = tmp_path / "routes.txt"
+    write_routes_text(routes_path, routes.coords, routes.offsets)
+    solution = route.StreamingSolution(str(routes_path), chunk_size=2048)
+
+    solution.write_zoom_label_locations(str(tmp_path / "labels.txt"), [1, 2])
+
+    expected = route.Solution(routes).for_zoom_level(2).get_label_locations()
+    points, _ = read_labels(tmp_path / "labels_zoom2.txt")
+    assert points.tolist() == [
+        [label["point_x"], label["point_y"]] for label in expected.values()
+    ]
+
+
+def test_incremental_solution_keeps_a_valid_layout():
+    routes = random_walk_routes(60, 20)
+    solution = route.IncrementalSolution(RouteSet.from_routes(list(routes)[:50]))
+
+    for points in list(routes)[50:]:
+        route_id, relabeled = solution.add_route(points)
+        assert route_id in relabeled
+    solution.update_route(3, routes[55] + 500)
+    solution.remove_route(7)
+    solution.remove_route(52)
+
+    active = [it for it in range(60) if it not in (7, 52)]
+    assert sorted(solution.active_routes()) == active
+    assert_valid_layout(
+        route.Solution(solution.routes.subset(active)),
+        {it: solution.label_dict[it] for it in active},
+        active,
+    )
+
+
+def test_incremental_solution_labels_routes_outside_the_grid():
+    solution = route.IncrementalSolution([[[0, 0], [300, 300]]])
+    route_id, _ = solution.add_route([[5000, 5000], [5300, 5200]])
+
+    assert route_id == 1
+    assert sorted(solution.label_dict) == [0, 1]
+    assert_valid_layout(solution, solution.label_dict, [0, 1])
+
+
+def test_dense_cluster_gets_a_label_for_every_route():
+    routes = [[[5000, 5000], [5010, 5010]]] * 12
+    solution = route.Solution(routes)
+
+    assert_valid_layout(solution, solution.get_label_locations(), range(12))
+
+
+def test_incremental_solution_grows_the_grid_geometrically(monkeypatch):
+    solution = route.IncrementalSolution([[[0, 0], [10, 10]]])
+    solution._ensure_layout()
+    grow_grid = solution._grow_grid
+    calls = []
+
+    def counted_grow_grid(*args):
+        calls.append(args)
+        grow_grid(*args)
+
+    monkeypatch.setattr(solution, "_grow_grid", counted_grow_grid)
+    for step in range(1, 201):
+        solution.add_route([[300 * step, 150 * step], [300 * step + 10, 150 * step]])
+    # Routes stacked on each other only fit with a larger margin
+    for _ in range(50):
+        solution.add_route([[0, 0], [10, 10]])
+
+    assert len(calls) <= 12
+    assert_valid_layout(solution, solution.label_dict, range(251))
@@ -0,0 +1,76 @@
+import copy
+import time
+
+from src import route, route_anytime
+from src.benchmark import random_walk_routes
+from src.tiles import label_in_tiles
+from tests.test_route import assert_valid_layout
+
+
+def test_improved_layout_is_valid_and_not_worse_than_greedy():
+    routes = random_walk_routes(150, 30)
+    solution = route_anytime.Solution(routes)
+
+    label_dict = solution.get_label_locations()
+
+    assert_valid_layout(solution, label_dict, range(150))
+    metrics = solution.metrics
+    assert metrics["labels"] == 150
+    assert metrics["cost"] <= metrics["greedy_cost"]
+
+
+def test_zero_time_budget_gives_the_greedy_layout():
+    routes = random_walk_routes(100, 30)
+    solution = route_anytime.Solution(routes)
+    solution.time_budget = 0
+
+    assert (
+        solution.get_label_locations() == route.Solution(routes).get_label_locations()
+    )
+
+
+def test_zoom_levels_keep_their_own_metrics():
+    solution = route_anytime.Solution(random_walk_routes(50, 30))
+    zoomed = solution.for_zoom_level(2)
+
+    for _ in range(3):
+        zoomed.get_label_locations()
+
+    assert solution.metrics is None
+    assert zoomed.metrics["zoom_level"] == 2
+
+
+def test_tiled_layouts_have_metrics():
+    solution = route_anytime.Solution(random_walk_routes(200, 30))
+    solution.time_budget = 0.1
+
+    label_dict, num_replaced = label_in_tiles(solution, 2, processes=2)
+
+    assert_valid_layout(solution, label_dict, range(200))
+    assert solution.metrics["labels"] == 200
+    assert solution.metrics["replaced_labels"] == num_replaced
+
+
+def test_improvement_stops_at_the_deadline(monkeypatch):
+    solution = route_anytime.Solution(random_walk_routes(2000, 30))
+    occupancy = solution._get_route_occupancy()
+    label_dict = solution._get_label_locations(
+        solution.routes, solution.closest_indices, copy.deepcopy(occupancy)
+    )
+
+    # Once the deadline has passed, labels are only measured, all at once
+    def no_search(*args):
+        raise AssertionError("label by label work after the deadline")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(solution, "_candidates", no_search)
+        patch.setattr(solution, "_to_grid", no_search)
+        _, metrics = solution.improve_labels(
+            dict(label_dict), occupancy, time.perf_counter()
+        )
+    assert metrics["rounds"] == 0
+
+    # and stops soon after the deadline, generous for slow test machines
+    deadline = time.perf_counter() + 0.05
+    _, metrics = solution.improve_labels(dict(label_dict), occupancy, deadline)
+    assert time.perf_counter() < deadline + 0.5
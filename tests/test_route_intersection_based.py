@@ -0,0 +1,160 @@
+import numpy as np
+
+from src import route_intersection_based
+from src.benchmark import random_walk_routes, urban_grid_routes
+from src.route_set import RouteSet
+from src.validate import label_route_crossings, overlapping_label_pairs
+
+
+def label_collisions(solution, label_dict):
+    """Overlapping label pairs and label route crossings, labels with tolerance"""
+    keys = sorted(label_dict)
+    lower = np.array(
+        [[label_dict[it]["rect_left"], label_dict[it]["rect_top"]] for it in keys],
+        dtype=float,
+    )
+    upper = lower + solution.label_extent()
+    first, _ = overlapping_label_pairs(lower, upper)
+
+    # Routes only have to stay out of the label itself, not its tolerance
+    label_ids, _ = label_route_crossings(
+        lower + solution.tolerance, upper, solution.routes
+    )
+    return len(first), len(label_ids)
+
+
+def test_layout_is_valid():
+    solution = route_intersection_based.Solution(random_walk_routes(100, 30))
+    label_dict = solution.get_label_locations()
+
+    assert sorted(label_dict) == list(range(100))
+    assert label_collisions(solution, label_dict) == (0, 0)
+
+
+def test_rectangles_free_of_routes_matches_testing_all_segments():
+    routes = random_walk_routes(30, 20)
+    solution = route_intersection_based.Solution(routes)
+    rng = np.random.default_rng(0)
+    bbox = routes.bbox()
+    lefts = rng.uniform(bbox[0], bbox[2], 500)
+    tops = rng.uniform(bbox[1], bbox[3], 500)
+
+    free = solution.rectangles_free_of_routes(lefts, tops, 200, 100)
+
+    expected = np.array(
+        [
+            not any(
+                solution.line_rectangle_intersection(points, left, top, 200, 100)
+                for points in routes
+            )
+            for left, top in zip(lefts, tops)
+        ]
+    )
+    np.testing.assert_array_equal(free, expected)
+
+
+def test_simplified_labels_do_not_cross_their_own_route():
+    routes = random_walk_routes(50, 200, step=20)
+    solution = route_intersection_based.Solution(routes, simplify_tolerance=0.2)
+    label_dict = solution.get_label_locations()
+
+    # Labels sit on points of the given routes
+    for it, label in label_dict.items():
+        assert np.any(np.all(routes[it] == (label["point_x"], label["point_y"]), 1))
+
+    # Labels are tested against the given points of their own route
+    lower = np.array(
+        [[label_dict[it]["rect_left"], label_dict[it]["rect_top"]] for it in range(50)],
+        dtype=float,
+    )
+    lower += solution.tolerance
+    label_ids, route_ids = label_route_crossings(
+        lower, lower + (solution.width, solution.height), routes
+    )
+    assert not np.any(label_ids == route_ids)
+
+
+def test_incremental_solution_keeps_a_valid_layout():
+    routes = random_walk_routes(60, 20)
+    solution = route_intersection_based.IncrementalSolution(
+        RouteSet.from_routes(list(routes)[:50])
+    )
+
+    for points in list(routes)[50:]:
+        route_id, relabeled = solution.add_route(points)
+        assert route_id in relabeled
+    solution.update_route(3, routes[55] + 500)
+    solution.remove_route(7)
+
+    active = [it for it in range(60) if it != 7]
+    assert sorted(solution.label_dict) == active
+    current = route_intersection_based.Solution(solution.routes.subset(active))
+    assert label_collisions(
+        current, {i: solution.label_dict[it] for i, it in enumerate(active)}
+    ) == (0, 0)
+    # Every label knows its own placed rectangle, removed ones leave gaps
+    placed = solution._placed_rectangles
+    for it, label in solution.label_dict.items():
+        index = solution._label_rectangles[it]
+        assert (placed.left[index], placed.top[index]) == (
+            label["rect_left"],
+            label["rect_top"],
+        )
+
+
+def test_incremental_solution_merges_changed_routes_into_the_index():
+    routes = random_walk_routes(80, 10)
+    solution = route_intersection_based.IncrementalSolution(
+        RouteSet.from_routes(list(routes)[:20])
+    )
+
+    for points in list(routes)[20:]:
+        solution.add_route(points)
+        num_changed = sum(
+            len(points) - 1 for points in solution.changed_routes.values()
+        )
+        assert num_changed**2 <= len(solution.segment_index.starts)
+    solution.remove_route(5)
+    solution.remove_route(70)
+    solution.update_route(60, routes[0] + 300)
+
+    active = [it for it in range(80) if it not in (5, 70)]
+    current = route_intersection_based.Solution(solution.routes.subset(active))
+    assert label_collisions(
+        current, {i: solution.label_dict[it] for i, it in enumerate(active)}
+    ) == (0, 0)
+    # Removed routes and old points of updated routes stay hidden
+    num_indexed = np.sum(solution.segment_index.active)
+    if solution.changed_segment_index is not None:
+        num_indexed += len(solution.changed_segment_index.starts)
+    assert num_indexed == len(current.routes.segments()[0])
+
+
+def test_all_candidates_are_tried_by_default_and_fallbacks_are_reported():
+    routes = urban_grid_routes(300, 50)
+    solution = route_intersection_based.Solution(routes)
+    label_dict = solution.get_label_locations()
+
+    assert label_collisions(solution, label_dict) == (0, 0)
+    assert not any(label["fallback"] for label in label_dict.values())
+
+    # A cap gives up on some labels, they are the ones that collide
+    solution.max_candidates = 1
+    label_dict = solution.get_label_locations()
+    lower = np.array(
+        [
+            [label_dict[it]["rect_left"], label_dict[it]["rect_top"]]
+            for it in range(300)
+        ],
+        dtype=float,
+    )
+    first, second = overlapping_label_pairs(lower, lower + solution.label_extent())
+    label_ids, _ = label_route_crossings(
+        lower + solution.tolerance, lower + solution.label_extent(), routes
+    )
+    colliding = set(label_ids.tolist())
+    # Of two overlapping labels, the one placed later gave up
+    colliding.update(np.maximum(first, second).tolist())
+
+    fallback = {it for it, label in label_dict.items() if label["fallback"]}
+    assert colliding and colliding <= fallback
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from src import plot_routes
+from src.route_io import (
+    LabelFileWriter,
+    iter_routes,
+    parse_routes,
+    parse_routes_array,
+    read_labels,
+    read_routes,
+    write_label_file,
+    write_routes_binary,
+)
+
+
+def test_parse_routes_array_skips_empty_lines(tmp_path):
+    path = tmp_path / "routes.txt"
+    path.write_text("1 2 3 4\n\n5 6\r\n7 8 9 10 11 12")
+
+    coords, offsets = parse_routes_array(path)
+
+    np.testing.assert_array_equal(coords, np.arange(1, 13).reshape(-1, 2))
+    np.testing.assert_array_equal(offsets, [0, 2, 3, 6])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 16, 2**20])
+def test_parsing_does_not_depend_on_the_chunk_size(tmp_path, chunk_size):
+    path = tmp_path / "routes.txt"
+    path.write_text("".join(f"{i} {i + 1} {i + 2} {i + 3}\n" for i in range(50)))
+
+    coords, offsets = parse_routes_array(path, chunk_size=chunk_size)
+    chunks = list(iter_routes(path, chunk_size=chunk_size))
+
+    assert len(offsets) == 51
+    np.testing.assert_array_equal(np.concatenate([c for c, _ in chunks]), coords)
+    assert sum(len(o) - 1 for _, o in chunks) == 50
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 20))
+def test_chunks_of_only_empty_lines_are_skipped(tmp_path, chunk_size):
+    path = tmp_path / "routes.txt"
+    path.write_text("1 2 3 4\n     \n\n\n5 6 7 8\n")
+
+    coords, offsets = parse_routes_array(path, chunk_size=chunk_size)
+
+    np.testing.assert_array_equal(coords, np.arange(1, 9).reshape(-1, 2))
+    np.testing.assert_array_equal(offsets, [0, 2, 4])
+
+
+def test_parse_routes_gives_lists_of_points(tmp_path):
+    path = tmp_path / "routes.txt"
+    path.write_text("1 2 3 4\n5 6\n")
+
+    assert parse_routes(path) == [[[1, 2], [3, 4]], [[5, 6]]]
+    assert plot_routes.parse_routes is parse_routes
+
+
+@pytest.mark.parametrize("content", ["1 2 3\n", "1 2 x 4\n", "1.5 2\n"])
+def test_parse_routes_array_rejects_bad_routes(tmp_path, content):
+    path = tmp_path / "routes.txt"
+    path.write_text(content)
+
+    with pytest.raises(ValueError):
+        parse_routes_array(path)
+
+
+def test_binary_routes_read_like_text(tmp_path):
+    coords = np.array([[1, 2], [3, 4], [5, 6]])
+    offsets = np.array([0, 2, 3])
+    write_routes_binary(tmp_path / "routes.bin", coords, offsets)
+
+    binary_coords, binary_offsets = read_routes(tmp_path / "routes.bin")
+    chunks = list(iter_routes(tmp_path / "routes.bin", chunk_size=8))
+
+    np.testing.assert_array_equal(binary_coords, coords)
+    np.testing.assert_array_equal(binary_offsets, offsets)
+    assert len(chunks) == 2
+
+
+@pytest.mark.parametrize("name", ["labels.txt", "labels.bin"])
+def test_labels_round_trip(tmp_path, name):
+    label_dict = {
+        0: {"point_x": 1, "point_y": 2, "position": "top-left"},
+        1: {"point_x": -3, "point_y": 4, "position": "bottom-right"},
+    }
+    write_label_file(str(tmp_path / name), label_dict)
+
+    points, positions = read_labels(str(tmp_path / name))
+
+    np.testing.assert_array_equal(points, [[1, 2], [-3, 4]])
+    assert positions == ["top-left", "bottom-right"]
+
+
+def test_label_file_writer_checks_the_number_of_labels(tmp_path):
+    label = {"point_x": 1, "point_y": 2, "position": "top-left"}
+
+    with pytest.raises(ValueError):
+        with LabelFileWriter(str(tmp_path / "labels.bin"), 2) as writer:
+            writer.write({0: label})
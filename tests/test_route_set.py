@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.benchmark import random_walk_routes
+from src.route_set import RouteSet
+
+
+def distance_to_segment(point, start, end):
+    delta = end - start
+    length = delta @ delta
+    along = 0.0 if length == 0 else np.clip((point - start) @ delta / length, 0, 1)
+    return np.linalg.norm(point - start - along * delta)
+
+
+def test_segments_of_single_points_have_zero_length():
+    routes = RouteSet.from_routes([[[0, 0], [1, 1], [2, 0]], [[5, 5]]])
+    starts, ends = routes.segments()
+
+    np.testing.assert_array_equal(starts, [[0, 0], [1, 1], [5, 5]])
+    np.testing.assert_array_equal(ends, [[1, 1], [2, 0], [5, 5]])
+    np.testing.assert_array_equal(routes.segment_offsets(), [0, 2, 3])
+
+
+def test_closest_point_indices_take_the_first_of_ties():
+    routes = RouteSet.from_routes([[[2, 0], [0, 2], [3, 3]], [[-1, 0], [5, 5]]])
+
+    np.testing.assert_array_equal(routes.closest_point_indices((0, 0)), [0, 0])
+
+
+def test_simplify_keeps_removed_points_within_tolerance():
+    routes = random_walk_routes(40, 100, step=20)
+    keep = routes.offsets[:-1] + 50
+    simplified, point_ids = routes.simplify(30, keep=keep)
+
+    assert len(simplified) == len(routes)
+    assert len(simplified.coords) < len(routes.coords)
+    np.testing.assert_array_equal(simplified.coords, routes.coords[point_ids])
+    assert set(keep) <= set(point_ids)
+    for it in range(len(routes)):
+        ids = point_ids[simplified.offsets[it] : simplified.offsets[it + 1]]
+        assert ids[0] == routes.offsets[it]
+        assert ids[-1] == routes.offsets[it + 1] - 1
+        for first, last in zip(ids[:-1], ids[1:]):
+            for point in routes.coords[first + 1 : last]:
+                assert (
+                    distance_to_segment(
+                        point, routes.coords[first], routes.coords[last]
+                    )
+                    <= 30 + 1e-9
+                )
+
+
+def test_with_route_replaces_and_appends():
+    routes = RouteSet.from_routes([[[0, 0], [1, 1]], [[2, 2]]])
+
+    replaced = routes.with_route(0, [[7, 7], [8, 8], [9, 9]])
+    appended = routes.with_route(2, [[3, 3]])
+
+    assert [r.tolist() for r in replaced] == [[[7, 7], [8, 8], [9, 9]], [[2, 2]]]
+    assert [r.tolist() for r in appended] == [[[0, 0], [1, 1]], [[2, 2]], [[3, 3]]]
+
+
+def test_points_around_alternate_after_and_before_the_point():
+    routes = RouteSet.from_routes([np.zeros((6, 2)), np.zeros((2, 2))])
+
+    assert routes.points_around(0, 4, 64).tolist() == [4, 5, 3, 2, 1, 0]
+    assert routes.points_around(0, 2, 4).tolist() == [2, 3, 1, 4]
+    assert routes.points_around(1, 0, 64).tolist() == [0, 1]
+    assert routes.points_around(0, 1).tolist() == [1, 2, 0, 3, 4, 5]
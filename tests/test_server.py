@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import numpy as np
+
+from src import route
+from src.api import label_routes
+from src.route_io import POSITIONS
+from src.server import LabelServer, label_request
+
+ROUTES = [[100, 200, 300, 400], [[500, 500], [700, 800]]]
+
+
+def test_label_request_returns_labels_per_route():
+    response = label_request({"routes": ROUTES})
+
+    expected = route.Solution([[[100, 200], [300, 400]], [[500, 500], [700, 800]]])
+    label_dict = expected.get_label_locations()
+    assert response == {
+        "labels": [
+            [
+                label_dict[it]["point_x"],
+                label_dict[it]["point_y"],
+                label_dict[it]["position"],
+            ]
+            for it in range(2)
+        ]
+    }
+
+
+def test_label_request_with_zoom_levels_and_engine():
+    response = label_request(
+        {"routes": ROUTES, "engine": "intersection", "zoom_levels": [1, 2]}
+    )
+
+    assert sorted(response["labels"]) == ["1", "2"]
+    assert all(len(labels) == 2 for labels in response["labels"].values())
+
+
+def test_label_routes_returns_arrays():
+    x, y, codes = label_routes(
+        [[[100, 200], [300, 400]], [[500, 500], [700, 800]]], engine="intersection"
+    )
+
+    assert len(x) == len(y) == len(codes) == 2
+    assert all(code < len(POSITIONS) for code in codes)
+
+
+def test_server_answers_every_line_with_its_id():
+    lines = [
+        json.dumps({"id": 1, "routes": ROUTES}) + "\n",
+        "\n",
+        "not json\n",
+        json.dumps({"id": "b", "routes": ROUTES, "engine": "unknown"}) + "\n",
+    ]
+    responses = []
+
+    async def readline():
+        return lines.pop(0) if lines else ""
+
+    async def write(text):
+        responses.append(json.loads(text))
+
+    server = LabelServer(processes=1, max_pending=2)
+    try:
+        asyncio.run(server.serve_lines(readline, write))
+    finally:
+        server.close()
+
+    by_id = {response.get("id"): response for response in responses}
+    assert len(responses) == 3
+    assert np.shape(by_id[1]["labels"]) == (2, 3)
+    assert by_id[None]["error"].startswith("JSONDecodeError")
+    assert by_id["b"]["error"].startswith("KeyError")
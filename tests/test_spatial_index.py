@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.geometry import segments_cross_rectangles
+from src.spatial_index import RectangleGrid, SegmentGrid
+
+
+def test_long_diagonal_segments_are_stored_in_the_buckets_they_cross():
+    starts = np.array([[0, 0], [0, 10000]])
+    ends = np.array([[10000, 10000], [10000, 0]])
+
+    index = SegmentGrid(starts, ends, 100, 100)
+
+    # About 2 buckets per step along the diagonal, not 100 x 100 per segment
+    assert len(index.segment_ids) <= 2 * 2 * 100
+
+
+def test_query_pairs_finds_every_crossing():
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, 1000, size=(300, 2))
+    lengths = rng.integers(-300, 300, size=300)
+    ends = starts + rng.integers(-300, 300, size=(300, 2))
+    # Horizontal and vertical segments running along bucket borders
+    starts[:100, 1] = starts[:100, 1] // 50 * 50
+    ends[:100] = starts[:100] + np.column_stack([lengths[:100], np.zeros(100)])
+    starts[100:200, 0] = starts[100:200, 0] // 50 * 50
+    ends[100:200] = starts[100:200] + np.column_stack([np.zeros(100), lengths[100:200]])
+    index = SegmentGrid(starts, ends, 50, 50)
+    lefts = rng.uniform(-100, 1000, 400)
+    tops = rng.uniform(-100, 1000, 400)
+
+    rectangle_ids, segment_ids = index.query_pairs(lefts, tops, lefts + 60, tops + 30)
+
+    crosses = segments_cross_rectangles(
+        starts[:, None], ends[:, None], lefts, tops, lefts + 60, tops + 30
+    )
+    expected = set(zip(*np.nonzero(crosses.T)))
+    assert expected <= set(zip(rectangle_ids.tolist(), segment_ids.tolist()))
+
+
+def test_rectangle_grid_overlaps_and_removes():
+    grid = RectangleGrid(100, 50)
+    first = grid.insert(0, 0)
+    grid.insert(300, 0)
+
+    assert grid.overlaps(100, 50)
+    assert not grid.overlaps(150, 0)
+    assert grid.query(-10, -10, 350, 10) == {0, 1}
+
+    grid.remove(first)
+    assert not grid.overlaps(100, 50)
@@ -0,0 +1,16 @@
+import pytest
+
+from src.check_startup import ENTRY_POINTS, startup_time
+
+# Seconds an entry point may take to start, generous for slow test machines,
+# make check runs src.check_startup with a tighter budget
+STARTUP_CEILING = 5.0
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_point_starts_fast_without_heavy_modules(module):
+    # A fresh interpreter, modules imported by other tests do not count
+    seconds, heavy_modules = startup_time(module, repeat=3)
+
+    assert heavy_modules == []
+    assert seconds < STARTUP_CEILING
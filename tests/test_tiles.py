@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from src import route, route_intersection_based
+from src.benchmark import random_walk_routes
+from src.tiles import label_in_tiles, original_routes_of_tile
+from src.validate import label_route_crossings
+from tests.test_route import assert_valid_layout
+from tests.test_route_intersection_based import label_collisions
+
+
+def label_in_tiles_recording_revisits(solution, monkeypatch):
+    revisits = []
+    repair_labels = solution.repair_labels
+
+    def recorded_repair_labels(label_dict, revisit=None):
+        revisits.append(revisit)
+        return repair_labels(label_dict, revisit)
+
+    monkeypatch.setattr(solution, "repair_labels", recorded_repair_labels)
+    label_dict, _ = label_in_tiles(solution, 3, processes=2)
+    return label_dict, revisits[0]
+
+
+def test_grid_engine_tiles_give_a_valid_layout(monkeypatch):
+    solution = route.Solution(random_walk_routes(300, 20))
+
+    label_dict, revisit = label_in_tiles_recording_revisits(solution, monkeypatch)
+
+    assert_valid_layout(solution, label_dict, range(300))
+    assert 0 < len(revisit) < 300
+
+
+def test_intersection_engine_tiles_give_a_valid_layout(monkeypatch):
+    solution = route_intersection_based.Solution(random_walk_routes(300, 20))
+
+    label_dict, revisit = label_in_tiles_recording_revisits(solution, monkeypatch)
+
+    assert sorted(label_dict) == list(range(300))
+    assert label_collisions(solution, label_dict) == (0, 0)
+    assert 0 < len(revisit) < 300
+
+
+@pytest.mark.parametrize("engine", [route.Solution, route_intersection_based.Solution])
+def test_repair_keeps_labels_that_are_not_revisited(engine):
+    solution = engine(random_walk_routes(50, 20))
+    label_dict = solution.get_label_locations()
+    # Both labels claim the place of label 0, only the revisited one moves
+    conflicting = {0: label_dict[0], 1: label_dict[0]}
+
+    repaired, num_replaced = solution.repair_labels(conflicting, revisit=[0])
+
+    assert num_replaced == 1
+    assert repaired[1] is label_dict[0]
+    assert repaired[0] != label_dict[0]
+
+
+def test_simplified_tiles_do_not_cross_their_own_route():
+    routes = random_walk_routes(100, 200, step=20)
+    solution = route_intersection_based.Solution(routes, simplify_tolerance=0.2)
+
+    label_dict, _ = label_in_tiles(solution, 2, processes=2)
+
+    lower = np.array(
+        [
+            [label_dict[it]["rect_left"], label_dict[it]["rect_top"]]
+            for it in range(100)
+        ],
+        dtype=float,
+    )
+    lower += solution.tolerance
+    label_ids, route_ids = label_route_crossings(
+        lower, lower + (solution.width, solution.height), routes
+    )
+    assert not np.any(label_ids == route_ids)
+
+
+@pytest.mark.parametrize("engine", [route.Solution, route_intersection_based.Solution])
+def test_original_routes_of_tile_point_into_the_tile_routes(engine):
+    routes = random_walk_routes(30, 50, step=20)
+    solution = engine(routes, simplify_tolerance=0.2)
+    context = [3, 17, 4]
+
+    attributes = original_routes_of_tile(solution, context)
+
+    np.testing.assert_array_equal(
+        attributes["original_routes"].coords[attributes["point_ids"]],
+        solution.routes.subset(context).coords,
+    )
@@ -0,0 +1,76 @@
+import numpy as np
+
+from src.benchmark import random_walk_routes
+from src.geometry import segments_cross_rectangles
+from src.route_io import write_label_file, write_routes_text
+from src.validate import (
+    label_route_crossings,
+    overlapping_label_pairs,
+    validate_files,
+)
+
+
+def random_boxes(num_boxes, seed=0):
+    rng = np.random.default_rng(seed)
+    lower = rng.integers(0, 2000, size=(num_boxes, 2)).astype(float)
+    return lower, lower + (100, 50)
+
+
+def test_overlapping_label_pairs_matches_comparing_all_pairs():
+    lower, upper = random_boxes(300)
+
+    first, second = overlapping_label_pairs(lower, upper)
+
+    overlap = np.all(
+        np.maximum(lower[:, None], lower) < np.minimum(upper[:, None], upper), axis=2
+    )
+    expected_first, expected_second = np.nonzero(np.triu(overlap, k=1))
+    assert sorted(zip(first.tolist(), second.tolist())) == sorted(
+        zip(expected_first.tolist(), expected_second.tolist())
+    )
+
+
+def test_label_route_crossings_matches_testing_all_segments():
+    routes = random_walk_routes(20, 30)
+    bbox = routes.bbox()
+    rng = np.random.default_rng(1)
+    lower = np.column_stack(
+        [rng.uniform(bbox[0], bbox[2], 200), rng.uniform(bbox[1], bbox[3], 200)]
+    )
+    upper = lower + (100, 50)
+
+    label_ids, route_ids = label_route_crossings(lower, upper, routes)
+
+    expected = set()
+    for it, points in enumerate(routes):
+        crosses = segments_cross_rectangles(
+            points[:-1, None],
+            points[1:, None],
+            lower[:, 0],
+            lower[:, 1],
+            upper[:, 0],
+            upper[:, 1],
+        )
+        expected |= {(label, it) for label in np.flatnonzero(crosses.any(axis=0))}
+    assert set(zip(label_ids.tolist(), route_ids.tolist())) == expected
+    assert len(label_ids) == len(expected)
+
+
+def test_validate_files_counts_collisions(tmp_path):
+    routes_path, labels_path = tmp_path / "routes.txt", tmp_path / "labels.txt"
+    write_routes_text(routes_path, np.array([[0, 0], [100, 100], [0, 100]]), [0, 2, 3])
+    # The first label covers the first route, the second one overlaps it
+    write_label_file(
+        str(labels_path),
+        {
+            0: {"point_x": 50, "point_y": 50, "position": "bottom-right"},
+            1: {"point_x": 60, "point_y": 60, "position": "bottom-right"},
+        },
+    )
+
+    metrics = validate_files(routes_path, labels_path, [1])["1"]
+
+    assert metrics["labels"] == 2
+    assert metrics["label_label_collisions"] == 1
+    assert metrics["label_route_collisions"] == 2
+    assert metrics["labels_crossing_own_route"] == 1